@@ -0,0 +1,172 @@
+"""
+Benchmarks of the data_maps functions, each against the row-wise
+implementation it replaced.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/bench_data_maps.py
+"""
+
+from datetime import date, datetime, timedelta
+import random
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from move2gnucash.data_maps import (
+    Split2Move,
+    Transaction2Move,
+    iter_mapped_transactions,
+    mapped_transactions,
+)
+from move2gnucash.utils import decimal_to
+
+ACCOUNTS = ["Assets:Checking", "Assets:Cash", "Liabilities:Credit Card", "Income:Salary"]
+CATEGORIES = ["Expenses:Groceries", "Expenses:Dining", "Expenses:Auto:Fuel", "Expenses:Travel"]
+PAYEES = ["Grocer", "Diner", "Gas Station", "Airline", "Employer", "Bookstore"]
+ENTERED = datetime(2023, 1, 1)
+
+
+def _prepared_transactions(size: int) -> pd.DataFrame:
+    """Prepared transactions, one in ten rows being part of a three row Quicken split."""
+    random.seed(size)
+    first_day = date(2017, 1, 1)
+    splits = [("S" if i % 30 < 3 else "") for i in range(size)]
+    days = [first_day + timedelta(days=i // 300) for i in range(size)]
+    return pd.DataFrame(
+        {
+            "tran_split": splits,
+            "tran_date": days,
+            "tran_description": [
+                f"{random.choice(PAYEES)} {i // 3 if split else i}"
+                for i, split in enumerate(splits)
+            ],
+            "tran_memo": random.choices(["", "Refund", "Transfer to Checking"], k=size),
+            "tran_num": [str(i) for i in range(size)],
+            "tran_amount": [random.randint(-50000, 50000) for _ in range(size)],  # In cents
+            "tran_acct_from": random.choices(ACCOUNTS, k=size),
+            "tran_acct_to": random.choices(CATEGORIES, k=size),
+        }
+    )
+
+
+def _row_wise_mapped_transactions(transactions: pd.DataFrame) -> list[Transaction2Move]:
+    """The groupby().apply() and apply(axis=1) that mapped_transactions replaced."""
+
+    def split2move_list(split):
+        return [
+            Split2Move(
+                split["tran_acct_from"],
+                decimal_to(split["tran_amount"] / 100) * -1,
+                split.tran_memo,
+            ),
+            Split2Move(
+                split["tran_acct_to"], decimal_to(split["tran_amount"] / 100) * 1, split.tran_memo
+            ),
+        ]
+
+    def transaction2move(posted, description, notes, num, splits):
+        return Transaction2Move(posted, ENTERED, "USD", description, notes, num, splits)
+
+    def build_multi_splits_tran(split_group: pd.DataFrame):
+        splits = split_group.apply(split2move_list, axis=1)
+        return transaction2move(
+            split_group["tran_date"].iat[0],
+            split_group.tran_description.iat[0],
+            split_group.tran_memo.iat[0],
+            split_group.tran_num.iat[0],
+            [elem for item in splits for elem in item],
+        )
+
+    def build_single_splits_tran(split_data: pd.Series):
+        return transaction2move(
+            split_data.tran_date,
+            split_data["tran_description"],
+            split_data["tran_memo"],
+            split_data["tran_num"],
+            split2move_list(split_data),
+        )
+
+    splits_mask = transactions["tran_split"] == "S"
+    multi_splits_data = transactions[splits_mask]
+    single_splits_data = transactions[~splits_mask]
+    return (
+        multi_splits_data.groupby(["tran_date", "tran_description"], sort=False)
+        .apply(build_multi_splits_tran)
+        .to_list()
+        + single_splits_data.apply(build_single_splits_tran, axis=1).to_list()
+    )
+
+
+def bench_mapped_transactions(sizes=(10_000, 100_000, 1_000_000)) -> None:
+    """Times the mapping of prepared transactions for several file sizes."""
+    for size in sizes:
+        transactions = _prepared_transactions(size)
+        assert _row_wise_mapped_transactions(transactions) == list(
+            mapped_transactions(transactions, ENTERED)
+        )
+        row_wise = min(
+            timeit.repeat(lambda: _row_wise_mapped_transactions(transactions), number=1, repeat=1)
+        )
+        vectorized = min(
+            timeit.repeat(
+                lambda: list(mapped_transactions(transactions, ENTERED)), number=1, repeat=3
+            )
+        )
+        print(
+            f"mapped transactions, {size:>7} rows: row-wise {row_wise:.3f}s, "
+            f"vectorized {vectorized:.3f}s ({row_wise / vectorized:.1f}x)"
+        )
+
+
+def bench_transaction_memory(size=100_000) -> None:
+    """Measures the memory per transaction held by a TransactionBatch (its arrays), and by
+    a list of the Transaction2Move objects it provides. Both share the same strings, dates
+    and Decimals.
+    """
+    batch = mapped_transactions(_prepared_transactions(size), ENTERED)
+    batch_bytes = sum(
+        column.nbytes for column in vars(batch).values() if isinstance(column, np.ndarray)
+    )
+    tracemalloc.start()
+    transactions = list(batch)
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(
+        f"memory per transaction, {len(transactions)} transactions: "
+        f"list {list_bytes / len(batch):.0f}B, batch {batch_bytes / len(batch):.0f}B "
+        f"({list_bytes / batch_bytes:.1f}x)"
+    )
+
+
+def _peak_allocated(consume) -> int:
+    """Provides the peak bytes allocated while running consume."""
+    tracemalloc.start()
+    consume()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_streamed_memory(size=200_000) -> None:
+    """Measures the peak memory of adding mapped transactions to a (null) book, from the
+    whole list and from iter_mapped_transactions.
+    """
+    transactions = _prepared_transactions(size)
+
+    def add_all(transactions_list) -> None:
+        for _ in transactions_list:
+            pass
+
+    whole = _peak_allocated(lambda: add_all(list(mapped_transactions(transactions, ENTERED))))
+    streamed = _peak_allocated(lambda: add_all(iter_mapped_transactions(transactions, ENTERED)))
+    print(
+        f"peak memory of adding, {size} rows: list {whole / 2**20:.1f}MiB, "
+        f"streamed {streamed / 2**20:.1f}MiB ({whole / streamed:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    bench_mapped_transactions()
+    bench_transaction_memory()
+    bench_streamed_memory()
@@ -0,0 +1,137 @@
+"""
+Benchmarks of the data_preparation functions, each against the row-wise
+implementation it replaced.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/bench_data_preparation.py
+"""
+
+from datetime import datetime
+import random
+import timeit
+
+import pandas as pd
+
+from move2gnucash.data_preparation import (
+    TYPE_KEYWORDS,
+    TYPE_OF_KEYWORD,
+    _add_account_types_of,
+    _combined_memo_tags,
+)
+from move2gnucash.utils import DATE_FORMAT, combined_strings_by, dates_parsed
+
+ACCOUNT_WORDS = ["Assets", "Liabilities", "Income", "Expenses", "Cash", "Checking", "Brokerage"]
+OTHER_WORDS = ["Joint", "Family", "Travel", "Other", "Fund", "Credit Card", "Dining", "Auto"]
+MEMOS = ["", "", "Transfer to Checking", "Refund"]
+TAGS = ["", "groceries", "college, john, rent"]
+
+
+def _chart_of_accounts(size: int) -> pd.DataFrame:
+    random.seed(size)
+    paths = [
+        ":".join(
+            [random.choice(ACCOUNT_WORDS)]
+            + random.sample(OTHER_WORDS + ACCOUNT_WORDS, random.randint(0, 3))
+        )
+        for _ in range(size)
+    ]
+    return pd.DataFrame(
+        {"path_and_name": paths, "placeholder": [random.random() < 0.3 for _ in paths]}
+    )
+
+
+def _row_wise_account_types_of(accounts: pd.DataFrame) -> None:
+    """The list comprehension and apply(axis=1) that _add_account_types_of replaced."""
+
+    def chosen_type(acct: pd.Series) -> str:
+        candidate_types, placeholder = acct
+        num_candidates = len(candidate_types)
+        acct_choice_index = num_candidates - 1 if num_candidates > 0 else 0
+        placeholder_choice_index = num_candidates - 2 if num_candidates > 1 else 0
+        return (
+            candidate_types[0]
+            if candidate_types[0] in ["INCOME", "EXPENSE", "OTHER"]
+            else (
+                candidate_types[placeholder_choice_index]
+                if placeholder is True
+                else candidate_types[acct_choice_index]
+            )
+        )
+
+    accounts["upper_path_name"] = accounts.path_and_name.str.upper()
+    accounts["candidate_types"] = [
+        [TYPE_OF_KEYWORD[y] for y in x] for x in accounts.upper_path_name.str.findall(TYPE_KEYWORDS)
+    ]
+    accounts["selected_type"] = accounts[["candidate_types", "placeholder"]].apply(
+        chosen_type, axis=1
+    )
+
+
+def _transactions(size: int) -> pd.DataFrame:
+    random.seed(size)
+    return pd.DataFrame(
+        {
+            "date": [
+                f"{random.randint(1, 12)}/{random.randint(1, 28)}/{random.randint(2015, 2023)}"
+                for _ in range(size)
+            ],
+            "tran_amount": [round(random.uniform(-500, 500), 2) for _ in range(size)],
+            "memo_notes": random.choices(MEMOS, k=size),
+            "tags": random.choices(TAGS, k=size),
+        }
+    )
+
+
+def _row_wise_dates_amounts_memos(transactions: pd.DataFrame) -> list[pd.Series]:
+    """The per-row apply() and agg() calls that staged_transactions replaced."""
+
+    def combined_memo_tags(_: pd.Series) -> str:
+        memo_notes, tags = _
+        return combined_strings_by(memo_notes, tags, ";")
+
+    return [
+        transactions.date.apply(lambda d: datetime.strptime(d, DATE_FORMAT).date()),
+        transactions.tran_amount.apply(lambda x: x * -1),
+        transactions[["memo_notes", "tags"]].agg(combined_memo_tags, axis=1),
+    ]
+
+
+def _vectorized_dates_amounts_memos(transactions: pd.DataFrame) -> list[pd.Series]:
+    """The same steps as done by staged_transactions."""
+    return [
+        dates_parsed(transactions.date).dt.date,
+        -transactions.tran_amount,
+        _combined_memo_tags(transactions.memo_notes, transactions.tags),
+    ]
+
+
+def bench_account_types(sizes=(1_000, 10_000, 100_000)) -> None:
+    """Times the choice of account types for charts of accounts of several sizes."""
+    for size in sizes:
+        accounts = _chart_of_accounts(size)
+        row_wise = min(timeit.repeat(lambda: _row_wise_account_types_of(accounts), number=1))
+        vectorized = min(timeit.repeat(lambda: _add_account_types_of(accounts), number=1))
+        print(
+            f"account types, {size:>7} accounts: row-wise {row_wise:.3f}s, "
+            f"vectorized {vectorized:.3f}s ({row_wise / vectorized:.1f}x)"
+        )
+
+
+def bench_dates_amounts_memos(sizes=(10_000, 100_000, 1_000_000)) -> None:
+    """Times the date, amount and memo preparation of transactions for several file sizes."""
+    for size in sizes:
+        transactions = _transactions(size)
+        row_wise = min(
+            timeit.repeat(lambda: _row_wise_dates_amounts_memos(transactions), number=1, repeat=3)
+        )
+        vectorized = min(
+            timeit.repeat(lambda: _vectorized_dates_amounts_memos(transactions), number=1, repeat=3)
+        )
+        print(
+            f"dates, amounts and memos, {size:>7} transactions: row-wise {row_wise:.3f}s, "
+            f"vectorized {vectorized:.3f}s ({row_wise / vectorized:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    bench_account_types()
+    bench_dates_amounts_memos()
@@ -0,0 +1,226 @@
+"""
+Benchmarks of the file_operations functions writing to a GnuCash book, each against
+the implementation it replaced.
+
+Run from the repository root: PYTHONPATH=src python benchmarks/bench_file_operations.py
+"""
+
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import random
+from tempfile import TemporaryDirectory
+import timeit
+import typing
+
+import pandas as pd
+from piecash import Account, Book, Split, Transaction, create_book, open_book
+
+from move2gnucash.account_registry import AccountRegistry
+from move2gnucash.data_maps import (
+    Account2Move,
+    Transaction2Move,
+    TransactionBatch,
+    fields_of,
+    mapped_transactions,
+)
+from move2gnucash.file_operations import add_transactions, bulk_add_transactions, create_accounts
+
+ACCOUNTS = ["Assets:Checking", "Assets:Cash", "Liabilities:Credit Card", "Income:Salary"]
+CATEGORIES = ["Expenses:Groceries", "Expenses:Dining", "Expenses:Auto", "Expenses:Travel"]
+ENTERED = datetime(2023, 1, 1)
+
+
+def _book_with_accounts(file_name: str) -> Book:
+    book = create_book(file_name, currency="USD")
+    create_accounts(
+        book,
+        [
+            Account2Move(name, acct_type, "root", "USD", True, "")
+            for name, acct_type in [
+                ("Assets", "ASSET"),
+                ("Liabilities", "LIABILITY"),
+                ("Income", "INCOME"),
+                ("Expenses", "EXPENSE"),
+            ]
+        ]
+        + [
+            Account2Move(name, acct_type, parent, "USD", False, "")
+            for (parent, name), acct_type in zip(
+                (fullname.split(":") for fullname in ACCOUNTS + CATEGORIES),
+                ["BANK", "CASH", "CREDIT", "INCOME"] + ["EXPENSE"] * 4,
+            )
+        ],
+    )
+    return book
+
+
+def _mapped_transactions(size: int) -> TransactionBatch:
+    random.seed(size)
+    first_day = date(2017, 1, 1)
+    prepared = pd.DataFrame(
+        {
+            "tran_split": "",
+            "tran_date": [first_day + timedelta(days=i // 30) for i in range(size)],
+            "tran_description": [f"Payee {i}" for i in range(size)],
+            "tran_memo": random.choices(["", "Refund"], k=size),
+            "tran_num": [str(i) for i in range(size)],
+            "tran_amount": [random.randint(-50000, 50000) for _ in range(size)],  # In cents
+            "tran_acct_from": random.choices(ACCOUNTS, k=size),
+            "tran_acct_to": random.choices(CATEGORIES, k=size),
+        }
+    )
+    return mapped_transactions(prepared, ENTERED)
+
+
+def _flushed_each(book: Book, transactions_list: typing.Iterable[Transaction2Move]) -> None:
+    """The flush after every transaction that add_transactions replaced."""
+    usd = book.commodities(mnemonic="USD")
+    for trans in transactions_list:
+        splits = [
+            Split(book.accounts(fullname=split.account), split.value, memo=split.memo)
+            for split in trans.splits
+        ]
+        Transaction(**(fields_of(trans) | {"currency": usd, "splits": splits}))
+        book.flush()
+    book.save()
+
+
+def _seconds_adding(add, file_name: str, size: int) -> float:
+    """Times add adding size transactions to a new book file with a chart of accounts."""
+    book = _book_with_accounts(file_name)
+    transactions = _mapped_transactions(size)
+    elapsed = min(timeit.repeat(lambda: add(book, transactions), number=1, repeat=1))
+    assert len(book.transactions) == size
+    book.close()
+    return elapsed
+
+
+def _balances(file_name: str) -> typing.Dict[str, Decimal]:
+    with open_book(file_name, readonly=True, open_if_lock=True) as book:
+        return {acct.fullname: acct.get_balance() for acct in book.accounts}
+
+
+def bench_add_transactions(size=5_000, batch_sizes=(1, 10, 100, 1_000, None)) -> None:
+    """Times adding transactions to a book file, flushing each and committing them in batches
+    of several sizes (None adapting to the commit time).
+    """
+    with TemporaryDirectory() as directory:
+        flushed_each = _seconds_adding(_flushed_each, f"{directory}/flushed_each.gnucash", size)
+        print(f"add transactions, {size} flushed each: {size / flushed_each:.0f}/s")
+        for batch_size in batch_sizes:
+            batched = _seconds_adding(
+                lambda book, transactions: add_transactions(book, transactions, batch_size),
+                f"{directory}/batch_{batch_size}.gnucash",
+                size,
+            )
+            print(
+                f"add transactions, {size} in batches of {batch_size or 'adaptive size'}: "
+                f"{size / batched:.0f}/s ({flushed_each / batched:.1f}x)"
+            )
+
+
+def bench_bulk_add_transactions(sizes=(5_000, 20_000)) -> None:
+    """Times adding transactions to a book file through piecash objects and in bulk, checking
+    that both books have the same balances.
+    """
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+            objects_file = f"{directory}/objects_{size}.gnucash"
+            bulk_file = f"{directory}/bulk_{size}.gnucash"
+            objects = _seconds_adding(add_transactions, objects_file, size)
+            bulk = _seconds_adding(bulk_add_transactions, bulk_file, size)
+            assert _balances(objects_file) == _balances(bulk_file)
+            print(
+                f"add transactions, {size}: objects {size / objects:.0f}/s, "
+                f"bulk {size / bulk:.0f}/s ({objects / bulk:.1f}x)"
+            )
+
+
+def _chart_of_accounts(size: int) -> list[Account2Move]:
+    """Accounts four levels deep: a placeholder group per 1000 accounts, and category per 100."""
+    accounts = [Account2Move("Expenses", "EXPENSE", "root", "USD", True, "")]
+    for i in range(size):
+        group = f"Group {i // 1000}"
+        category = f"Category {i // 100}"
+        if i % 1000 == 0:
+            accounts.append(Account2Move(group, "EXPENSE", "Expenses", "USD", True, ""))
+        if i % 100 == 0:
+            accounts.append(Account2Move(category, "EXPENSE", f"Expenses:{group}", "USD", True, ""))
+        accounts.append(
+            Account2Move(f"Item {i}", "EXPENSE", f"Expenses:{group}:{category}", "USD", False, "")
+        )
+    return accounts
+
+
+def _created_each(book: Book, accounts_list: list[Account2Move]) -> None:
+    """The parent query and flush for every account that create_accounts replaced."""
+    usd = book.commodities(mnemonic="USD")
+    for acct in accounts_list:
+        acct.parent = (
+            book.accounts(fullname=acct.parent) if acct.parent != "root" else book.root_account
+        )
+        acct.commodity = usd
+        Account(**fields_of(acct))
+        book.flush()
+    book.save()
+
+
+def bench_create_accounts(sizes=(1_000, 5_000, 20_000), created_each_sizes=(1_000, 5_000)) -> None:
+    """Times creating charts of accounts in book files, each account after its parent and
+    flushed, and by create_accounts from the chart shuffled.
+    """
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+
+            def seconds(create, accounts_list: list[Account2Move], name: str) -> float:
+                book = create_book(f"{directory}/{name}_{size}.gnucash", currency="USD")
+                elapsed = min(
+                    timeit.repeat(lambda: create(book, accounts_list), number=1, repeat=1)
+                )
+                assert len(book.accounts) == len(accounts_list)
+                book.close()
+                return elapsed
+
+            shuffled = _chart_of_accounts(size)
+            random.shuffle(shuffled)
+            by_level = seconds(create_accounts, shuffled, "by_level")
+            if size not in created_each_sizes:
+                print(f"create accounts, {len(shuffled)} accounts: by level {by_level:.2f}s")
+                continue
+            created_each = seconds(_created_each, _chart_of_accounts(size), "created_each")
+            print(
+                f"create accounts, {len(shuffled)} accounts: each {created_each:.2f}s, "
+                f"by level {by_level:.2f}s ({created_each / by_level:.1f}x)"
+            )
+
+
+def bench_account_registry(sizes=(1_000, 10_000)) -> None:
+    """Times reading the full names of the accounts of a book file, from book.accounts and
+    into an AccountRegistry.
+    """
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+            file_name = f"{directory}/accounts_{size}.gnucash"
+            book = create_book(file_name, currency="USD")
+            create_accounts(book, _chart_of_accounts(size))
+            book.close()
+
+            def read(names_of) -> float:
+                with open_book(file_name, readonly=True, open_if_lock=True) as book:
+                    return min(timeit.repeat(lambda: names_of(book), number=1, repeat=1))
+
+            accounts = read(
+                lambda book: [acct.fullname for acct in book.accounts if not acct.placeholder]
+            )
+            registry = read(lambda book: AccountRegistry(book).fullnames(placeholders=False))
+            print(
+                f"account full names, {size} accounts: book.accounts {accounts:.3f}s, "
+                f"registry {registry:.3f}s ({accounts / registry:.1f}x)"
+            )
+
+
+if __name__ == "__main__":
+    bench_add_transactions()
+    bench_bulk_add_transactions()
+    bench_create_accounts()
+    bench_account_registry()
@@ -4,7 +4,11 @@ from unicodedata import category
 
 from piecash import Book, create_book, GnucashException, open_book
 
+from move2gnucash.data_preparation import Resolutions
+from move2gnucash.field_mappings import use_field_mappings_file
+from move2gnucash.file_operations import expanded_input_files, fetch_resolutions
 from move2gnucash.migrations import *
+from move2gnucash.stage_cache import DEFAULT_CACHE_DIR, StageCache
 
 
 class CapitalizedHelpFormatter(argparse.HelpFormatter):
@@ -29,7 +33,8 @@ parser.add_argument(
 )
 
 parser.add_argument(
-    "input_file", help="The csv file containing the input data. Typical extension: '.csv'."
+    "input_file",
+    help="The csv file containing the input data. Typical extension: '.csv'. CATS and IE also accept a directory, a glob pattern or a manifest (.txt) listing csv files.",
 )
 parser.add_argument(
     "output_file",
@@ -43,6 +48,58 @@ parser.add_argument(
 parser.add_argument(
     "-d", "--dry-run", help="Executes without writing a GnuCash file.", action="store_true"
 )
+parser.add_argument(
+    "-c",
+    "--chunk-size",
+    type=int,
+    help="IE only. Read, prepare and commit transactions in chunks of this many rows.",
+)
+parser.add_argument(
+    "-e",
+    "--engine",
+    choices=["c", "pyarrow"],
+    help="IE only. The csv parser to use; pyarrow must be installed separately.",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="IE only. Number of processes reading several input files (default: one per core).",
+)
+parser.add_argument(
+    "--bulk",
+    action="store_true",
+    help="IE only. Insert transactions straight into the book's tables, much faster. Investment transactions are added as usual.",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="IE only. Go on with an import that stopped, after the rows of each file already committed to the book.",
+)
+parser.add_argument(
+    "--cache",
+    nargs="?",
+    const=DEFAULT_CACHE_DIR,
+    metavar="DIR",
+    help=f"Reuse unchanged data from earlier runs, cached in DIR (default: {DEFAULT_CACHE_DIR}). IE only uses it for a single input file, read without --chunk-size.",
+)
+parser.add_argument(
+    "-m",
+    "--field-mappings",
+    metavar="FILE",
+    help="Your own copy of field_mappings.ini, naming the columns of your csv files.",
+)
+parser.add_argument(
+    "-r",
+    "--resolutions",
+    metavar="FILE",
+    help="IE only. A csv file of the accounts chosen for ambiguous account names, used instead of asking.",
+)
+parser.add_argument(
+    "--collect",
+    action="store_true",
+    help="IE only. Instead of importing, add the ambiguous account names to the --resolutions file for review.",
+)
 parser.add_argument(
     "-h",
     "--help",
@@ -51,8 +108,6 @@ parser.add_argument(
     help="Show this help message and exit.",
 )
 
-args = parser.parse_args()
-
 
 def create_memory_book() -> Book:
     return create_book(currency="USD")
@@ -79,18 +134,59 @@ def get_book(book_name: str, dry_run: bool) -> Book:
     return book_instance
 
 
-book = get_book(args.output_file, args.dry_run)
-
-match args.action:
-    case "ACCTS":
-        opening_balances(args.input_file, book)
-        print("Accounts and opening balances imported.")
-    case "CATS":
-        category_accounts(args.input_file, book)
-        print("Categories imported as accounts.")
-    case "IE":
-        transactions(args.input_file, book)
-    case _:
-        print("Something weird occurred.")
-
-book.close()
+if __name__ == "__main__":  # Worker processes may import this module
+    args = parser.parse_args()
+    if args.field_mappings:
+        use_field_mappings_file(args.field_mappings)
+    input_files = expanded_input_files(args.input_file)
+    if args.action == "ACCTS" and len(input_files) > 1:
+        parser.error("ACCTS takes a single balances file.")
+    if args.collect and not args.resolutions:
+        parser.error("--collect needs the --resolutions file to write.")
+    if args.cache and args.action == "IE" and len(input_files) > 1:
+        parser.error("IE can't use --cache with several input files.")
+
+    book = get_book(args.output_file, args.dry_run)
+    cache = StageCache(args.cache) if args.cache else None
+
+    match args.action:
+        case "ACCTS":
+            opening_balances(input_files[0], book, cache=cache)
+            print("Accounts and opening balances imported.")
+        case "CATS":
+            for input_file in input_files:
+                category_accounts(input_file, book, cache=cache)
+            print("Categories imported as accounts.")
+        case "IE" if args.collect:
+            pending = ambiguous_accounts(input_files, book, args.resolutions, engine=args.engine)
+            print(
+                f"{len(pending)} ambiguous or missing account names to choose in {args.resolutions}."
+            )
+        case "IE":
+            resolutions = fetch_resolutions(args.resolutions) if args.resolutions else Resolutions()
+            if len(input_files) > 1 and args.chunk_size is None:
+                transactions_from_files(
+                    input_files,
+                    book,
+                    workers=args.workers,
+                    engine=args.engine,
+                    resolutions=resolutions,
+                    bulk=args.bulk,
+                    resume=args.resume,
+                )
+            else:
+                for input_file in input_files:
+                    transactions(
+                        input_file,
+                        book,
+                        chunk_size=args.chunk_size,
+                        engine=args.engine,
+                        cache=cache,
+                        resolutions=resolutions,
+                        bulk=args.bulk,
+                        resume=args.resume,
+                    )
+        case _:
+            print("Something weird occurred.")
+
+    book.close()
@@ -0,0 +1,156 @@
+"""
+Contains the registry of the accounts of a GnuCash book, read with a single
+query and shared by the preparation and writing of the data moved to it.
+"""
+from dataclasses import dataclass
+from typing import Dict
+
+from piecash import Account, Book
+from sqlalchemy import event, select
+
+from move2gnucash.utils import string_trimmed_before
+
+REGISTRY_KEY = "move2gnucash_account_registry"  # Of the registry in its book's session info
+
+
+@dataclass(slots=True)
+class RegisteredAccount:
+    """Class to keep track of an account of the book, and its piecash Account once looked up."""
+
+    guid: str | None  # None for an account created but not flushed yet
+    fullname: str
+    name: str
+    type: str
+    placeholder: bool
+    account: Account | None = None
+
+
+class AccountRegistry:
+    """Class of the accounts of a book by full name, and by name (the first of each name),
+    read with a single query of the whole account tree.
+
+    It stays current as accounts are added to the book: those created by create_accounts
+    are registered as they're created, and any other once flushed.
+    """
+
+    def __init__(self, book: Book):
+        book.flush()
+        self.session = book.session
+        self.by_fullname: Dict[str, RegisteredAccount] = {}
+        self.by_name: Dict[str, RegisteredAccount] = {}
+
+        accounts = Account.__table__.c
+        rows = self.session.execute(
+            select(
+                [
+                    accounts.guid,
+                    accounts.parent_guid,
+                    accounts.name,
+                    accounts.account_type,
+                    accounts.placeholder,
+                ]
+            )
+        ).fetchall()
+        parents = {guid: (parent_guid, name) for guid, parent_guid, name, _, _ in rows}
+        fullnames: Dict[str, str] = {}
+
+        def fullname_of(guid: str) -> str:
+            if guid not in fullnames:
+                parent_guid, name = parents[guid]
+                if parent_guid is None:  # A root account
+                    fullnames[guid] = ""
+                else:
+                    parent_fullname = fullname_of(parent_guid)
+                    fullnames[guid] = f"{parent_fullname}:{name}" if parent_fullname else name
+            return fullnames[guid]
+
+        for guid, parent_guid, name, acct_type, placeholder in rows:
+            if parent_guid is not None:
+                self._register(
+                    RegisteredAccount(guid, fullname_of(guid), name, acct_type, bool(placeholder))
+                )
+
+        event.listen(self.session, "after_flush", self._flushed)
+
+    def close(self) -> None:
+        """Stops keeping the registry current with the book, once it's not its registry anymore."""
+        if event.contains(self.session, "after_flush", self._flushed):
+            event.remove(self.session, "after_flush", self._flushed)
+
+    def _register(self, registered: RegisteredAccount) -> None:
+        self.by_fullname[registered.fullname] = registered
+        self.by_name.setdefault(registered.name, registered)
+
+    def _flushed(self, session, _flush_context) -> None:
+        """Registers the accounts added to the book other than by add, and forgets deleted ones."""
+        for obj in session.new:
+            if isinstance(obj, Account) and obj.parent is not None:
+                if obj.fullname not in self.by_fullname:
+                    self.add(obj)
+        for obj in session.deleted:
+            if isinstance(obj, Account):
+                registered = self.by_fullname.pop(obj.fullname, None)
+                if registered is not None and self.by_name.get(registered.name) is registered:
+                    del self.by_name[registered.name]
+
+    def add(self, acct: Account, fullname: str | None = None) -> None:
+        """Registers an account created in the book, flushed or not. Its full name, if not
+        given, is that of its parents.
+        """
+        fullname = acct.fullname if fullname is None else fullname
+        self._register(
+            RegisteredAccount(
+                acct.guid, fullname, acct.name, acct.type, bool(acct.placeholder), acct
+            )
+        )
+
+    def __contains__(self, fullname: str) -> bool:
+        return fullname in self.by_fullname
+
+    def __len__(self) -> int:
+        return len(self.by_fullname)
+
+    def fullnames(self, placeholders: bool = True) -> list[str]:
+        """Provides the full names of the accounts, without the placeholders if not placeholders."""
+        return [
+            fullname
+            for fullname, registered in self.by_fullname.items()
+            if placeholders or not registered.placeholder
+        ]
+
+    def _account_of(self, registered: RegisteredAccount) -> Account:
+        if registered.account is None:
+            registered.account = self.session.query(Account).get(registered.guid)
+        return registered.account
+
+    def account(self, fullname: str) -> Account:
+        """Provides the piecash Account of a full name. Raises KeyError if there's none."""
+        return self._account_of(self.by_fullname[fullname])
+
+    def registered_as(self, name: str) -> RegisteredAccount | None:
+        """Provides the account of a full name or else, without its hierarchy, of a name."""
+        return self.by_fullname.get(name) or self.by_name.get(string_trimmed_before(name, ":"))
+
+    def account_named(self, name: str) -> Account:
+        """Provides the piecash Account of a full name or else, without its hierarchy, of a name.
+        Raises ValueError if there's none.
+        """
+        registered = self.registered_as(name)
+        if registered is None:
+            raise ValueError(f"Failure. Missing account for {name}")
+        return self._account_of(registered)
+
+
+def account_registry(book: Book) -> AccountRegistry:
+    """Function to provide the AccountRegistry of a book, read on first use and then shared."""
+    info = book.session.info
+    if REGISTRY_KEY not in info:
+        info[REGISTRY_KEY] = AccountRegistry(book)
+    return info[REGISTRY_KEY]
+
+
+def forget_account_registry(book: Book) -> None:
+    """Function to drop the AccountRegistry of a book, if any, to be read again on next use."""
+    registry = book.session.info.pop(REGISTRY_KEY, None)
+    if registry is not None:
+        registry.close()
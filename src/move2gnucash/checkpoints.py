@@ -0,0 +1,88 @@
+"""
+Contains the checkpoints of transaction imports: everything a checkpoint writes to the
+book is committed at once, with how many rows of its csv file are committed so far, so
+an import that stopped can resume right after its last checkpoint.
+
+The progress is kept in the book itself, in a slot of the book keyed by the hash of
+each file's content, and so is committed along with the transactions it counts.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+from piecash import Book
+
+from move2gnucash.account_registry import forget_account_registry
+from move2gnucash.fitids import FITIDS_KEY
+
+PROGRESS_SLOT = "move2gnucash-progress"  # Slot of the book with the progress of each file
+CHECKPOINT_KEY = "move2gnucash_checkpoint"  # In its book's session info inside a checkpoint
+
+
+@dataclass
+class Progress:
+    """Class of how far the import of a csv file got: its rows committed, and whether all.
+
+    skipped counts the rows committed without being imported, e.g. investment actions not
+    imported yet, so a later import can pick them up; actions is a key of the investment
+    actions that were imported, to tell whether a later import would import more of them.
+    """
+
+    rows: int = 0
+    complete: bool = False
+    skipped: int = 0
+    actions: str = ""
+
+
+def save(book: Book) -> None:
+    """Function to commit the book, or inside a checkpoint only flush it, the checkpoint
+    committing it at its end.
+    """
+    if CHECKPOINT_KEY in book.session.info:
+        book.flush()
+    else:
+        book.save()
+
+
+def progress_of(book: Book, content_key: str) -> Progress:
+    """Function to provide the progress recorded in the book of a file, by content key."""
+    if PROGRESS_SLOT not in book or content_key not in book[PROGRESS_SLOT]:
+        return Progress()
+    recorded = book[PROGRESS_SLOT][content_key].value
+    return Progress(
+        recorded["rows"],
+        bool(recorded["complete"]),
+        recorded.get("skipped", 0),
+        recorded.get("actions", ""),
+    )
+
+
+@contextmanager
+def checkpoint(book: Book, content_key: str, file_name: str, progress: Progress) -> Iterator:
+    """Context manager committing everything written to the book inside it (by functions
+    saving with save) at once, with the progress reached by the file, when it exits.
+
+    If anything fails inside, the book is rolled back to the last checkpoint (and its
+    account registry and FITIDs read again when next used).
+    """
+    book.session.info[CHECKPOINT_KEY] = True
+    try:
+        yield
+    except BaseException:
+        book.cancel()
+        forget_account_registry(book)
+        book.session.info.pop(FITIDS_KEY, None)
+        raise
+    finally:
+        del book.session.info[CHECKPOINT_KEY]
+
+    if PROGRESS_SLOT not in book:
+        book[PROGRESS_SLOT] = {}
+    book[PROGRESS_SLOT][content_key] = {
+        "file": file_name,
+        "rows": progress.rows,
+        "complete": int(progress.complete),
+        "skipped": progress.skipped,
+        "actions": progress.actions,
+    }
+    book.save()
@@ -3,17 +3,25 @@ Contains the classes and functions to map prepared data
 (from the csv) in Pandas DataFrame to object classes for 
 writing to a GnuCash file.
 """
-from dataclasses import dataclass
-from datetime import datetime
+from dataclasses import dataclass, fields
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice, repeat
+from typing import Any, Dict, Iterable, Iterator
 
+import numpy as np
 import pandas as pd
 from piecash.core.account import Account
 from piecash.core.commodity import Commodity
 
-from move2gnucash.utils import decimal_to, get_now
+from move2gnucash.utils import decimal_to, decimals_from_cents, decimals_of, get_now
 
+SECURITIES_NAMESPACE = "Stocks"
+SHARE_FRACTION = 10000
+FEES_ACCOUNT = "Expenses:Commissions"
 
-@dataclass
+
+@dataclass(slots=True)
 class Account2Move:
     """Class to keep track of accounts and categories being moved to GnuCash."""
 
@@ -25,16 +33,37 @@ class Account2Move:
     description: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Split2Move:
     """Class to keep track of splits to be moved."""
 
     account: str  # This should be full path and name
     value: str
     memo: str
+    quantity: Decimal | None = None  # In the account's commodity, if not the currency
 
 
-@dataclass
+@dataclass(slots=True)
+class Commodity2Move:
+    """Class to keep track of securities (non currency commodities) to be moved."""
+
+    mnemonic: str  # The ticker symbol
+    fullname: str
+    namespace: str
+    fraction: int  # Smallest fraction of a share held
+
+
+@dataclass(slots=True)
+class Price2Move:
+    """Class to keep track of security prices to be moved."""
+
+    commodity: str
+    currency: str
+    date: date
+    value: Decimal
+
+
+@dataclass(slots=True)
 class Transaction2Move:
     """Class to keep track of transactions to be moved."""
 
@@ -47,93 +76,259 @@ class Transaction2Move:
     splits: list[Split2Move]
 
 
-def _split2move_list(split):
-    return [
-        Split2Move(
-            split["tran_acct_from"],
-            decimal_to(split["tran_amount"]) * -1,
-            split.tran_memo,
-        ),
-        Split2Move(
-            split["tran_acct_to"],
-            decimal_to(split["tran_amount"]) * 1,
-            split.tran_memo,
-        ),
-    ]
+def fields_of(moved) -> Dict[str, Any]:
+    """Function to provide the fields of a ...2Move object as keyword arguments, for the
+    piecash class it maps to.
+    """
+    return {field.name: getattr(moved, field.name) for field in fields(moved)}
 
 
-def _transaction2move(
-    posted: datetime, description: str, notes: str, num: str, splits
-) -> Transaction2Move:
-    return Transaction2Move(
-        post_date=posted,
-        enter_date=get_now(),
-        currency="USD",  # TODO: At some point, this needs to work with other currencies
-        description=description,
-        notes=notes,
-        num=num,
-        splits=splits,
-    )
+@dataclass
+class TransactionBatch:
+    """Class to keep a batch of transactions to be moved as columns, their splits as flat
+    columns too: the splits of transaction i are those from split_start[i] up to
+    split_start[i + 1].
 
+    Split values are kept in integer cents. Iterating (or indexing) provides
+    Transaction2Move views, built as needed, their values made Decimals only then.
 
-def _build_multi_splits_tran(split_group: pd.DataFrame):
-    splits = split_group.apply(_split2move_list, axis=1)
-    splits_list = [elem for item in splits for elem in item]
+    The splits of accounts in a commodity other than the currency (shares) have their
+    quantity in split_quantity, as Decimals, None for the others. Without split_quantity,
+    all splits are in the currency.
+    """
 
-    return _transaction2move(
-        posted=split_group["tran_date"].iat[0],
-        description=split_group.tran_description.iat[0],
-        notes=split_group.tran_memo.iat[0],
-        num=split_group.tran_num.iat[0],
-        splits=splits_list,
-    )
+    post_date: np.ndarray
+    description: np.ndarray
+    notes: np.ndarray
+    num: np.ndarray
+    split_start: np.ndarray  # One more than the transactions, the last being all splits
+    split_account: np.ndarray
+    split_value: np.ndarray  # In integer cents
+    split_memo: np.ndarray
+    enter_date: datetime
+    currency: str = "USD"  # TODO: At some point, this needs to work with other currencies
+    split_quantity: np.ndarray | None = None
+
+    def _quantities(self, start: int = 0, end: int | None = None) -> Iterable[Decimal | None]:
+        if self.split_quantity is None:
+            return repeat(None)
+        return self.split_quantity[start:end]
+
+    def __len__(self) -> int:
+        return len(self.post_date)
+
+    def __getitem__(self, i: int) -> Transaction2Move:
+        i = range(len(self))[i]  # Counting from the end when negative, IndexError if out of range
+        start, end = self.split_start[i : i + 2]
+        splits = map(
+            Split2Move,
+            self.split_account[start:end],
+            decimals_from_cents(self.split_value[start:end]),
+            self.split_memo[start:end],
+            self._quantities(start, end),
+        )
+        return Transaction2Move(
+            self.post_date[i],
+            self.enter_date,
+            self.currency,
+            self.description[i],
+            self.notes[i],
+            self.num[i],
+            list(splits),
+        )
+
+    def __iter__(self) -> Iterator[Transaction2Move]:
+        values = decimals_from_cents(self.split_value)
+        splits = map(Split2Move, self.split_account, values, self.split_memo, self._quantities())
+        split_counts = np.diff(self.split_start).tolist()
+        for posted, description, notes, num, num_splits in zip(
+            self.post_date, self.description, self.notes, self.num, split_counts
+        ):
+            yield Transaction2Move(
+                posted,
+                self.enter_date,
+                self.currency,
+                description,
+                notes,
+                num,
+                list(islice(splits, num_splits)),
+            )
 
 
-def _build_single_splits_tran(split_data: pd.Series) -> Transaction2Move:
-    splits_list = _split2move_list(split_data)
-    return _transaction2move(
-        posted=split_data.tran_date,
-        description=split_data["tran_description"],
-        notes=split_data["tran_memo"],
-        num=split_data["tran_num"],
-        splits=splits_list,
+def _transaction_ids(transactions: pd.DataFrame) -> np.ndarray:
+    """Function to number the transaction of each prepared row: the Quicken multi-split
+    groups (rows of split "S" sharing date and description) first, in order of appearance,
+    then each single split row, in order.
+    """
+    is_multi = (transactions["tran_split"] == "S").to_numpy()
+    tran_ids = np.empty(len(transactions), dtype=np.int64)
+    tran_ids[is_multi] = (
+        transactions.loc[is_multi]
+        .groupby(["tran_date", "tran_description"], sort=False)
+        .ngroup()
+        .to_numpy()
     )
+    num_multi = tran_ids[is_multi].max() + 1 if is_multi.any() else 0
+    tran_ids[~is_multi] = num_multi + np.arange(len(transactions) - is_multi.sum())
+    return tran_ids
 
 
-def _processed_transactions(transactions: pd.DataFrame):
-    """Function to map preprocessed transaction data to
-    a list of transactions staged for final processing and
-    saving to a GnuCash file.
+def _transaction_rows(transactions: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Function to order the prepared rows by transaction. Provides the row positions in
+    that order, and where each transaction's rows start among them.
     """
+    tran_ids = _transaction_ids(transactions)
+    order = np.argsort(tran_ids, kind="stable")
+    return order, np.flatnonzero(np.diff(tran_ids[order], prepend=-1))
 
-    splits_mask = transactions["tran_split"] == "S"
-    multi_splits_data = transactions[splits_mask]
-    single_splits_data = transactions[~splits_mask]
 
-    multi_split_transactions = (
-        (
-            multi_splits_data.groupby(["tran_date", "tran_description"], sort=False).apply(
-                _build_multi_splits_tran
-            )
-        ).to_list()
-        if len(multi_splits_data) > 0
-        else []
+def _batch_of(
+    transactions: pd.DataFrame, rows: np.ndarray, first_rows: np.ndarray, enter_date: datetime
+) -> TransactionBatch:
+    """Function to map the prepared rows at positions rows, ordered by transaction, with
+    each transaction starting at first_rows among them.
+    """
+
+    def column(name: str) -> np.ndarray:
+        return transactions[name].iloc[rows].to_numpy(dtype=object)
+
+    memos = column("tran_memo")
+    amounts = transactions["tran_amount"].iloc[rows].to_numpy(dtype=np.int64)  # In cents
+    return TransactionBatch(
+        post_date=column("tran_date")[first_rows],
+        description=column("tran_description")[first_rows],
+        notes=memos[first_rows],
+        num=column("tran_num")[first_rows],
+        split_start=np.append(first_rows, len(rows)) * 2,
+        split_account=np.column_stack((column("tran_acct_from"), column("tran_acct_to"))).ravel(),
+        split_value=np.column_stack((-amounts, amounts)).ravel(),
+        split_memo=np.repeat(memos, 2),
+        enter_date=enter_date,
     )
-    single_split_transactions = (
-        single_splits_data.apply(_build_single_splits_tran, axis=1).to_list()
-        if len(single_splits_data) > 0
-        else []
+
+
+def mapped_transactions(
+    prepared_transactions: pd.DataFrame, enter_date: datetime | None = None
+) -> TransactionBatch:
+    """
+    Provides a TransactionBatch of prepared transactions, all entered at enter_date
+    (by default, now). Iterating it provides the Transaction2Move objects.
+
+    Each prepared row makes two splits, moving its amount from tran_acct_from to
+    tran_acct_to. The splits are built a whole column at a time, as flat arrays ordered by
+    transaction.
+    """
+    enter_date = get_now() if enter_date is None else enter_date
+    order, first_rows = _transaction_rows(prepared_transactions)
+    return _batch_of(prepared_transactions, order, first_rows, enter_date)
+
+
+def iter_mapped_transactions(
+    prepared_transactions: pd.DataFrame,
+    enter_date: datetime | None = None,
+    batch_size: int = 10_000,
+) -> Iterator[Transaction2Move]:
+    """
+    Generates the Transaction2Move objects of prepared transactions, in the order of
+    mapped_transactions, mapping batch_size transactions at a time.
+
+    Only the current batch is held, so the memory used depends on batch_size rather than
+    on the number of transactions.
+    """
+    enter_date = get_now() if enter_date is None else enter_date
+    order, first_rows = _transaction_rows(prepared_transactions)
+    bounds = np.append(first_rows, len(order))
+
+    for start in range(0, len(first_rows), batch_size):
+        end = min(start + batch_size, len(first_rows))
+        rows = order[bounds[start] : bounds[end]]
+        yield from _batch_of(
+            prepared_transactions, rows, first_rows[start:end] - bounds[start], enter_date
+        )
+
+
+def _investment_batch(prepared_invest: pd.DataFrame, enter_date: datetime) -> TransactionBatch:
+    """Function to map prepared investment transactions, one per row, each making a share
+    split, a cash split and, with a fee, a fee split. The splits are built a whole column
+    at a time, share quantities from their shortest decimal form.
+    """
+    has_fee = prepared_invest.fee_value.ne(0).to_numpy()
+    num_splits = 2 + has_fee
+    split_start = np.concatenate(([0], np.cumsum(num_splits)))
+    share_splits = split_start[:-1]
+    cash_splits = share_splits + 1
+    fee_splits = share_splits[has_fee] + 2
+
+    share_value = prepared_invest.share_value.to_numpy(dtype=np.int64)  # In cents
+    fee_value = prepared_invest.fee_value.to_numpy(dtype=np.int64)
+    split_account = np.empty(split_start[-1], dtype=object)
+    split_account[share_splits] = prepared_invest.share_acct.to_numpy(dtype=object)
+    split_account[cash_splits] = prepared_invest.cash_acct.to_numpy(dtype=object)
+    split_account[fee_splits] = FEES_ACCOUNT
+    split_value = np.empty(split_start[-1], dtype=np.int64)
+    split_value[share_splits] = share_value
+    split_value[cash_splits] = -(share_value + fee_value)
+    split_value[fee_splits] = fee_value[has_fee]
+    split_quantity = np.full(split_start[-1], None, dtype=object)
+    split_quantity[share_splits] = decimals_of(
+        prepared_invest.share_quantity.to_numpy(dtype=np.float64), 4
     )
 
-    return multi_split_transactions + single_split_transactions
+    memos = prepared_invest.tran_memo.to_numpy(dtype=object)
+    return TransactionBatch(
+        post_date=prepared_invest.tran_date.to_numpy(dtype=object),
+        description=prepared_invest.tran_description.to_numpy(dtype=object),
+        notes=memos,
+        num=prepared_invest.tran_num.to_numpy(dtype=object),
+        split_start=split_start,
+        split_account=split_account,
+        split_value=split_value,
+        split_memo=np.repeat(memos, num_splits),
+        enter_date=enter_date,
+        split_quantity=split_quantity,
+    )
 
 
-def mapped_transactions(prepared_transactions: pd.DataFrame) -> list:
+def mapped_investments(prepared_invest: pd.DataFrame) -> dict[str, Any]:
     """
-    Provides a list of Transaction2Move objects from prepared transactions.
+    Provides the Commodity2Move, Account2Move and Price2Move objects of prepared investment
+    transactions, and a TransactionBatch of the transactions: one commodity per security,
+    one holding account per security and investment account, one price per security and
+    day (the last one's), and the transactions with their share, cash and (if any) fee
+    splits.
     """
+    securities = prepared_invest.drop_duplicates("symbol")
+    commodities = [
+        Commodity2Move(symbol, fullname, SECURITIES_NAMESPACE, SHARE_FRACTION)
+        for symbol, fullname in zip(securities.symbol, securities.tran_description)
+    ]
+
+    holdings = prepared_invest.drop_duplicates("share_acct")
+    accounts = [
+        Account2Move(symbol, "STOCK", invest_acct, symbol, False, fullname)
+        for symbol, invest_acct, fullname in zip(
+            holdings.symbol, holdings.invest_acct, holdings.tran_description
+        )
+    ]
+    if prepared_invest.fee_value.ne(0).any():
+        fees_parent, fees_name = FEES_ACCOUNT.rsplit(":", 1)
+        accounts.append(Account2Move(fees_name, "EXPENSE", fees_parent, "USD", False, ""))
 
-    return _processed_transactions(prepared_transactions)
+    priced = prepared_invest.loc[prepared_invest.share_quantity.ne(0)]
+    priced = priced.assign(price=priced.share_value / 100 / priced.share_quantity).drop_duplicates(
+        ["symbol", "tran_date"], keep="last"
+    )
+    prices = [
+        Price2Move(symbol, "USD", day, decimal_to(price, 6))
+        for symbol, day, price in zip(priced.symbol, priced.tran_date, priced.price)
+    ]
+
+    return {
+        "commodities": commodities,
+        "accounts": accounts,
+        "prices": prices,
+        "transactions": _investment_batch(prepared_invest, get_now()),
+    }
 
 
 def _account2move(acct: pd.Series) -> Account2Move:
@@ -149,20 +344,21 @@ def _account2move(acct: pd.Series) -> Account2Move:
 
 def _prepared_balances_transactions(data: pd.DataFrame, opening_balances_acct: str) -> pd.DataFrame:
     default_memo = "Migrated by Move2GnuCash"
-    data["tran_split"] = ""
-    data[
-        "tran_acct_to"
-    ] = opening_balances_acct  # Must be full_path_name of account to support look up.
-    data["tran_description"] = "Opening Balance"
-    data[["tran_memo", "tran_tags", "tran_fitid"]] = [default_memo, "", ""]
-    data = data.rename(
+    data = data.assign(
+        tran_split="",
+        tran_acct_to=opening_balances_acct,  # Must be full_path_name of account to support look up.
+        tran_description="Opening Balance",
+        tran_memo=default_memo,
+        tran_tags="",
+        tran_fitid="",
+    )
+    return data.rename(
         columns={
             "path_and_name": "tran_acct_from",
             "acct_balance": "tran_amount",
             "acct_balance_date": "tran_date",
         }
     )
-    return data
 
 
 def mapped_accounts(prepared_data: pd.DataFrame, new_book=False):
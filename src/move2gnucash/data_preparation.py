@@ -2,30 +2,31 @@
 Contains the functions that work with Pandas DataFrames to to prepare raw data 
 into columns ready for mapping and subsequent file operations. 
 """
-import configparser
-from datetime import datetime
+from collections import Counter
+from datetime import date
 import re
-from typing import Dict
+from typing import Dict, Iterable, Iterator
 
 import numpy as np
 import pandas as pd
-from piecash import Book
+from piecash import Book, Transaction
 
-from move2gnucash.utils import combined_strings_by, custom_join, full_string_right_match
+from move2gnucash.account_registry import AccountRegistry, account_registry
+from move2gnucash.field_mappings import FieldMappings, field_mappings
+from move2gnucash.fitids import surrogate_fitids
+from move2gnucash.utils import cents_parsed, dates_parsed, RightMatchIndex
 
 
 def _parent_of(col: pd.Series) -> pd.Series:
     """Function to extract the parent account and determine roots"""
     result = col.str.rsplit(":", n=1, expand=True)
-    result.loc[result[1].isna(), 0] = "root"
-    return result[0]
+    return result[0].where(result[1].notna(), "root")
 
 
 def _name_of(accts: pd.Series) -> pd.Series:
     """Function to extract short account name from fullname"""
     result = accts.str.rsplit(":", n=1, expand=True)
-    result.loc[result[1].isna(), 1] = result[0]
-    return result[1]
+    return result[1].where(result[1].notna(), result[0])
 
 
 def _mapped_column_names(input_df: pd.DataFrame, map_dict: dict) -> pd.DataFrame:
@@ -40,15 +41,18 @@ def _sub_paths_from_raw_refs(series: pd.Series) -> pd.Series:
     expanded: pd.DataFrame = series.str.split(" - ", expand=True)
 
     expanded.fillna(value="Skip", inplace=True)  # Elements of None (missing) marked with "Skip",
-    expanded[expanded == ""] = np.NaN  # and true empty elements marked NaN,
-    expanded.fillna(
-        method="ffill", inplace=True
-    )  # so they can be filled with real value from an earlier row
+    expanded[expanded == ""] = np.nan  # and true empty elements marked NaN,
+    expanded.ffill(inplace=True)  # so they can be filled with real value from an earlier row
     expanded.replace("Skip", "", inplace=True)  # and "Skip" label is removed.
 
-    expanded["completed"] = expanded.apply(custom_join, axis=1)
+    # Join the non-empty levels of each row with colons, a level (column) at a time.
+    completed = np.full(len(expanded), "", dtype=object)
+    for level in expanded.columns:
+        names = expanded[level]
+        present = (names.notna() & (names != "")).to_numpy()
+        completed[present] = completed[present] + ":" + names.to_numpy()[present]
 
-    return expanded["completed"]
+    return pd.Series(completed, index=expanded.index, name="completed")
 
 
 def _total_lines_removed(raw_data: pd.DataFrame, col: str) -> pd.DataFrame:
@@ -61,67 +65,98 @@ def _prepared_account_names(root_account_names: pd.DataFrame) -> pd.DataFrame:
     Function to transform a raw list of accounts or categories from Quicken's exported
     report into a fully developed list of accounts for mapping opening balances to GnuCash.
     """
-    root_account_names["root"].fillna(method="ffill", inplace=True)
-
-    root_account_names["path_and_name"] = root_account_names["root"] + _sub_paths_from_raw_refs(
-        root_account_names["account"]
+    roots = root_account_names["root"].ffill()
+    named_accounts = root_account_names.assign(
+        root=roots, path_and_name=roots + _sub_paths_from_raw_refs(root_account_names["account"])
     )
 
-    prepared_names: pd.DataFrame = _total_lines_removed(root_account_names, "path_and_name")
+    prepared_names: pd.DataFrame = _total_lines_removed(named_accounts, "path_and_name")
 
     return prepared_names
 
 
+MIGRATED_MEMO = "Migrated by Move2GnuCash"  # Description of migrated accounts and balances
+# Top level accounts of the accounts created for names missing from the book
+ASSET_ROOT, INCOME_ROOT, EXPENSE_ROOT = "Assets", "Income", "Expenses"
+
+ACCOUNT_TYPES = {
+    "ASSET": {"ASSET", "ASSETS"},
+    "LIABILITY": {"LIABILITY", "LIABILITIES"},
+    "EQUITY": {"EQUITY", "EQUITIES"},
+    "INCOME": {"INCOME", "INCOMES"},
+    "EXPENSE": {"EXPENSE", "EXPENSES", "ADJUSTMENT"},
+    "CASH": {"CASH"},
+    "BANK": {"CHECKING", "ACCOUNT"},
+    "CREDIT": {"CREDIT CARD", "CREDIT CARDS"},
+    "PAYABLE": {"ACCOUNTS PAYABLE", "PAYABLE"},
+    "RECEIVABLE": {"ACCOUNTS RECEIVABLE", "RECEIVABLES"},
+    "STOCK": {"BROKERAGE"},
+    "MUTUAL": {"MUTUAL FUND", "MONEY MARKET FUND", "FUND"},
+    "TRADING": {"OTHER"},
+}
+TYPE_OF_KEYWORD = {i: k for k, v in ACCOUNT_TYPES.items() for i in v}
+TYPE_KEYWORDS = re.compile("|".join(TYPE_OF_KEYWORD.keys()), flags=re.IGNORECASE)
+TYPE_NAMES = np.array(list(ACCOUNT_TYPES) + [np.nan], dtype=object)
+TYPE_CODE_OF_KEYWORD = {
+    keyword: list(ACCOUNT_TYPES).index(acct_type) for keyword, acct_type in TYPE_OF_KEYWORD.items()
+}
+FIRST_CHOSEN = np.isin(TYPE_NAMES, ["INCOME", "EXPENSE", "OTHER"])  # By type code
+
+
+def _keyword_codes_by_segment(paths: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Function to find the type keywords of account paths, in order: provides the type
+    code of each keyword, and the row of the path it's found in.
+
+    Keywords never span a ":", so each distinct segment of the paths (charts of accounts
+    reuse few names) is searched once, and its keywords gathered for every path using it.
+    """
+    joined = "\n".join(paths.tolist())
+    segments = joined.replace("\n", ":").split(":")
+    separators = np.frombuffer(joined.encode(), np.uint8)  # UTF-8 keeps ":" and "\n" bytes
+    separators = separators[(separators == ord(":")) | (separators == ord("\n"))]
+    rows = np.concatenate(([0], np.cumsum(separators == ord("\n"))))  # Of each segment
+
+    segment_codes, distinct = pd.factorize(np.array(segments, dtype=object))
+    keywords = [
+        [TYPE_CODE_OF_KEYWORD[keyword] for keyword in TYPE_KEYWORDS.findall(segment.upper())]
+        for segment in distinct
+    ]
+    num_keywords = np.fromiter(map(len, keywords), np.int64, len(keywords))
+    first_keyword = np.cumsum(num_keywords) - num_keywords
+    keyword_codes = np.fromiter(
+        (code for codes in keywords for code in codes), np.int8, num_keywords.sum()
+    )
+
+    counts = num_keywords[segment_codes]
+    found_before = np.cumsum(counts) - counts
+    positions = np.repeat(first_keyword[segment_codes] - found_before, counts)
+    positions += np.arange(len(positions))
+    return keyword_codes[positions], np.repeat(rows, counts)
+
+
 def _add_account_types_of(accounts: pd.DataFrame) -> None:
     """Uses full account name and placeholder status to guess GnuCash account_type.
     As of 2/2023, reference links were valid:
     https://code.gnucash.org/docs/MAINT/group__Account.html#ga398c5d6f7a5127db7b81789e05262908
     https://piecash.readthedocs.io/en/master/_modules/piecash/core/account.html?highlight=types
+
+    The keywords found in each name are candidates: the first is chosen for income and
+    expense accounts, the second to last for other placeholders and the last otherwise.
+    Accounts without any keyword get no type (NaN).
     """
+    codes, keyword_rows = _keyword_codes_by_segment(accounts.path_and_name)
+    codes = np.append(codes, len(ACCOUNT_TYPES))  # Last is "no type", NaN in TYPE_NAMES
 
-    def chosen_type(acct: pd.Series) -> str:
-        candidate_types, placeholder = acct
-        num_candidates = len(candidate_types)
-        acct_choice_index = num_candidates - 1 if num_candidates > 0 else 0
-        placeholder_choice_index = num_candidates - 2 if num_candidates > 1 else 0
-        choice = (
-            candidate_types[0]
-            if candidate_types[0] in ["INCOME", "EXPENSE", "OTHER"]
-            else (
-                candidate_types[placeholder_choice_index]
-                if placeholder is True
-                else candidate_types[acct_choice_index]
-            )
-        )
-        return choice
-
-    account_types = {
-        "ASSET": {"ASSET", "ASSETS"},
-        "LIABILITY": {"LIABILITY", "LIABILITIES"},
-        "EQUITY": {"EQUITY", "EQUITIES"},
-        "INCOME": {"INCOME", "INCOMES"},
-        "EXPENSE": {"EXPENSE", "EXPENSES", "ADJUSTMENT"},
-        "CASH": {"CASH"},
-        "BANK": {"CHECKING", "ACCOUNT"},
-        "CREDIT": {"CREDIT CARD", "CREDIT CARDS"},
-        "PAYABLE": {"ACCOUNTS PAYABLE", "PAYABLE"},
-        "RECEIVABLE": {"ACCOUNTS RECEIVABLE", "RECEIVABLES"},
-        "STOCK": {"BROKERAGE"},
-        "MUTUAL": {"MUTUAL FUND", "MONEY MARKET FUND", "FUND"},
-        "TRADING": {"OTHER"},
-    }
-    reversed_dict = {i: k for k, v in account_types.items() for i in v}
+    num_candidates = np.bincount(keyword_rows, minlength=len(accounts))
+    starts = np.cumsum(num_candidates) - num_candidates
+    no_type = len(codes) - 1
+    first = np.where(num_candidates > 0, starts, no_type)
+    last = np.where(num_candidates > 0, starts + num_candidates - 1, no_type)
+    placeholder_choice = np.where(num_candidates > 1, starts + num_candidates - 2, first)
 
-    accounts["upper_path_name"] = accounts.path_and_name.str.upper()
-    accounts["candidate_types"] = [
-        [reversed_dict[y] for y in x]
-        for x in accounts.upper_path_name.str.findall(
-            "|".join(reversed_dict.keys()), flags=re.IGNORECASE
-        )
-    ]
-    accounts["selected_type"] = accounts[["candidate_types", "placeholder"]].apply(
-        chosen_type, axis=1
-    )
+    choice = np.where(accounts["placeholder"].eq(True), placeholder_choice, last)
+    choice = np.where(FIRST_CHOSEN[codes[first]], first, choice)
+    accounts["selected_type"] = TYPE_NAMES[codes[choice]]
 
 
 def prepared_balances(raw_data: Dict) -> pd.DataFrame:
@@ -140,23 +175,22 @@ def prepared_balances(raw_data: Dict) -> pd.DataFrame:
 
     _add_account_types_of(prepared_data)
 
-    prepared_data["commodity"] = "USD"
-    prepared_data["description"] = "Migrated by Move2GnuCash"
-    prepared_data["tran_description"] = prepared_data.description
-
-    prepared_data["parent"] = _parent_of(prepared_data["path_and_name"])
-    prepared_data["name"] = _name_of(prepared_data["path_and_name"])
-    prepared_data.rename(columns={"path_and_name": "tran_acct_to"}, inplace=True)
-
-    prepared_data["tran_split"] = ""
-    prepared_data["tran_acct_from"] = "Opening Balances"
-    prepared_data["tran_amount"] = prepared_data["balance"].astype(float)
-    prepared_data.loc[prepared_data.selected_type == "STOCK", "tran_amount"] = 0
-    prepared_data["tran_memo"] = prepared_data.description
-    prepared_data["tran_date"] = raw_data["as_of_date"]
-    prepared_data["tran_num"] = 1
+    balances = _cents_of(prepared_data["balance"])
+    prepared_data = prepared_data.assign(
+        commodity="USD",
+        description=MIGRATED_MEMO,
+        tran_description=MIGRATED_MEMO,
+        parent=_parent_of(prepared_data["path_and_name"]),
+        name=_name_of(prepared_data["path_and_name"]),
+        tran_split="",
+        tran_acct_from="Opening Balances",
+        tran_amount=balances.where(prepared_data.selected_type != "STOCK", 0),
+        tran_memo=MIGRATED_MEMO,
+        tran_date=raw_data["as_of_date"],
+        tran_num=1,
+    )
 
-    return prepared_data
+    return prepared_data.rename(columns={"path_and_name": "tran_acct_to"})
 
 
 def prepared_category_accounts(raw_data: pd.DataFrame) -> pd.DataFrame:
@@ -171,22 +205,46 @@ def prepared_category_accounts(raw_data: pd.DataFrame) -> pd.DataFrame:
 
     _add_account_types_of(prepared_data)
 
-    prepared_data["commodity"] = "USD"
-    prepared_data["description"] = "Migrated by Move2GnuCash"
+    return prepared_data.assign(
+        commodity="USD",
+        description=MIGRATED_MEMO,
+        parent=_parent_of(prepared_data["path_and_name"]),
+        name=_name_of(prepared_data["path_and_name"]),
+    )
+
+
+def prepared_missing_accounts(paths: list[str], placeholders: list[bool]) -> pd.DataFrame:
+    """
+    Provides a Pandas DataFrame of account data prepared for full account names missing from
+    a book, e.g. the parents of accounts to create. Their types are guessed from their names
+    as for Quicken's accounts, and are missing (NaN) for names without any type keyword.
+    """
+    prepared_data = pd.DataFrame({"path_and_name": paths, "placeholder": placeholders})
 
-    prepared_data["parent"] = _parent_of(prepared_data["path_and_name"])
-    prepared_data["name"] = _name_of(prepared_data["path_and_name"])
+    _add_account_types_of(prepared_data)
 
-    return prepared_data
+    parents, _, names = prepared_data["path_and_name"].str.rpartition(":").T.to_numpy()
+    return prepared_data.assign(
+        commodity="USD",
+        description=MIGRATED_MEMO,
+        parent=np.where(parents == "", "root", parents),
+        name=names,
+    )
 
 
-def _combined_memo_tags(_: pd.DataFrame) -> str:
-    memo_notes, tags = _
-    return combined_strings_by(memo_notes, tags, ";")
+def _combined_memo_tags(memo_notes: pd.Series, tags: pd.Series) -> pd.Series:
+    """Function to combine memos and tags like combined_strings_by, a whole column at once."""
+    # Through object, as categories cast to str make a fixed width copy of every row first.
+    memo_notes, tags = memo_notes.astype(object).astype(str), tags.astype(object).astype(str)
+    has_memo = memo_notes.ne("")
+    both = has_memo & tags.ne("")
+    combined = memo_notes.where(has_memo, tags)  # Only the rows having both are joined
+    combined[both] = memo_notes[both] + "; " + tags[both]
+    return combined
 
 
-def _list_of_candidates(candidate: str, existing: list[str]):
-    match = full_string_right_match(existing, candidate)
+def _list_of_candidates(candidate: str, existing: RightMatchIndex):
+    match = existing.matches(candidate)
     if len(match) == 0:
         raise ValueError(f"Failure. Missing account for {candidate}")
     return match
@@ -221,72 +279,358 @@ def _chosen_acct(candidates: list):
     return candidates
 
 
-def _account_from(book: Book, accounts: pd.Series) -> pd.Series:
-    existing_accounts = [acct.fullname for acct in book.accounts if not acct.placeholder]
-    for x in accounts:
-        if len(x) == 0:
-            print("No accounts")
-    candidates = accounts.apply(_list_of_candidates, args=(existing_accounts,))
+class Resolutions(dict):
+    """Class of the accounts chosen for the account names of an import (name -> full name).
 
-    final = candidates.apply(_chosen_acct)
-    return final
+    on_ambiguous says what happens to a name matching several accounts which wasn't chosen
+    yet: "ask" the user, "raise" an error (unattended imports) or "collect" it as pending,
+    unresolved, to be written to a rules file for review. Collecting, a name matching no
+    account is pending too, with no candidates, instead of failing the whole collection.
+    """
 
+    def __init__(self, chosen: Dict[str, str] | None = None, on_ambiguous: str = "ask"):
+        super().__init__(chosen or {})
+        self.on_ambiguous = on_ambiguous
+        self.candidates: Dict[str, list[str]] = {}  # Of the ambiguous names, chosen or not
 
-def _as_date_object(date_input):
-    return datetime.strptime(date_input, "%m/%d/%Y").date()
+    @property
+    def pending(self) -> Dict[str, list[str]]:
+        """The ambiguous (or missing) names without a chosen account, with their candidates."""
+        return {name: accts for name, accts in self.candidates.items() if name not in self}
 
 
-def _prepared_non_invest(book: Book, non_invest_trans: pd.DataFrame) -> pd.DataFrame:
-    non_invest_trans.reset_index(inplace=True)
-    non_invest_trans["tran_acct_to"] = _account_from(book, non_invest_trans.account)
-    non_invest_trans["tran_acct_from"] = _account_from(book, non_invest_trans.acct_from)
-    return non_invest_trans
+def _new_fullname(name: str, root: str, registry: AccountRegistry) -> str:
+    """Function to provide the full name of the account to create for an account name
+    missing from the book: the name under root, unless it starts with a top level account.
+    """
+    top_level = name.split(":", 1)[0]
+    return name if top_level == root or top_level in registry else f"{root}:{name}"
 
 
-def _prepared_invest(book: Book, invest_trans: pd.DataFrame) -> pd.DataFrame:
-    invest_trans["invest_acct"] = _account_from(book, invest_trans.acct_from)
-    return invest_trans
+def _account_from(
+    book: Book,
+    accounts: pd.Series,
+    resolutions: Resolutions | None = None,
+    roots: np.ndarray | str | None = None,
+) -> pd.Series:
+    """Function to resolve account names to the full names of accounts of the book.
 
+    Each distinct name is resolved once (so an ambiguous one is asked about once), and
+    names found in resolutions, shared by the calls of one import, aren't resolved again.
 
-def prepared_transactions(book: Book, raw_data: pd.DataFrame) -> pd.DataFrame:
+    A name matching no account is resolved to the full name of a new one, to be created
+    with the transactions, under the root (top level account) of its first row in roots.
+    Without roots, it's an error.
     """
-    Provides a Pandas DataFrame of transaction data prepared from a raw list of income or expense
-    transactions imported from Quicken's transaction export -> csv feature.
+    resolutions = Resolutions() if resolutions is None else resolutions
+    codes, names = pd.factorize(accounts)
+
+    unresolved = [name for name in names if name not in resolutions]
+    if unresolved:
+        registry = account_registry(book)
+        existing_accounts = RightMatchIndex(registry.fullnames(placeholders=False))
+        if isinstance(roots, np.ndarray):
+            first_rows = pd.Series(codes).drop_duplicates()
+            first_rows = first_rows[first_rows >= 0]
+            root_of = dict(zip(names[first_rows.to_numpy()], roots[first_rows.index]))
+        else:
+            root_of = dict.fromkeys(names, roots)
+
+        for name in unresolved:
+            if len(name) == 0:
+                print("No accounts")
+            candidates = existing_accounts.matches(name)
+            if len(candidates) == 0 and resolutions.on_ambiguous == "collect":
+                resolutions.candidates[name] = candidates  # Missing: pending, with none
+            elif len(candidates) == 0 and roots is not None:
+                resolutions[name] = _new_fullname(name, root_of[name], registry)
+            elif len(candidates) > 1 and resolutions.on_ambiguous != "ask":
+                resolutions.candidates[name] = candidates
+            else:
+                resolutions[name] = _chosen_acct(_list_of_candidates(name, existing_accounts))
+
+        pending = [name for name in unresolved if name not in resolutions]
+        if pending and resolutions.on_ambiguous == "raise":
+            raise ValueError(
+                f"Failure. No account chosen for ambiguous account names {pending}. "
+                "Collect them into the resolutions file and choose their accounts first."
+            )
 
-    A string reflecting the root account, (typically "Income" or "Expenses"), must be provided due
-    to limitations with Quicken's export file.
+    resolved = np.array([resolutions.get(name) for name in names] + [None], dtype=object)
+    return pd.Series(resolved[codes], index=accounts.index)
+
+
+def _rows_of(data: pd.DataFrame, mask: pd.Series | np.ndarray) -> pd.DataFrame:
+    """Function to select the rows of a boolean mask into a new DataFrame, renumbered from 0.
+
+    The rows are copied once, and the new DataFrame is no slice of data, so columns can be
+    added to it without chained assignment.
     """
+    rows = data.take(np.flatnonzero(mask))
+    rows.index = pd.RangeIndex(len(rows))
+    return rows
+
+
+def _blanks_filled(data: pd.DataFrame) -> pd.DataFrame:
+    """Function to replace missing values with empty strings, categorical columns included."""
+    for col in data.select_dtypes("category").columns:
+        if "" not in data[col].cat.categories:
+            data[col] = data[col].cat.add_categories("")
+    return data.fillna("")
+
+
+def _prepared_non_invest(
+    book: Book, non_invest_trans: pd.DataFrame, resolutions: Resolutions
+) -> pd.DataFrame:
+    """Function to resolve the accounts of the non-investment transactions. A category
+    missing from the book is created under Expenses, or Income for money coming in, and
+    a missing transfer or Quicken account under Assets.
+    """
+    transfers = non_invest_trans.transfer.astype(object)
+    is_transfer = transfers.ne("") & non_invest_trans.account.astype(object).eq(transfers)
+    category_roots = np.where(
+        is_transfer,
+        ASSET_ROOT,
+        np.where(non_invest_trans.tran_amount >= 0, EXPENSE_ROOT, INCOME_ROOT),
+    )
+    non_invest_trans["tran_acct_to"] = _account_from(
+        book, non_invest_trans.account, resolutions, category_roots
+    )
+    non_invest_trans["tran_acct_from"] = _account_from(
+        book, non_invest_trans.acct_from, resolutions, ASSET_ROOT
+    )
+    return non_invest_trans
+
+
+# Income reinvested in shares by Quicken's reinvest actions, by the long and short names
+# of each action, and the account of that income.
+REINVEST_INCOME = {
+    "ReinvDiv": "Income:Dividends",
+    "Reinvest Dividend": "Income:Dividends",
+    "ReinvInt": "Income:Interest",
+    "Reinvest Interest": "Income:Interest",
+    "ReinvLg": "Income:Capital Gains:Long-term",
+    "Reinvest Long-term Capital Gain": "Income:Capital Gains:Long-term",
+    "ReinvMd": "Income:Capital Gains:Mid-term",
+    "Reinvest Mid-term Capital Gain": "Income:Capital Gains:Mid-term",
+    "ReinvSh": "Income:Capital Gains:Short-term",
+    "Reinvest Short-term Capital Gain": "Income:Capital Gains:Short-term",
+}
+# Direction of the shares moved by Quicken's investment actions (Category "Investments:<action>"),
+# and the actions moving them without cash, against equity.
+SHARE_ACTIONS = {"Buy": 1, "Add Shares": 1, "Sell": -1, "Remove Shares": -1}
+SHARE_ACTIONS |= dict.fromkeys(REINVEST_INCOME, 1)
+NON_CASH_ACTIONS = ["Add Shares", "Remove Shares"]
+EQUITY_ACCOUNT = "Equity:Opening Balances"
+
+MONEY_FIELDS = ["tran_amount", "invest_amount", "comm_fee"]  # Carried as integer cents
+
+
+def _cents_of(column: pd.Series) -> pd.Series:
+    """Function to read an amount of money column into integer cents, blanks being 0."""
+    return cents_parsed(column).fillna(0).astype(np.int64)
+
+
+def _amounts_of(column: pd.Series) -> pd.Series:
+    """Function to read an optional amount column, blanks (filled with "") being 0."""
+    return pd.to_numeric(column, errors="coerce").fillna(0.0)
+
+
+def _prepared_invest(
+    book: Book, invest_trans: pd.DataFrame, resolutions: Resolutions
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Function to prepare the investment transactions moving shares of a security into or
+    out of an investment account, as the columns of their share, fee and cash splits.
+
+    The share split holds the Invest Amount and the Shares, both signed by the action, and
+    the cash split the opposite of the share and fee values. The cash split is in equity
+    for shares added or removed without cash, and in the income reinvested for reinvest
+    actions.
+
+    Other investment actions aren't imported yet: their rows are provided apart, skipped.
+    """
+    actions = invest_trans.account.astype(str).str.removeprefix("Investments:")
+    directions = actions.map(SHARE_ACTIONS)
+    moving_shares = directions.notna() & invest_trans.symbol.astype(str).ne("")
+    if not moving_shares.all():
+        print(
+            f"Skipped {(~moving_shares).sum()} investment transactions of actions not imported "
+            f"yet: {sorted(actions[~moving_shares].unique())}"
+        )
 
-    config = configparser.ConfigParser()
-    config.read("src/move2gnucash/field_mappings.ini")
-    prepared_data = _mapped_column_names(raw_data, config["transactions"])
+    skipped_trans = _rows_of(invest_trans, ~moving_shares)
+    invest_trans = _rows_of(invest_trans, moving_shares)
+    directions = directions[moving_shares].to_numpy(dtype=np.int64)
+    without_cash = actions[moving_shares].isin(NON_CASH_ACTIONS).to_numpy()
+    income_accts = actions[moving_shares].map(REINVEST_INCOME).to_numpy(dtype=object)
 
-    prepared_data["tran_date"] = prepared_data.date.apply(_as_date_object)
+    invest_trans["invest_acct"] = _account_from(
+        book, invest_trans.acct_from, resolutions, ASSET_ROOT
+    )
+    invest_trans["share_acct"] = invest_trans.invest_acct + ":" + invest_trans.symbol.astype(str)
+    invest_trans["share_quantity"] = directions * _amounts_of(invest_trans.shares).abs()
+    invest_trans["share_value"] = directions * invest_trans.invest_amount.abs()  # In cents
+    invest_trans["fee_value"] = invest_trans.comm_fee.abs()
+    invest_trans["cash_acct"] = np.where(
+        without_cash,
+        EQUITY_ACCOUNT,
+        np.where(pd.isna(income_accts), invest_trans.invest_acct, income_accts),
+    )
+    return invest_trans, skipped_trans
+
+
+def _transaction_fields() -> FieldMappings:
+    """Function to provide the user's names for the transaction csv columns."""
+    return field_mappings("transactions")
 
-    balance_date = book.transactions[0].post_date
-    prepared_data = prepared_data.loc[
-        (prepared_data.tran_date > balance_date)
-        | (prepared_data.account.str.startswith("Investments:"))
-    ].reset_index(drop=True)
 
-    prepared_data.fillna("", inplace=True)  # Both
-    prepared_data["tran_num"] = prepared_data.fitid  # Both
-    prepared_data["tran_memo"] = prepared_data[["memo_notes", "tags"]].agg(
-        _combined_memo_tags, axis=1
+def _split_group_tail_start(raw_data: pd.DataFrame, fields: Dict[str, str]) -> int:
+    """Function to find the row where a trailing multi-split transaction starts.
+
+    Returns the length of raw_data when the last row isn't part of a Quicken split.
+    """
+    num_rows = len(raw_data)
+    is_split = (raw_data[fields["tran_split"]] == "S").to_numpy()
+    if num_rows == 0 or not is_split[-1]:
+        return num_rows
+
+    last_row = raw_data.iloc[-1]
+    same_group = (
+        is_split
+        & (raw_data[fields["date"]] == last_row[fields["date"]]).to_numpy()
+        & (raw_data[fields["tran_description"]] == last_row[fields["tran_description"]]).to_numpy()
     )
-    prepared_data["tran_amount"] = prepared_data.tran_amount.apply(lambda x: x * -1)
+    start = num_rows
+    while start > 0 and same_group[start - 1]:
+        start -= 1
+    return start
+
+
+def _concatenated(first: pd.DataFrame, second: pd.DataFrame) -> pd.DataFrame:
+    """Function to concatenate two chunks of the same csv, keeping the dtypes of their
+    columns: the categories of categorical ones are united first, so every column has the
+    same dtype in both, and none is left for pandas to infer (e.g. from all-NA ones).
+    """
+    dtypes = {
+        col: pd.CategoricalDtype(first[col].cat.categories.union(second[col].cat.categories))
+        for col in first.select_dtypes("category").columns
+    }
+    return pd.concat([first.astype(dtypes), second.astype(dtypes)])
+
+
+def whole_split_groups(raw_chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    Provides the raw transaction chunks read from a csv, regrouped so a Quicken
+    multi-split transaction is never divided between two chunks.
+
+    The rows of a split group found at the end of a chunk are held back and
+    prepended to the next one. Original row labels are kept.
+    """
+    fields = _transaction_fields().columns
+    held_back = None
+
+    for chunk in raw_chunks:
+        if held_back is not None and len(held_back) > 0:
+            chunk = _concatenated(held_back, chunk)
+        tail_start = _split_group_tail_start(chunk, fields)
+        held_back = chunk.iloc[tail_start:]
+        if tail_start > 0:
+            yield chunk.iloc[:tail_start]
+
+    if held_back is not None and len(held_back) > 0:
+        yield held_back
+
+
+def opening_balance_date(book: Book) -> date:
+    """Function to provide the date of the book's opening balances, the first transaction.
+    Only that transaction is read (LIMIT 1), not all of the book's. It's the first one
+    written, not the earliest: investment transactions may well be older.
+    """
+    return book.session.query(Transaction).first().post_date
+
+
+def staged_transactions(
+    raw_data: pd.DataFrame, balance_date: date, occurrences: Counter[int] | None = None
+) -> pd.DataFrame:
+    """
+    Provides a Pandas DataFrame of raw transactions prepared up to, but not including,
+    the resolution of account names against the book.
+
+    Nothing here needs the book, so it can be run away from it (e.g. in another process).
+
+    Staging a file in chunks, the same occurrences are passed for each (see surrogate_fitids).
+    """
+    prepared_data = _mapped_column_names(raw_data, _transaction_fields().columns)
+
+    # Strings, or already parsed when the csv was read with explicit column types
+    tran_dates = dates_parsed(prepared_data.date)
+
+    # Investment transactions are kept whatever their date, and told apart (by this one
+    # mask) when resolved.
+    is_invest = prepared_data.account.str.startswith("Investments:", na=False)
+    kept = (tran_dates > pd.Timestamp(balance_date)) | is_invest
+
+    prepared_data = _rows_of(prepared_data, kept)
+    prepared_data["tran_date"] = tran_dates[kept].dt.date.to_numpy()
+    prepared_data["is_invest"] = is_invest[kept].to_numpy(dtype=bool)
+    for field in MONEY_FIELDS:  # Strings or numbers, or already in cents (typed columns)
+        prepared_data[field] = _cents_of(prepared_data[field])
+
+    prepared_data = _blanks_filled(prepared_data)  # Both
+    prepared_data["tran_memo"] = _combined_memo_tags(prepared_data.memo_notes, prepared_data.tags)
+    prepared_data["tran_amount"] = -prepared_data.tran_amount
 
     # Next line should handle internal transfers contained in Quicken data by
     # assigning the Transfer name to tran_acct_to when the former is defined.
-    prepared_data.loc[
-        prepared_data["account"].str.startswith("Transfer:"), "account"
-    ] = prepared_data.transfer
-
-    non_invest_data = _prepared_non_invest(
-        book, prepared_data.query("~account.str.startswith('Investments:')")
+    is_transfer = prepared_data["account"].str.startswith("Transfer:")
+    prepared_data["account"] = (
+        prepared_data["account"].astype(object).where(~is_transfer, prepared_data.transfer)
     )
-    invest_data = _prepared_invest(
-        book, prepared_data.query("account.str.startswith('Investments:')")
+    prepared_data["tran_num"] = surrogate_fitids(prepared_data, occurrences)  # Both
+
+    return prepared_data
+
+
+def resolved_transactions(
+    book: Book, staged_data: pd.DataFrame, resolutions: Resolutions | None = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Provides the staged transactions, split into non-investment and investment
+    transactions, with their account names resolved to accounts of the book.
+
+    Resolved names are added to resolutions (name -> account full name), so passing the
+    same Resolutions for every chunk or file of an import resolves each name only once.
+
+    The staged investment transactions of actions not imported yet are provided too, as
+    "skipped", unresolved.
+    """
+    resolutions = Resolutions() if resolutions is None else resolutions
+    is_invest = staged_data.is_invest.to_numpy()
+    non_invest_data = _prepared_non_invest(book, _rows_of(staged_data, ~is_invest), resolutions)
+    invest_data, skipped_data = _prepared_invest(
+        book, _rows_of(staged_data, is_invest), resolutions
     )
 
-    return {"non_invest": non_invest_data, "invest": invest_data}
+    return {"non_invest": non_invest_data, "invest": invest_data, "skipped": skipped_data}
+
+
+def prepared_transactions(
+    book: Book,
+    raw_data: pd.DataFrame,
+    resolutions: Resolutions | None = None,
+    occurrences: Counter[int] | None = None,
+    balance_date: date | None = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Provides a Pandas DataFrame of transaction data prepared from a raw list of income or expense
+    transactions imported from Quicken's transaction export -> csv feature.
+
+    A string reflecting the root account, (typically "Income" or "Expenses"), must be provided due
+    to limitations with Quicken's export file.
+
+    The book's opening_balance_date is read unless given, e.g. once for every chunk of a file.
+    """
+    balance_date = opening_balance_date(book) if balance_date is None else balance_date
+    staged_data = staged_transactions(raw_data, balance_date, occurrences)
+
+    return resolved_transactions(book, staged_data, resolutions)
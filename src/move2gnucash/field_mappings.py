@@ -0,0 +1,107 @@
+"""
+Contains the user's csv column names from field_mappings.ini, read once and compiled
+into what the csv readers and the data preparation need.
+
+The names come from the field_mappings.ini packaged with move2gnucash, unless a user's
+own file is set with use_field_mappings_file.
+"""
+import configparser
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib.resources import files
+from pathlib import Path
+import typing
+
+# How each internal field name of the [transactions] section of field_mappings.ini is read
+# from the csv. Quicken's balance and category reports have no header row, and are read by
+# position instead (see file_operations.REPORT_COLUMNS).
+FIELD_KINDS = {
+    "tran_split": "text",
+    "date": "date",
+    "posted": "text",
+    "symbol": "text",
+    "tran_description": "text",
+    "account": "category",
+    "tags": "category",
+    "transfer": "category",
+    "comm_fee": "money",
+    "shares": "amount",
+    "invest_amount": "money",
+    "tran_amount": "money",
+    "memo_notes": "text",
+    "acct_from": "category",
+    "fitid": "text",  # Long numeric ids must never become numbers
+}
+UNUSED_FIELDS = {"type", "action", "clr"}  # As marked in field_mappings.ini
+
+# Dates are read as strings and parsed afterwards, which is much faster than read_csv's
+# parse_dates alongside dtypes. So is money, parsed into integer cents.
+DTYPE_OF_KIND = {
+    "text": str,
+    "date": str,
+    "category": "category",
+    "amount": "float64",
+    "money": str,
+}
+
+_user_file: Path | None = None
+
+
+@dataclass(frozen=True)
+class FieldMappings:
+    """Class of the csv column names of one section of field_mappings.ini, compiled.
+
+    Shared by every caller, so must not be changed.
+    """
+
+    columns: typing.Dict[str, str]  # The user's csv column name of each internal field
+    usecols: list[str]  # The columns read, those of unused fields left out
+    kinds: typing.Dict[str, list[str]]  # The columns read, by kind (see DTYPE_OF_KIND)
+
+    @property
+    def dtypes(self) -> typing.Dict[str, typing.Any]:
+        """The read_csv dtype of each column read."""
+        return {column: DTYPE_OF_KIND[kind] for kind, cols in self.kinds.items() for column in cols}
+
+
+def use_field_mappings_file(file_name: str | Path | None) -> None:
+    """Function to read the csv column names from a user's file instead of the packaged
+    field_mappings.ini, from now on. None goes back to the packaged file.
+    """
+    global _user_file  # pylint: disable=global-statement
+    _user_file = None if file_name is None else Path(file_name)
+    field_mappings_text.cache_clear()
+    field_mappings.cache_clear()
+
+
+def user_field_mappings_file() -> Path | None:
+    """Function to provide the user's file set with use_field_mappings_file, if any."""
+    return _user_file
+
+
+@lru_cache(maxsize=None)
+def field_mappings_text() -> str:
+    """Function to read the field mappings file in use, once."""
+    if _user_file is not None:
+        return _user_file.read_text()
+    return files(__package__).joinpath("field_mappings.ini").read_text()
+
+
+def _compiled(section: configparser.SectionProxy) -> FieldMappings:
+    columns = dict(section.items())
+    usecols = []
+    kinds = {kind: [] for kind in DTYPE_OF_KIND}
+    for field, column in columns.items():
+        if field in UNUSED_FIELDS or column in usecols:
+            continue
+        usecols.append(column)
+        kinds[FIELD_KINDS[field]].append(column)
+    return FieldMappings(columns, usecols, kinds)
+
+
+@lru_cache(maxsize=None)
+def field_mappings(section: str) -> FieldMappings:
+    """Function to provide a section of the field mappings, compiled on first use."""
+    config = configparser.ConfigParser()
+    config.read_string(field_mappings_text())
+    return _compiled(config[section])
@@ -2,33 +2,189 @@
 Contains the functions that operate on csv and GnuCash files.
 """
 from datetime import datetime
+from glob import glob
+import lzma
 import typing
 import logging
+from pathlib import Path
+from time import perf_counter
+from uuid import uuid4
 
+import numpy as np
 import pandas as pd
-from piecash import Account, Book, create_book, Transaction, Split
+from piecash import Account, Book, Commodity, create_book, Price, Transaction, Split
+from piecash import GncImbalanceError, GncValidationError
+from piecash.kvp import KVP_Type, Slot
 
-from move2gnucash.data_maps import Split2Move
-from move2gnucash.utils import string_trimmed_after, string_trimmed_before
+from move2gnucash.account_registry import account_registry
+from move2gnucash.checkpoints import save
+from move2gnucash.data_maps import (
+    Account2Move,
+    Commodity2Move,
+    Price2Move,
+    Split2Move,
+    Transaction2Move,
+    TransactionBatch,
+    fields_of,
+    mapped_accounts,
+)
+from move2gnucash.data_preparation import Resolutions, prepared_missing_accounts
+from move2gnucash.field_mappings import FieldMappings, field_mappings
+from move2gnucash.utils import (
+    cents_parsed,
+    DATE_FORMAT,
+    dates_parsed,
+    hierarchy_from,
+    string_trimmed_after,
+    string_trimmed_before,
+)
 
 logging.basicConfig(level=logging.DEBUG)
 
+# Read as streams by pandas (and pyarrow, except for xz); zstd needs the zstandard package.
+COMPRESSION_SUFFIXES = [".gz", ".bz2", ".xz", ".zst"]
 
-def fetch_csv_data(file_to_open, _header=0):
-    """Read all csv contents of file and return DataFrame"""
-    return pd.read_csv(file_to_open, header=_header, thousands=",")
+REPORT_COLUMNS = ["root", "account", "balance"]
+REPORT_DTYPES = {"root": str, "account": str, "balance": str}  # Balances parsed into cents
+
+RESOLUTION_COLUMNS = ["name", "account", "candidates"]
+CANDIDATE_SEPARATOR = " | "
+
+# Without a batch size, the objects added to a book are committed in batches sized to take
+# about COMMIT_SECONDS each, starting from FIRST_BATCH_SIZE.
+FIRST_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 20_000
+COMMIT_SECONDS = 0.2
+
+
+def _parsed(data: pd.DataFrame, mappings: FieldMappings) -> pd.DataFrame:
+    """Parses the columns read as strings: dates, and money into integer cents."""
+    for column in mappings.kinds["date"]:
+        data[column] = dates_parsed(data[column])
+    for column in mappings.kinds["money"]:
+        data[column] = cents_parsed(data[column])
+    return data
+
+
+def _read_csv_pyarrow(file_to_open, mappings: FieldMappings) -> pd.DataFrame:
+    """Reads the csv with pyarrow's multithreaded parser, typing every column up front."""
+    # pylint: disable-next=import-outside-toplevel
+    from pyarrow import csv, dictionary, int32, string, timestamp
+
+    kinds = mappings.kinds
+    column_types = {column: string() for column in kinds["text"] + kinds["amount"] + kinds["money"]}
+    column_types |= {column: dictionary(int32(), string()) for column in kinds["category"]}
+    column_types |= {column: timestamp("s") for column in kinds["date"]}
+    convert_options = csv.ConvertOptions(
+        column_types=column_types,
+        include_columns=mappings.usecols,
+        strings_can_be_null=True,
+        timestamp_parsers=[DATE_FORMAT],
+    )
+    if Path(file_to_open).suffix == ".xz":  # pyarrow can't decompress xz itself
+        with lzma.open(file_to_open) as stream:
+            table = csv.read_csv(stream, convert_options=convert_options)
+    else:
+        table = csv.read_csv(file_to_open, convert_options=convert_options)
+    data = table.to_pandas()
+    for column in kinds["amount"]:  # pyarrow has no thousands separator option
+        data[column] = pd.to_numeric(data[column].str.replace(",", "", regex=False))
+    for column in kinds["money"]:
+        data[column] = cents_parsed(data[column])
+    return data
+
+
+def fetch_csv_data(
+    file_to_open,
+    _header=0,
+    chunk_size: int | None = None,
+    engine: str | None = None,
+    first_row: int = 0,
+):
+    """Read all csv contents of file and return DataFrame.
+
+    Only the columns named in the [transactions] section of field_mappings.ini (and
+    not marked unused) are read, each with an explicit type: account-like columns are
+    categorical, money is in integer cents (nullable Int64), share amounts are floats and
+    dates are parsed.
+
+    If chunk_size is given, an iterator of DataFrames of (at most) chunk_size rows
+    is returned instead, so the file is never held in memory all at once.
+
+    engine="pyarrow" parses with the optional pyarrow package, which can't chunk.
+
+    With a first_row, the rows before it (counting from 0, after the header) are skipped,
+    e.g. to resume an import. Rows are labeled by their number in the file either way.
+
+    Files compressed with gzip, bzip2, xz or zstd (by suffix) are decompressed as they're read.
+    """
+    mappings = field_mappings("transactions")
+    if engine == "pyarrow":
+        if chunk_size is not None:
+            raise ValueError("The pyarrow engine can't read a csv in chunks.")
+        return _read_csv_pyarrow(file_to_open, mappings).iloc[first_row:]
+
+    options = {"usecols": mappings.usecols, "dtype": mappings.dtypes, "thousands": ","}
+    if first_row:
+        options["skiprows"] = range(_header + 1, _header + 1 + first_row)
+
+    def labeled(data: pd.DataFrame) -> pd.DataFrame:
+        data.index += first_row
+        return _parsed(data, mappings)
+
+    if chunk_size is not None:
+        reader = pd.read_csv(file_to_open, header=_header, chunksize=chunk_size, **options)
+        return (labeled(chunk) for chunk in reader)
+    return labeled(pd.read_csv(file_to_open, header=_header, **options))
+
+
+MANIFEST_SUFFIXES = {".txt", ".manifest"}
+
+
+def uncompressed_name(file_name: str) -> str:
+    """Function to provide a file name without its compression suffix, if any."""
+    path = Path(file_name)
+    return str(path.with_suffix("")) if path.suffix in COMPRESSION_SUFFIXES else str(path)
+
+
+def expanded_input_files(input_spec: str) -> list[str]:
+    """Function to list the csv files named by the user's input, in import order.
+
+    The input can be a single csv, a directory (all of its csv files), a glob pattern
+    or a manifest: a .txt or .manifest file listing one csv per line, relative to the
+    manifest. Directory and glob matches are imported in sorted name order.
+    """
+    path = Path(input_spec)
+    if path.is_dir():
+        patterns = ["*.csv"] + [f"*.csv{suffix}" for suffix in COMPRESSION_SUFFIXES]
+        return sorted(str(csv_file) for pattern in patterns for csv_file in path.glob(pattern))
+    if path.suffix in MANIFEST_SUFFIXES:
+        lines = (line.strip() for line in path.read_text().splitlines())
+        return [str(path.parent / line) for line in lines if line and not line.startswith("#")]
+    if not path.exists():
+        matches = sorted(glob(input_spec))
+        if matches:
+            return matches
+    return [input_spec]
+
+
+def _report_read(file_name: str) -> pd.DataFrame:
+    """Reads a Quicken report csv, its balances in integer cents."""
+    data = pd.read_csv(file_name, header=None, names=REPORT_COLUMNS, dtype=REPORT_DTYPES)
+    data["balance"] = cents_parsed(data["balance"])
+    return data
 
 
 def fetch_accounts(file_name) -> typing.Dict:
     """Function to read and set up raw net worth data for preparation,
     mapping and saving to GnuCash.
+
+    The as of date is taken from the start of the file's name, e.g. 2016_12_31_balances.csv.
     """
-    date_string = string_trimmed_after(file_name, "_", 3)
+    date_string = string_trimmed_after(Path(uncompressed_name(file_name)).stem, "_", 3)
     return {
         "as_of_date": datetime.strptime(date_string, "%Y_%m_%d").date(),
-        "data": pd.read_csv(
-            file_name, header=None, names=["root", "account", "balance"], thousands=","
-        ),
+        "data": _report_read(file_name),
     }
 
 
@@ -37,7 +193,40 @@ def fetch_categories(file_name: str) -> pd.DataFrame:
     mapping and saving to GnuCash.
     """
     # GnuCash refers to category-like information as just another account.
-    return pd.read_csv(file_name, header=None, names=["root", "account", "balance"])
+    return _report_read(file_name)
+
+
+def fetch_resolutions(file_name: str, on_ambiguous: str = "raise") -> Resolutions:
+    """Function to read the rules file of the accounts chosen for ambiguous account names.
+
+    Each row holds a name, the chosen account (empty while pending) and the candidate
+    accounts (none for a name missing from the book). A missing file is read as having no
+    rules.
+    """
+    resolutions = Resolutions(on_ambiguous=on_ambiguous)
+    if not Path(file_name).exists():
+        return resolutions
+
+    rules = pd.read_csv(file_name, dtype=str, keep_default_na=False)
+    for name, account, candidates in rules[RESOLUTION_COLUMNS].itertuples(index=False):
+        resolutions.candidates[name] = candidates.split(CANDIDATE_SEPARATOR) if candidates else []
+        if account:
+            resolutions[name] = account
+    return resolutions
+
+
+def write_resolutions(file_name: str, resolutions: Resolutions) -> None:
+    """Function to write the ambiguous account names of resolutions, chosen or pending,
+    to a rules file for review. Pending names are written with an empty account.
+    """
+    rules = pd.DataFrame(
+        [
+            (name, resolutions.get(name, ""), CANDIDATE_SEPARATOR.join(candidates))
+            for name, candidates in resolutions.candidates.items()
+        ],
+        columns=RESOLUTION_COLUMNS,
+    )
+    rules.sort_values("name").to_csv(file_name, index=False)
 
 
 def create_gnucash_book(filename: str, currency_str: str = "USD", overwrite=False):
@@ -45,53 +234,337 @@ def create_gnucash_book(filename: str, currency_str: str = "USD", overwrite=Fals
     return create_book(filename, currency=currency_str, overwrite=overwrite)
 
 
-def create_accounts(book: Book, accounts_list: pd.DataFrame) -> None:
-    """Add accounts and save book.
-    Sets chart of accounts hierarchy.
+def _commodities_of(book: Book) -> typing.Dict[str, Commodity]:
+    """Function to look up all commodities of the book at once, by mnemonic."""
+    return {cdty.mnemonic: cdty for cdty in book.commodities}
+
+
+def add_commodities(book: Book, commodities_list: list[Commodity2Move]) -> None:
+    """Add the securities not yet in the book, with a single flush."""
+    existing = _commodities_of(book)
+    for cdty in commodities_list:
+        if cdty.mnemonic not in existing:
+            existing[cdty.mnemonic] = Commodity(book=book, **fields_of(cdty))
+    book.flush()
+
+
+def add_prices(book: Book, prices_list: list[Price2Move], batch_size: int = 1000) -> None:
+    """Add prices, flushing them batch_size at a time. A security's price already in the
+    book for the same day is kept.
+
+    Commodities must be in place.
     """
-    for acct in accounts_list:
-        acct.parent = (
-            book.accounts(fullname=acct.parent) if acct.parent != "root" else book.root_account
+    if not prices_list:
+        return
+    commodities = _commodities_of(book)
+    existing = set(  # The days priced of the securities, read with one query, no Price objects
+        book.session.query(Commodity.mnemonic, Price.date)
+        .join(Price.commodity)
+        .filter(Commodity.mnemonic.in_({price.commodity for price in prices_list}))
+    )
+    new_prices = (price for price in prices_list if (price.commodity, price.date) not in existing)
+
+    for count, price in enumerate(new_prices, 1):
+        Price(
+            commodity=commodities[price.commodity],
+            currency=commodities[price.currency],
+            date=price.date,
+            value=price.value,
+            type="transaction",
         )
-        acct.commodity = book.commodities(mnemonic=acct.commodity)
-        Account(**acct.__dict__)
-        book.flush()
+        if count % batch_size == 0:
+            book.flush()
+    book.flush()
 
-    book.save()
 
+class BatchCommits:
+    """Commits the objects added to a book a batch at a time, rather than flushing each.
 
-def add_transactions(book: Book, transactions_list: pd.DataFrame) -> None:
-    """Add balance transactions and save book.
+    With no batch_size, the batch size adapts to the time the commits take: it's doubled
+    after a commit quicker than half COMMIT_SECONDS and halved after one slower than twice
+    that, between 1 and MAX_BATCH_SIZE.
 
-    Chart of accounts must be in place.
+    Inside a checkpoint (see checkpoints.checkpoint), the batches are only flushed, the
+    checkpoint committing them all at once.
     """
 
-    def get_acct_reference_name(name: str):
-        try:
-            ref = book.accounts(name=name)
-        except KeyError:
-            print(f"\nNeed to create a new account: {name}!")
-        return ref
+    def __init__(self, book: Book, batch_size: int | None = None):
+        self.book = book
+        self.adaptive = batch_size is None
+        self.batch_size = FIRST_BATCH_SIZE if batch_size is None else batch_size
+        self.pending = 0
 
-    def get_acct_reference_fullname(fullname: str):
-        try:
-            return book.accounts(fullname=fullname)
-        except KeyError:
-            name = string_trimmed_before(fullname, ":")  # Remove any hierarchy.
-            return get_acct_reference_name(name)
+    def added(self) -> None:
+        """Counts an object added to the book, committing when a batch is complete."""
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        """Commits the objects added since the last commit."""
+        started = perf_counter()
+        save(self.book)
+        seconds = perf_counter() - started
+        if self.adaptive and self.pending == self.batch_size:
+            if seconds < COMMIT_SECONDS / 2:
+                self.batch_size = min(self.batch_size * 2, MAX_BATCH_SIZE)
+            elif seconds > COMMIT_SECONDS * 2:
+                self.batch_size = max(self.batch_size // 2, 1)
+        self.pending = 0
+
+
+def _fullname_of(acct: Account2Move) -> str:
+    return acct.name if acct.parent == "root" else f"{acct.parent}:{acct.name}"
+
+
+def missing_accounts(
+    book: Book,
+    accounts_list: list[Account2Move],
+    account_names: typing.Iterable[str] = (),
+    fullnames: typing.Iterable[str] = (),
+) -> list[Account2Move]:
+    """Function to provide the accounts to create for all of the parents of accounts_list, and
+    the accounts named by account_names (e.g. those of the splits of transactions to add),
+    to be in the book. Names are found as add_transactions finds them: by full name, or
+    else by name.
+
+    fullnames are full names already, e.g. resolved by data_preparation, and are only
+    found by full name: a new account's name may well be that of another one elsewhere.
+
+    The missing accounts of account_names and fullnames are created as named; all other
+    missing ones are parents, made placeholders. Their types are guessed from their names as for
+    Quicken's accounts, or else are those of their nearest parent, or else of the
+    account needing them (else EXPENSE, as most Quicken categories).
+    """
+    registry = account_registry(book)
+    incoming = {_fullname_of(acct): acct.type for acct in accounts_list}
+    incoming_names = {acct.name for acct in accounts_list}
+    needed_by: typing.Dict[str, str | None] = {}  # Missing full name -> type of what needs it
+    is_placeholder: typing.Dict[str, bool] = {}
+
+    def need(fullname: str, needing_type: str | None, placeholder: bool) -> None:
+        for path, _ in hierarchy_from(fullname):
+            if path not in registry and path not in incoming:
+                needed_by.setdefault(path, needing_type)
+                is_placeholder[path] = is_placeholder.get(path, True) and (
+                    placeholder or path != fullname
+                )
+
+    for acct in accounts_list:
+        if acct.parent != "root":
+            need(acct.parent, acct.type, True)
+    for name in set(account_names):
+        if registry.registered_as(name) is None and not (
+            name in incoming or string_trimmed_before(name, ":") in incoming_names
+        ):
+            need(name, None, False)
+    for fullname in set(fullnames):
+        if fullname not in registry and fullname not in incoming:
+            need(fullname, None, False)
+    if not needed_by:
+        return []
+
+    paths = sorted(needed_by, key=lambda path: path.count(":"))  # Parents before children
+    missing = prepared_missing_accounts(paths, [is_placeholder[path] for path in paths])
+
+    def parent_type(fullname: str) -> str | None:
+        for path, levels_up in reversed(hierarchy_from(fullname)):
+            if levels_up and path in registry:
+                return registry.by_fullname[path].type
+            if levels_up and path in incoming:
+                return incoming[path]
+        return None
+
+    for fullname, guessed_type in zip(paths, missing.selected_type):
+        if not isinstance(guessed_type, str):  # No keyword in the name
+            guessed_type = parent_type(fullname) or needed_by[fullname] or "EXPENSE"
+        incoming[fullname] = guessed_type  # The type of any missing children's parent
+    missing["selected_type"] = [incoming[path] for path in paths]
+
+    print(f"Creating {len(paths)} missing accounts.")
+    return mapped_accounts(missing)
+
+
+def create_accounts(
+    book: Book,
+    accounts_list: list[Account2Move],
+    account_names: typing.Iterable[str] = (),
+    fullnames: typing.Iterable[str] = (),
+) -> None:
+    """Add accounts and save book.
+    Sets chart of accounts hierarchy.
+
+    Missing parents, and the missing accounts of account_names and fullnames (e.g. those of
+    the splits of transactions to add next), are created too: see missing_accounts.
+
+    The accounts are created a level of the hierarchy at a time, top level first, each
+    level flushed once, so parents needn't be listed before their children. Parents are
+    looked up in the book's AccountRegistry.
+    """
+    levels: typing.Dict[int, list[Account2Move]] = {}
+    for acct in accounts_list + missing_accounts(book, accounts_list, account_names, fullnames):
+        depth = 0 if acct.parent == "root" else acct.parent.count(":") + 1
+        levels.setdefault(depth, []).append(acct)
+
+    commodities = _commodities_of(book)
+    registry = account_registry(book)  # Knows the accounts created here before they're flushed
+    root = book.root_account
+    with book.session.no_autoflush:
+        for depth in sorted(levels):
+            for acct in levels[depth]:
+                fullname = _fullname_of(acct)
+                acct.parent = root if acct.parent == "root" else registry.account(acct.parent)
+                acct.commodity = commodities[acct.commodity]
+                registry.add(Account(**fields_of(acct)), fullname)
+            book.flush()
+
+    save(book)
+
+
+def add_transactions(
+    book: Book,
+    transactions_list: typing.Iterable[Transaction2Move],
+    batch_size: int | None = None,
+) -> None:
+    """Add balance transactions and save book, committing them batch_size at a time (by
+    default, in batches adapting to the time taken).
+
+    The transactions may come from any iterable: a list, a TransactionBatch or a generator
+    like iter_mapped_transactions, each being used once.
+
+    Chart of accounts must be in place.
+    """
+    registry = account_registry(book)
+    commodities = _commodities_of(book)
 
     def build_split(split_params: Split2Move):
         """Builds Split entries for transaction being added to book."""
-        split_params.account = get_acct_reference_fullname(split_params.account)
+        split_params.account = registry.account_named(split_params.account)
+
+        return Split(**fields_of(split_params))
+
+    commits = BatchCommits(book, batch_size)
+    with book.session.no_autoflush:
+        for trans in transactions_list:
+            trans.splits = [build_split(split) for split in trans.splits]
+            trans.currency = commodities[trans.currency]
 
-        return Split(**split_params.__dict__)
+            Transaction(**fields_of(trans))
+            commits.added()
 
-    for trans in transactions_list:
-        trans.splits = [build_split(split) for split in trans.splits]
-        trans.currency = book.commodities(mnemonic=trans.currency)
+    commits.commit()
+
+
+def _split_accounts(book: Book, names: np.ndarray) -> np.ndarray:
+    """Function to look up the account of each split as add_transactions does, by full name
+    or else by name, each distinct name once.
+    """
+    registry = account_registry(book)
+    codes, distinct_names = pd.factorize(names)
+    accounts = [registry.account_named(name) for name in distinct_names]
+    return np.array(accounts, dtype=object)[codes]
 
-        Transaction(**trans.__dict__)
 
-        book.flush()
+def bulk_add_transactions(
+    book: Book, transactions: TransactionBatch, batch_size: int = 10_000
+) -> None:
+    """Add a batch of mapped transactions and save book, like add_transactions, but inserting
+    rows straight into the transactions, splits and slots tables rather than building
+    piecash objects. Rows are inserted batch_size transactions at a time.
+
+    Splits can only be in accounts of the transactions' currency (no shares), as with
+    mapped_transactions; their values and quantities are the cents over 100.
+
+    Chart of accounts must be in place.
+    """
+    book.flush()
+    currency = _commodities_of(book)[transactions.currency]
+    accounts = _split_accounts(book, transactions.split_account)
+    for acct in set(accounts):
+        if acct.placeholder:
+            raise GncValidationError(f"Account '{acct}' used in the transaction is a placeholder")
+        if acct.commodity != currency:
+            raise GncValidationError(f"Account '{acct}' isn't in {currency.mnemonic}")
+    split_start = transactions.split_start
+    if len(transactions) and np.add.reduceat(transactions.split_value, split_start[:-1]).any():
+        raise GncImbalanceError("Failure. Transactions not balanced on their value")
+
+    account_guids = np.array([acct.guid for acct in accounts], dtype=object)
+    enter_date = transactions.enter_date.replace(microsecond=0)
+    for start in range(0, len(transactions), batch_size):
+        end = min(start + batch_size, len(transactions))
+        posted = transactions.post_date[start:end]
+        tran_guids = [uuid4().hex for _ in range(end - start)]
+        book.session.execute(
+            Transaction.__table__.insert(),
+            [
+                {
+                    "guid": guid,
+                    "currency_guid": currency.guid,
+                    "num": num,
+                    "post_date": post_date,
+                    "enter_date": enter_date,
+                    "description": description,
+                }
+                for guid, num, post_date, description in zip(
+                    tran_guids,
+                    transactions.num[start:end],
+                    posted,
+                    transactions.description[start:end],
+                )
+            ],
+        )
+        book.session.execute(
+            Slot.__table__.insert(),
+            [
+                {
+                    "obj_guid": guid,
+                    "name": "date-posted",
+                    "slot_type": KVP_Type.KVP_TYPE_GDATE,
+                    "gdate_val": post_date,
+                }
+                for guid, post_date in zip(tran_guids, posted)
+            ],
+        )
+        book.session.execute(
+            Slot.__table__.insert(),
+            [
+                {
+                    "obj_guid": guid,
+                    "name": "notes",
+                    "slot_type": KVP_Type.KVP_TYPE_STRING,
+                    "string_val": notes,
+                }
+                for guid, notes in zip(tran_guids, transactions.notes[start:end])
+            ],
+        )
+
+        splits = slice(split_start[start], split_start[end])
+        split_tran_guids = np.repeat(
+            np.array(tran_guids, dtype=object), np.diff(split_start[start : end + 1])
+        )
+        book.session.execute(
+            Split.__table__.insert(),
+            [
+                {
+                    "guid": uuid4().hex,
+                    "tx_guid": tran_guid,
+                    "account_guid": account_guid,
+                    "memo": memo,
+                    "action": "",
+                    "reconcile_state": "n",
+                    "value_num": cents,
+                    "value_denom": 100,
+                    "quantity_num": cents,
+                    "quantity_denom": 100,
+                }
+                for tran_guid, account_guid, memo, cents in zip(
+                    split_tran_guids,
+                    account_guids[splits],
+                    transactions.split_memo[splits],
+                    transactions.split_value[splits].tolist(),
+                )
+            ],
+        )
 
-    book.save()
+    save(book)
@@ -0,0 +1,119 @@
+"""
+Contains the FITIDs of the transactions of a GnuCash book (kept in their num), read with
+a single query, and the stage dropping the prepared transactions already in the book, so
+importing an export again, or overlapping exports, doesn't post anything twice.
+
+Transactions exported without a FITID (investment ones, all of them) are given one, a
+surrogate computed from the transaction, so that they're found in the book the same way.
+"""
+from collections import Counter
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from piecash import Book, Transaction
+from sqlalchemy import select
+
+FITIDS_KEY = "move2gnucash_fitids"  # Of the FITIDs in their book's session info
+TRANSACTION_KINDS = ["non_invest", "invest"]  # Of the prepared transactions to write
+SURROGATE_PREFIX = "m2g-"  # Of the FITIDs given to transactions exported without one
+SURROGATE_FIELDS = [  # Identifying a transaction exported without a FITID
+    "tran_date",
+    "tran_description",
+    "account",
+    "acct_from",
+    "symbol",
+    "shares",
+    "tran_amount",
+    "invest_amount",
+    "tran_memo",
+]
+
+
+def imported_fitids(book: Book) -> set[str]:
+    """Function to provide the set of the FITIDs of the transactions of a book, read on
+    first use and then shared. Blank ones aren't FITIDs.
+    """
+    info = book.session.info
+    if FITIDS_KEY not in info:
+        book.flush()
+        nums = Transaction.__table__.c.num
+        rows = book.session.execute(select([nums]).distinct().where(nums != "")).fetchall()
+        info[FITIDS_KEY] = {num for num, in rows}
+    return info[FITIDS_KEY]
+
+
+def surrogate_fitids(
+    staged_data: pd.DataFrame, occurrences: Counter[int] | None = None
+) -> pd.Series:
+    """Function to provide a FITID for each staged row without one: a hash of the fields
+    identifying its transaction, and of how many identical rows come before it in its file.
+
+    The rows of a Quicken split group share the FITID of its first row.
+
+    Staging a file a chunk at a time, the same occurrences (identical rows counted by hash)
+    are passed for each of its chunks, in order, and updated here, so identical rows on
+    either side of a chunk boundary are told apart. Resuming an import, they're counted
+    from the rows already committed first. The same row then gets the same FITID however
+    its file is imported: whole, in chunks or resumed.
+    """
+    occurrences = Counter() if occurrences is None else occurrences
+    identity = staged_data[SURROGATE_FIELDS].astype(object).astype(str)
+    identity["shares"] = pd.to_numeric(staged_data.shares, errors="coerce").fillna(0.0)
+    hashes = pd.util.hash_pandas_object(identity, index=False)
+    before = hashes.groupby(hashes.to_numpy()).cumcount() + hashes.map(occurrences).astype(int)
+    occurrences.update(hashes.value_counts().to_dict())
+    hashes = pd.util.hash_pandas_object(
+        pd.DataFrame({"hash": hashes.to_numpy(), "occurrence": before.to_numpy()}),
+        index=False,
+    )
+
+    is_multi = staged_data.tran_split.eq("S").to_numpy()
+    if is_multi.any():
+        multi = staged_data.loc[is_multi]
+        hashes[is_multi] = (
+            hashes[is_multi]
+            .groupby([multi.tran_date.to_numpy(), multi.tran_description.to_numpy()], sort=False)
+            .transform("first")
+        )
+    surrogates = pd.Series(
+        [f"{SURROGATE_PREFIX}{key:016x}" for key in hashes.to_numpy()],
+        index=staged_data.index,
+        dtype=object,
+    )
+    return staged_data.fitid.where(staged_data.fitid.ne(""), surrogates)
+
+
+def _imported_rows(fitids: set[str], nums: pd.Series) -> np.ndarray:
+    """Function to flag the rows whose num is a FITID in fitids, looking each distinct
+    num up once.
+    """
+    codes, distinct_nums = pd.factorize(nums)
+    is_imported = np.fromiter(map(fitids.__contains__, distinct_nums), bool, len(distinct_nums))
+    return np.append(is_imported, False)[codes]  # Code -1 (missing) is the last
+
+
+def new_transactions(book: Book, prepared_data: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """Function to provide the prepared non-investment and investment transactions without
+    the rows of those whose FITID (tran_num) is in the book already, reporting how many
+    were skipped. The rows of a Quicken split group share their FITID, so they're kept or
+    dropped together. Rows without a FITID (nor surrogate) are always kept.
+
+    The FITIDs kept are added to the book's, as they're about to be written: the same
+    FITID in a later chunk or file of the import is skipped too. Anything else in
+    prepared_data (e.g. the rows skipped as not imported yet) is provided unchanged.
+    """
+    fitids = imported_fitids(book)
+    new_data = dict(prepared_data)
+    for kind in TRANSACTION_KINDS:
+        transactions = prepared_data[kind]
+        nums = transactions.tran_num.where(transactions.tran_num.ne(""))
+        is_imported = _imported_rows(fitids, nums)
+        if is_imported.any():
+            print(
+                f"Skipped {nums[is_imported].nunique()} {kind.replace('_', '-')} transactions"
+                f" ({is_imported.sum()} rows) already in the book, by FITID."
+            )
+        new_data[kind] = transactions.loc[~is_imported]
+        fitids.update(nums[~is_imported].dropna())
+    return new_data
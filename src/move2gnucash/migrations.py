@@ -2,27 +2,57 @@
 Module used by app to handle the various user actions
 taken to migrate data to GnuCash book.
 """
-from typing import Dict, NewType
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, NewType
 
 import pandas as pd
 from piecash import Book
 
-from move2gnucash.data_maps import mapped_accounts, mapped_transactions
+from move2gnucash.account_registry import account_registry
+from move2gnucash.checkpoints import Progress, checkpoint, progress_of
+from move2gnucash.data_maps import (
+    iter_mapped_transactions,
+    mapped_accounts,
+    mapped_investments,
+    mapped_transactions,
+)
 from move2gnucash.data_preparation import (
+    opening_balance_date,
     prepared_balances,
     prepared_category_accounts,
     prepared_transactions,
+    Resolutions,
+    resolved_transactions,
+    SHARE_ACTIONS,
+    staged_transactions,
+    whole_split_groups,
 )
+from move2gnucash.field_mappings import use_field_mappings_file, user_field_mappings_file
 from move2gnucash.file_operations import (
+    add_commodities,
+    add_prices,
     add_transactions,
+    bulk_add_transactions,
     create_accounts,
     fetch_accounts,
     fetch_categories,
     fetch_csv_data,
+    fetch_resolutions,
+    write_resolutions,
 )
+from move2gnucash.fitids import TRANSACTION_KINDS, new_transactions
+from move2gnucash.stage_cache import StageCache, content_key, source_key, stage_key
 
 NewBookData = NewType("NewBookData", Dict)
 
+CHECKPOINT_ROWS = 5_000  # About the most rows of a file read whole committed at once
+IMPORTED_ACTIONS_KEY = stage_key(*sorted(SHARE_ACTIONS))  # Of the investment actions imported
+
 
 def _new_book_data(book_data: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     return {
@@ -31,39 +61,370 @@ def _new_book_data(book_data: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     }
 
 
-def opening_balances(data_filename: str, book: Book) -> None:
-    """Do something"""
-    raw_data = fetch_accounts(data_filename)
+def _stage_keys(
+    cache: StageCache | None, data_filename: str, *prepare_inputs: str, engine: str | None = None
+) -> Dict[str, str]:
+    """Provides the cache keys of the fetch, prepare and map stages. Each stage's key
+    covers the key of the stage before it, so a change invalidates all later stages.
+
+    The fetch key covers the csv parser (engine) too, as each types some columns its own way.
+    """
+    if cache is None:
+        return dict.fromkeys(["fetch", "prepare", "map"], "")
+
+    fetch_key = stage_key(source_key(data_filename), Path(data_filename).name, engine or "c")
+    prepare_key = stage_key(fetch_key, *prepare_inputs)
+    return {"fetch": fetch_key, "prepare": prepare_key, "map": stage_key(prepare_key)}
+
+
+def _book_key(book: Book) -> str:
+    """Provides a key of the book state that transaction preparation depends on."""
+    accounts = sorted(account_registry(book).fullnames(placeholders=False))
+    return stage_key(str(opening_balance_date(book)), *accounts)
+
+
+def _mapped_book_data(prepared_data: Dict[str, pd.DataFrame], streamed=False) -> Dict[str, Any]:
+    """Maps prepared transactions. Streamed, the non-investment ones are mapped while being
+    added to the book, a batch at a time, and can't be cached.
+
+    The names of all of the accounts of the non-investment splits (full names, as resolved)
+    are kept too, so missing ones can be created before any transaction is written.
+    """
+    non_invest = prepared_data["non_invest"]
+    return {
+        "non_invest": (iter_mapped_transactions if streamed else mapped_transactions)(non_invest),
+        "account_names": list(
+            pd.unique(pd.concat([non_invest.tran_acct_from, non_invest.tran_acct_to]).dropna())
+        ),
+        "invest": mapped_investments(prepared_data["invest"]),
+    }
+
+
+def _add_book_data(book: Book, mapped_data: Dict[str, Any], bulk=False) -> None:
+    """Adds mapped transactions to the book, investment ones with the securities, holding
+    accounts and prices they need first. With bulk, the non-investment ones (a
+    TransactionBatch) are inserted in bulk.
+
+    The holding accounts, and any other missing account of the transactions, are all
+    created before any transaction is written.
+    """
+    investments = mapped_data["invest"]
+    existing_accounts = account_registry(book)
+    add_commodities(book, investments["commodities"])
+    create_accounts(
+        book,
+        [
+            acct
+            for acct in investments["accounts"]
+            if f"{acct.parent}:{acct.name}" not in existing_accounts
+        ],
+        fullnames=mapped_data["account_names"]
+        + investments["transactions"].split_account.tolist(),
+    )
+
+    if bulk:
+        bulk_add_transactions(book, mapped_data["non_invest"])
+    else:
+        add_transactions(book, mapped_data["non_invest"])
+    add_prices(book, investments["prices"])
+    add_transactions(book, investments["transactions"])
+
+
+def _rules_key(resolutions: Resolutions) -> str:
+    """Provides a key of the accounts chosen for ambiguous names, e.g. from a rules file."""
+    chosen = (
+        f"{name}={resolutions[name]}" for name in resolutions.candidates if name in resolutions
+    )
+    return stage_key(resolutions.on_ambiguous, *sorted(chosen))
+
+
+def _cached(cache: StageCache | None, stage: str, key: str, compute: Callable[[], Any]):
+    """Runs a stage of the pipeline, through the stage cache when one is used."""
+    return compute() if cache is None else cache.fetched(stage, key, compute)
+
+
+def _progress_to_resume(book: Book, file_key: str, data_filename: str) -> Progress | None:
+    """Provides the progress recorded in the book of a file to resume its import from, or
+    None if it was imported already.
+
+    A file imported with rows skipped (e.g. investment actions not imported yet) is imported
+    again from its start once more investment actions are imported (IMPORTED_ACTIONS_KEY
+    changed), to pick them up: its transactions in the book are skipped by FITID.
+    """
+    progress = progress_of(book, file_key)
+    if progress.complete and progress.skipped and progress.actions != IMPORTED_ACTIONS_KEY:
+        print(f"{data_filename} was imported but for {progress.skipped} rows, imported again.")
+        return Progress()
+    if progress.complete:
+        print(f"{data_filename} was imported already, skipped.")
+        return None
+    return progress
+
+
+def _committed_occurrences(
+    data_filename: str, rows: int, balance_date: date, engine: str | None = None
+) -> Counter[int]:
+    """Provides the occurrences of identical rows among the first rows of a file, already
+    committed, to resume its import with (see surrogate_fitids).
+
+    Those rows are read and staged a chunk of (at most) CHECKPOINT_ROWS rows at a time,
+    so resuming holds no more of the file than importing does. pyarrow, which can't chunk,
+    reads the file whole, as it does importing it.
+    """
+    occurrences: Counter[int] = Counter()
+    if not rows:
+        return occurrences
+    if engine == "pyarrow":
+        raw_chunks = [fetch_csv_data(data_filename, engine=engine)]
+    else:
+        raw_chunks = fetch_csv_data(data_filename, chunk_size=min(rows, CHECKPOINT_ROWS))
+    for raw_chunk in raw_chunks:
+        if raw_chunk.index[0] >= rows:
+            break
+        staged_transactions(raw_chunk.loc[: rows - 1], balance_date, occurrences)
+    return occurrences
+
 
-    prepared_data = prepared_balances(raw_data)
+def _checkpoint_chunks(raw_data: pd.DataFrame) -> Iterator[pd.DataFrame]:
+    """Provides the rows of a csv file read whole in chunks of about CHECKPOINT_ROWS rows,
+    Quicken split groups kept whole, each to be committed to the book as a checkpoint.
+    """
+    return whole_split_groups(
+        raw_data.iloc[start : start + CHECKPOINT_ROWS]
+        for start in range(0, len(raw_data), CHECKPOINT_ROWS)
+    )
 
-    res = _new_book_data(prepared_data)
 
-    create_accounts(book, res["accounts"])
+def opening_balances(data_filename: str, book: Book, cache: StageCache | None = None) -> None:
+    """Adds accounts and their opening balances to the book."""
+    keys = _stage_keys(cache, data_filename)
+
+    def raw_data():
+        return _cached(cache, "fetch", keys["fetch"], lambda: fetch_accounts(data_filename))
+
+    def prepared_data():
+        return _cached(cache, "prepare", keys["prepare"], lambda: prepared_balances(raw_data()))
+
+    res = _cached(cache, "map", keys["map"], lambda: _new_book_data(prepared_data()))
+
+    create_accounts(book, res["accounts"], res["transactions"].split_account)
 
     add_transactions(book, res["transactions"])
-    book.save()
 
 
-def category_accounts(data_filename: str, book: Book) -> None:
+def category_accounts(data_filename: str, book: Book, cache: StageCache | None = None) -> None:
     """Adds accounts reflecting (income and expense) accounts to the book."""
-    raw_data: pd.DataFrame = fetch_categories(data_filename)
+    keys = _stage_keys(cache, data_filename)
 
-    prepared_data: pd.DataFrame = prepared_category_accounts(raw_data)
+    def raw_data() -> pd.DataFrame:
+        return _cached(cache, "fetch", keys["fetch"], lambda: fetch_categories(data_filename))
 
-    mapped_data: list = mapped_accounts(prepared_data)
+    def prepared_data() -> pd.DataFrame:
+        return _cached(
+            cache, "prepare", keys["prepare"], lambda: prepared_category_accounts(raw_data())
+        )
+
+    mapped_data: list = _cached(cache, "map", keys["map"], lambda: mapped_accounts(prepared_data()))
 
     create_accounts(book, mapped_data)
-    book.save()
 
 
-def transactions(data_filename: str, book: Book) -> None:
-    """Add double entry transactions (usually income or expense) to the book."""
-    raw_data: pd.DataFrame = fetch_csv_data(data_filename)
+def transactions(
+    data_filename: str,
+    book: Book,
+    chunk_size: int | None = None,
+    engine: str | None = None,
+    cache: StageCache | None = None,
+    resolutions: Resolutions | None = None,
+    bulk: bool = False,
+    resume: bool = False,
+) -> None:
+    """Add double entry transactions (usually income or expense) to the book.
+
+    With a chunk_size, the csv is streamed: each chunk of (about) chunk_size rows is
+    prepared, mapped and committed to the book before the next one is read. Streamed
+    imports don't use the stage cache, which would hold the whole file. Otherwise the csv
+    is read whole, and then goes through the same steps CHECKPOINT_ROWS rows at a time.
+    With the stage cache, all of its chunks are prepared, and then mapped, before any is
+    committed, each stage cached as a single entry.
+
+    Each chunk is committed as a checkpoint, recording the rows of the file committed so
+    far in the book, and how many of them were skipped as not imported yet. With resume,
+    the rows already committed are skipped: the import goes on from the last checkpoint,
+    or not at all if it was complete (see _progress_to_resume). Imports resumed part
+    way through a file don't use the stage cache.
+
+    Account names already in resolutions, e.g. read from a rules file, aren't resolved again.
+
+    Transactions whose FITID is in the book already are skipped (see new_transactions).
+    What's left of a chunk of which some were skipped is mapped again, uncached.
+
+    With bulk, non-investment transactions are inserted straight into the book's tables
+    (see bulk_add_transactions), mapped a whole chunk at a time.
+    """
+    resolutions = Resolutions() if resolutions is None else resolutions
+    file_key = content_key(data_filename)
+    progress = _progress_to_resume(book, file_key, data_filename) if resume else Progress()
+    if progress is None:
+        return
+    if progress.rows or chunk_size is not None:
+        cache = None
+    if progress.rows:
+        print(f"Resuming {data_filename} after its first {progress.rows} rows.")
+
+    keys = _stage_keys(
+        cache,
+        data_filename,
+        *([_book_key(book), _rules_key(resolutions), str(CHECKPOINT_ROWS)] if cache else []),
+        engine=engine,
+    )
+
+    def raw_chunks() -> Iterator[pd.DataFrame]:
+        if chunk_size is not None:
+            return whole_split_groups(
+                fetch_csv_data(data_filename, chunk_size=chunk_size, first_row=progress.rows)
+            )
+        file_data = _cached(
+            cache,
+            "fetch",
+            keys["fetch"],
+            lambda: fetch_csv_data(data_filename, engine=engine, first_row=progress.rows),
+        )
+        return _checkpoint_chunks(file_data)
+
+    def prepared_chunks() -> Iterator[tuple[Dict[str, pd.DataFrame], int]]:
+        balance_date = opening_balance_date(book)
+        occurrences = _committed_occurrences(data_filename, progress.rows, balance_date, engine)
+        for raw_data in raw_chunks():  # With the rows of the file committed once it is
+            yield (
+                prepared_transactions(book, raw_data, resolutions, occurrences, balance_date),
+                raw_data.index[-1] + 1,
+            )
+
+    if cache is None:
+        chunks, mapped_chunks = prepared_chunks(), None
+    else:  # Each stage cached as one entry, of all of the chunks
+        chunks = _cached(cache, "prepare", keys["prepare"], lambda: list(prepared_chunks()))
+        mapped_chunks = _cached(
+            cache,
+            "map",
+            keys["map"],
+            lambda: [_mapped_book_data(all_data) for all_data, _ in chunks],
+        )
+
+    for chunk, (all_data, rows) in enumerate(chunks):
+        new_data = new_transactions(book, all_data)
+        if mapped_chunks is not None and all(
+            len(new_data[kind]) == len(all_data[kind]) for kind in TRANSACTION_KINDS
+        ):
+            mapped_data = mapped_chunks[chunk]
+        else:
+            mapped_data = _mapped_book_data(new_data, streamed=not bulk)
+
+        progress.rows = rows
+        progress.skipped += len(all_data["skipped"])
+        progress.actions = IMPORTED_ACTIONS_KEY
+        with checkpoint(book, file_key, data_filename, progress):
+            _add_book_data(book, mapped_data, bulk)
+    progress.complete = True
+    with checkpoint(book, file_key, data_filename, progress):
+        pass
+
+
+def _staged_file(
+    data_filename: str, balance_date: date, engine: str | None, first_row: int = 0
+) -> list[tuple[pd.DataFrame, int]]:
+    """Reads and stages one csv of transactions, in chunks to be committed as checkpoints:
+    provides each staged chunk with the rows of the file committed once it is. Run in the
+    worker processes.
+    """
+    occurrences = _committed_occurrences(data_filename, first_row, balance_date, engine)
+    raw_data = fetch_csv_data(data_filename, engine=engine, first_row=first_row)
+    return [
+        (staged_transactions(raw_chunk, balance_date, occurrences), raw_chunk.index[-1] + 1)
+        for raw_chunk in _checkpoint_chunks(raw_data)
+    ]
+
+
+def transactions_from_files(
+    data_filenames: list[str],
+    book: Book,
+    workers: int | None = None,
+    engine: str | None = None,
+    resolutions: Resolutions | None = None,
+    bulk: bool = False,
+    resume: bool = False,
+) -> None:
+    """Add double entry transactions from several csv files to the book.
+
+    The files are read and staged in parallel by a pool of worker processes (one per
+    core by default), no more files than workers ahead of the one being written. Account
+    resolution, mapping and writing happen here, one file at a time in the given order, so
+    the book ends up as if the files were imported one after another. Each file is
+    committed CHECKPOINT_ROWS rows at a time, as checkpoints. Transactions already in the
+    book are skipped by FITID, and bulk and resume work, as for transactions. The stage
+    cache isn't used.
+    """
+    balance_date = opening_balance_date(book)
+    resolutions = Resolutions() if resolutions is None else resolutions  # Shared by the files
+    pending = []
+    for data_filename in data_filenames:
+        file_key = content_key(data_filename)
+        progress = _progress_to_resume(book, file_key, data_filename) if resume else Progress()
+        if progress is not None:
+            pending.append((data_filename, file_key, progress))
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=use_field_mappings_file,  # Workers may not inherit the user's choice
+        initargs=(user_field_mappings_file(),),
+    ) as executor:
+
+        def staging(entry: tuple[str, str, Progress]) -> tuple[tuple[str, str, Progress], Future]:
+            data_filename, _, progress = entry
+            return entry, executor.submit(
+                _staged_file, data_filename, balance_date, engine, progress.rows
+            )
+
+        # Only as many files as workers are staged ahead of the one being written, so
+        # staged files don't pile up when writing is slower than staging.
+        files = iter(pending)
+        staging_files = deque(map(staging, islice(files, workers)))
+        while staging_files:  # In file order, as each becomes ready
+            (data_filename, file_key, progress), staged_file = staging_files.popleft()
+            staged_chunks = staged_file.result()
+            staging_files.extend(map(staging, islice(files, 1)))
+            for staged_data, rows in staged_chunks:
+                prepared_data = new_transactions(
+                    book, resolved_transactions(book, staged_data, resolutions)
+                )
+                progress.rows = rows
+                progress.skipped += len(prepared_data["skipped"])
+                progress.actions = IMPORTED_ACTIONS_KEY
+                with checkpoint(book, file_key, data_filename, progress):
+                    _add_book_data(book, _mapped_book_data(prepared_data, streamed=not bulk), bulk)
+            progress.complete = True
+            with checkpoint(book, file_key, data_filename, progress):
+                pass
+
+
+def ambiguous_accounts(
+    data_filenames: list[str], book: Book, rules_filename: str, engine: str | None = None
+) -> Dict[str, list[str]]:
+    """Collects the account names of csv files of transactions matching several accounts of
+    the book, or none, into a rules file, without asking about them or changing the book.
 
-    prepared_data: pd.DataFrame = prepared_transactions(book, raw_data)
+    Names already in the rules file keep their chosen accounts; the others are added with
+    an empty account, to be chosen by editing the file before importing with it. Returns
+    the names still to be chosen, with their candidate accounts.
+    """
+    resolutions = fetch_resolutions(rules_filename, on_ambiguous="collect")
+    balance_date = opening_balance_date(book)
 
-    mapped_data: list = mapped_transactions(prepared_data)
+    for data_filename in data_filenames:
+        for staged_data, _ in _staged_file(data_filename, balance_date, engine):
+            resolved_transactions(book, staged_data, resolutions)
 
-    add_transactions(book, mapped_data)
-    book.save()
+    write_resolutions(rules_filename, resolutions)
+    return resolutions.pending
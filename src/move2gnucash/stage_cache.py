@@ -0,0 +1,112 @@
+"""
+Contains the on-disk cache of the outputs of the fetch -> prepare -> map stages,
+so re-running an unchanged import skips straight to the first stage whose inputs
+changed.
+
+Entries are keyed by content: a hash of the input file, the field mappings in use and
+the package itself (version and source), plus whatever else a stage depends on.
+"""
+from functools import cache
+import hashlib
+from importlib.metadata import PackageNotFoundError, version
+import os
+from pathlib import Path
+import pickle
+import tempfile
+import typing
+
+from move2gnucash.field_mappings import field_mappings_text
+
+PACKAGE_DIR = Path(__file__).parent
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "move2gnucash"
+READ_BLOCK_SIZE = 1 << 20
+
+
+def _file_digest(file_name, digest) -> None:
+    with open(file_name, "rb") as file:
+        for block in iter(lambda: file.read(READ_BLOCK_SIZE), b""):
+            digest.update(block)
+
+
+@cache
+def _package_digest() -> str:
+    """Hash of the package version and source, so code changes invalidate entries."""
+    try:
+        package_version = version("move2gnucash")
+    except PackageNotFoundError:  # Running from a source checkout
+        package_version = "unknown"
+
+    digest = hashlib.sha256(package_version.encode())
+    for source in sorted(PACKAGE_DIR.glob("*.py")):
+        _file_digest(source, digest)
+    return digest.hexdigest()
+
+
+def stage_key(*parts: str) -> str:
+    """Function to combine the parts a stage depends on into one cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def source_key(file_name: str) -> str:
+    """Function providing the key of everything a fetched csv depends on: its content,
+    the csv field mappings and the package.
+    """
+    digest = hashlib.sha256(_package_digest().encode())
+    digest.update(field_mappings_text().encode())
+    _file_digest(file_name, digest)
+    return digest.hexdigest()
+
+
+def content_key(file_name: str) -> str:
+    """Function providing the key of the content of a file, whatever reads it."""
+    digest = hashlib.sha256()
+    _file_digest(file_name, digest)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Class to store and retrieve pickled stage outputs in a directory.
+
+    Only the max_entries most recently used entries are kept.
+    """
+
+    def __init__(self, directory: str | Path = DEFAULT_CACHE_DIR, max_entries: int = 32):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, stage: str, key: str) -> Path:
+        return self.directory / f"{stage}-{key}.pickle"
+
+    def fetched(self, stage: str, key: str, compute: typing.Callable[[], typing.Any]):
+        """Returns the cached output of a stage, or computes and caches it."""
+        path = self._path(stage, key)
+        try:
+            with open(path, "rb") as file:
+                result = pickle.load(file)
+            os.utime(path)  # Marks the entry as recently used
+            return result
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+
+        result = compute()
+        self._stored(path, result)
+        self._evicted()
+        return result
+
+    def _stored(self, path: Path, result) -> None:
+        # Written aside and renamed, so an interrupted run never leaves a partial entry.
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file.name, path)
+
+    def _evicted(self) -> None:
+        entries = sorted(
+            self.directory.glob("*.pickle"), key=lambda entry: entry.stat().st_mtime, reverse=True
+        )
+        for entry in entries[self.max_entries :]:
+            entry.unlink(missing_ok=True)
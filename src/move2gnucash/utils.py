@@ -3,12 +3,106 @@ Utility functions used in Move2GnuCash.
 
 Also being used to support mocking.
 """
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime
 from typing import Literal, LiteralString
 
+import numpy as np
 from numpy import NaN
-from pandas import Series
+from pandas import array, factorize, Int64Dtype, NaT, Series, to_datetime
+from pandas.api.types import is_numeric_dtype
+
+DATE_FORMAT = "%m/%d/%Y"  # Of the dates in Quicken's csv exports
+
+# An amount of money, e.g. "1,234.50", "-$1,234.50" or "($1,234.50)": an optional opening
+# parenthesis, sign and currency symbol, then the units with thousands separators and the
+# fraction.
+MONEY_PATTERN = (
+    r"^\s*(?P<opening>\()?\s*(?P<sign>[-+])?\s*[^\d\s.,()+-]*\s*(?P<sign_after>-)?\s*"
+    r"(?P<units>\d[\d,]*)?(?:\.(?P<fraction>\d*))?\s*(?P<closing>\))?\s*$"
+)
+
+
+def dates_parsed(dates: Series, date_format: str = DATE_FORMAT) -> Series:
+    """Function to parse a Series of date strings into datetimes, each distinct string once.
+
+    Exports repeat each date many times, and formats without zero padding (like Quicken's)
+    are parsed one string at a time by to_datetime. Already parsed dates are kept.
+    """
+    codes, distinct_dates = factorize(dates)
+    parsed = to_datetime(distinct_dates, format=date_format)
+    return Series(
+        parsed.take(codes, allow_fill=True, fill_value=NaT), index=dates.index, name=dates.name
+    )
+
+
+def _cents_of_strings(amounts: Series) -> np.ndarray:
+    """Function to parse strings matching MONEY_PATTERN into cents, rounding any further
+    digits half up. Raises ValueError for those not matching.
+    """
+    parts = amounts.str.extract(MONEY_PATTERN)
+    parts["fraction"] = parts.fraction.fillna("")
+    invalid = (
+        (parts.units.isna() & parts.fraction.eq(""))
+        | (parts.opening.isna() != parts.closing.isna())
+        | (parts.sign.notna() & parts.sign_after.notna())
+    )
+    if invalid.any():
+        raise ValueError(f"Failure. Not amounts of money: {amounts[invalid].tolist()}")
+
+    units = parts.units.fillna("0").str.replace(",", "", regex=False).astype(np.int64)
+    thousandths = (parts.fraction + "000").str[:3].astype(np.int64)
+    cents = units * 100 + thousandths // 10 + (thousandths % 10 >= 5)
+    negative = parts.opening.notna() | parts.sign.eq("-") | parts.sign_after.notna()
+    return np.where(negative, -cents, cents)
+
+
+def cents_parsed(amounts: Series) -> Series:
+    """Function to parse a Series of amounts of money into integer cents (minor units),
+    each distinct amount once, as the nullable Int64 dtype. Blanks are missing.
+
+    Strings may have a currency symbol, thousands separators and a sign or parentheses
+    for negatives: "($1,234.50)" is -123450. Numbers are taken by their shortest decimal
+    form, so 24.95 is 2495 exactly. Amounts already of the Int64 dtype are taken to be cents.
+    """
+    if isinstance(amounts.dtype, Int64Dtype):
+        return amounts
+    codes, distinct_amounts = factorize(amounts)
+    if is_numeric_dtype(distinct_amounts.dtype):
+        distinct_amounts = [np.format_float_positional(amount) for amount in distinct_amounts]
+    distinct = Series(distinct_amounts, dtype=object).astype(str).str.strip()
+    blank = distinct.eq("").to_numpy()
+    cents = np.zeros(len(distinct), dtype=np.int64)
+    cents[~blank] = _cents_of_strings(distinct[~blank])
+    parsed = array(np.append(cents, 0), dtype="Int64")
+    parsed[np.append(blank, True)] = None  # The last for missing amounts, whose code is -1
+    return Series(parsed.take(codes), index=amounts.index, name=amounts.name)
+
+
+def decimal_from_cents(cents: int) -> Decimal:
+    """Function to convert integer cents into a Decimal of two places, exactly."""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def decimals_from_cents(cents: np.ndarray) -> np.ndarray:
+    """Function to convert an array of integer cents into Decimals, each distinct amount once."""
+    codes, distinct_cents = factorize(cents)
+    return np.array([decimal_from_cents(c) for c in distinct_cents], dtype=object)[codes]
+
+
+def decimals_of(amounts: np.ndarray, places: int) -> np.ndarray:
+    """Function to convert an array of float amounts into Decimals of places places, each
+    distinct amount once. Amounts are taken by their shortest decimal form and rounded half
+    up, as by cents_parsed: 0.00015 is 0.0002 to 4 places, where Decimal(0.00015) is below
+    0.00015.
+    """
+    codes, distinct_amounts = factorize(amounts)
+    exponent = Decimal(10) ** -places
+    decimals = [
+        Decimal(np.format_float_positional(amount)).quantize(exponent, rounding=ROUND_HALF_UP)
+        for amount in distinct_amounts
+    ]
+    return np.array(decimals, dtype=object)[codes]
 
 
 def decimal_to(val: float, places: int = 2) -> Decimal:
@@ -57,18 +151,18 @@ def string_trimmed_before(string: str, delimiter, occurrences=0) -> str:
     return delimiter.join((groups)[n_th:])
 
 
-def hierarchy_from(delimited_words: str) -> list[str]:
+def hierarchy_from(delimited_words: str) -> list[tuple[str, int]]:
     """
-    Function to make list of all parents from a string delimited by a colon.
+    Function to make list of all parents from a string delimited by a colon, each with
+    its number of levels above the last word.
 
-    For example, "strong:java:bean" becomes "["strong", "strong:java", "strong:java:bean"].
+    For example, "strong:java:bean" becomes
+    [("strong", 2), ("strong:java", 1), ("strong:java:bean", 0)].
 
-    CURRENTLY UNUSED, but being retained as it wasn't yet committed.
-    This was originally written to help create accounts automatically based on categories,
-    a desired future feature.
+    Used to create the missing parents of accounts automatically.
     """
     root = delimited_words.split(":", 1)[0]  # The root tells us when to stop recursing
-    tracker: list[tuple[str, Literal[0]]] = [(delimited_words, 0)]
+    tracker: list[tuple[str, int]] = [(delimited_words, 0)]
 
     def recurse(word: str, level=1) -> str:
         if word != root:
@@ -87,17 +181,26 @@ def get_now():
     return datetime.now()
 
 
+class RightMatchIndex:
+    """Class to index account names by their last word/segment, for full_string_right_match
+    lookups taking time proportional to the accounts sharing that segment rather than to
+    all accounts.
+    """
+
+    def __init__(self, the_list: list):
+        self._by_last_segment: dict[str, list[str]] = {}
+        for s in the_list:
+            self._by_last_segment.setdefault(s.rsplit(":", 1)[-1], []).append(s)
+
+    def matches(self, sub_str: str) -> list:
+        """Returns entries which contain sub_str starting on the far right, in index order."""
+        same_last_segment = self._by_last_segment.get(sub_str.rsplit(":", 1)[-1], [])
+        return [s for s in same_last_segment if sub_str in s]
+
+
 def full_string_right_match(the_list: list, sub_str: str) -> list:
-    """Function to return list of entries in the_list which contain sub_str starting on the far right."""
-    matches = []
-    sub_split = sub_str.rsplit(":")
-    sub_split_last_element = sub_split[len(sub_split) - 1]
-
-    all_matches = [s for s in the_list if sub_str in s]
-
-    for s in all_matches:
-        test_split = s.rsplit(":")
-        test_split_last_element = test_split[len(test_split) - 1]
-        if test_split_last_element == sub_split_last_element:
-            matches.append(s)
-    return matches
+    """Function to return list of entries in the_list which contain sub_str starting on the far right.
+
+    For repeated lookups in the same list, build a RightMatchIndex once instead.
+    """
+    return RightMatchIndex(the_list).matches(sub_str)
@@ -2,12 +2,10 @@
 from datetime import datetime
 import pytest
 
-from piecash import Account, create_book, Transaction, Split
+from piecash import Account, Book, create_book, Transaction, Split
 
 
-@pytest.fixture
-def detailed_book():
-    """Creates basic book to support tests below."""
+def _detailed_book() -> Book:
     book = create_book(currency="USD")
     usd = book.commodities(mnemonic="USD")
     book.root_account.children = [
@@ -43,7 +41,10 @@ def detailed_book():
                     type="ASSET",
                     commodity=usd,
                     placeholder=True,
-                    children=[Account(name="IRA", type="STOCK", commodity=usd, placeholder=False)],
+                    children=[
+                        Account(name="IRA", type="STOCK", commodity=usd, placeholder=False),
+                        Account(name="Brokerage", type="STOCK", commodity=usd, placeholder=False),
+                    ],
                 ),
             ],
         ),
@@ -174,4 +175,16 @@ def detailed_book():
         splits=[Split(account=checking, value=-100), Split(account=opening_balances, value=100)],
     )
     book.save()
-    yield book
+    return book
+
+
+@pytest.fixture
+def detailed_book():
+    """Creates basic book to support tests below."""
+    yield _detailed_book()
+
+
+@pytest.fixture
+def another_detailed_book():
+    """Creates a second basic book, like detailed_book, e.g. to import the same data again."""
+    yield _detailed_book()
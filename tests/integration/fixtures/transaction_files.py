@@ -0,0 +1,47 @@
+"""Fixtures supporting integration tests importing files of transactions"""
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from move2gnucash import migrations
+
+TRANSACTIONS_CSV = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+
+
+@pytest.fixture
+def csv_slices(tmp_path):
+    """Provides a function writing slices of the rows of TRANSACTIONS_CSV, each (start, end)
+    with the header, to CSV files of their own, and providing their names in order.
+    """
+    lines = Path(TRANSACTIONS_CSV).read_text().splitlines()
+    header, rows = lines[0], lines[1:]
+
+    def sliced(*bounds: tuple[int, int | None]) -> list[str]:
+        slices = [tmp_path / f"slice{number}.csv" for number in range(len(bounds))]
+        for csv_file, (start, end) in zip(slices, bounds):
+            csv_file.write_text("\n".join([header] + rows[start:end]))
+        return [str(csv_file) for csv_file in slices]
+
+    yield sliced
+
+
+@pytest.fixture
+def failing_checkpoint():
+    """Provides a function patching imports to fail while writing their nth checkpoint,
+    once its transactions are written but before they're committed.
+    """
+
+    def failing(nth: int):
+        add_book_data = migrations._add_book_data
+        written = []
+
+        def failing_nth(*args):
+            add_book_data(*args)
+            written.append(1)
+            if len(written) == nth:
+                raise RuntimeError("Killed")
+
+        return patch("move2gnucash.migrations._add_book_data", side_effect=failing_nth)
+
+    yield failing
@@ -1,11 +1,33 @@
 """test_opening_balances.py"""
 
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
 from unittest.mock import patch
 
-from piecash import Book, create_book
+import pandas as pd
+from piecash import Account, Book, create_book
+import pytest
 
-from move2gnucash.migrations import category_accounts, opening_balances, transactions
+from move2gnucash.checkpoints import Progress, progress_of
+from move2gnucash.data_preparation import (
+    opening_balance_date,
+    prepared_category_accounts,
+    prepared_transactions,
+)
+from move2gnucash.file_operations import fetch_csv_data, fetch_resolutions
+
+from move2gnucash import migrations
+from move2gnucash.migrations import (
+    _stage_keys,
+    ambiguous_accounts,
+    category_accounts,
+    opening_balances,
+    transactions,
+    transactions_from_files,
+)
+from move2gnucash.stage_cache import StageCache, content_key
 
 
 @patch("move2gnucash.migrations.fetch_accounts")
@@ -65,8 +87,74 @@ def test_category_accounts(mock_fetch, categories) -> None:
     book.close()
 
 
+@patch("move2gnucash.migrations.prepared_category_accounts")
+def test_category_accounts_cached(mock_prepared, tmp_path) -> None:
+    """
+    GIVEN a CSV containing a list of categories already imported once
+        with a stage cache,
+    WHEN executed by category_accounts again with the same cache,
+    THEN the cached stages are reused and the same accounts are added.
+    """
+    categories_file = "tests/unit/fixtures/categories.fixture.csv"
+    cache = StageCache(tmp_path)
+    mock_prepared.side_effect = prepared_category_accounts
+    category_accounts(categories_file, create_book(currency="USD"), cache=cache)
+    book: Book = create_book(currency="USD")
+
+    category_accounts(categories_file, book, cache=cache)
+
+    mock_prepared.assert_called_once()
+    assert len(book.accounts) == 24
+    book.close()
+
+
+def test_stage_keys_engine(tmp_path) -> None:
+    """
+    GIVEN a csv file and a stage cache
+    WHEN its stage keys are made for each csv parser,
+    THEN the fetch keys (and so all others) differ by parser, the default being the c one.
+    """
+    data_filename = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+    cache = StageCache(tmp_path)
+
+    default = _stage_keys(cache, data_filename)
+    c_keys = _stage_keys(cache, data_filename, engine="c")
+    pyarrow_keys = _stage_keys(cache, data_filename, engine="pyarrow")
+
+    assert default == c_keys
+    assert all(pyarrow_keys[stage] != c_keys[stage] for stage in c_keys)
+
+
+def test_transactions_cached(detailed_book, another_detailed_book, tmp_path) -> None:
+    """
+    GIVEN a CSV of transactions imported to a book with a stage cache, committed five
+        rows at a time,
+    WHEN executed by transactions again with the same cache, for a like book,
+    THEN every chunk prepared and mapped the first time is reused, and the same double
+        entry transactions are added.
+    """
+    data_filename = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+    cache = StageCache(tmp_path)
+    calls = []
+    with (
+        patch("move2gnucash.migrations.CHECKPOINT_ROWS", 5),
+        patch("move2gnucash.migrations.prepared_transactions", wraps=prepared_transactions) as prepared,
+        patch("move2gnucash.migrations._mapped_book_data", wraps=migrations._mapped_book_data) as mapped,
+    ):
+        transactions(data_filename, detailed_book, cache=cache)
+        calls.append((prepared.call_count, mapped.call_count))
+        transactions(data_filename, another_detailed_book, cache=cache)
+        calls.append((prepared.call_count, mapped.call_count))
+
+    assert calls == [(3, 3), (3, 3)]
+    assert len(another_detailed_book.transactions) == 9
+    salary = another_detailed_book.accounts(fullname="Income:Salary")
+    assert salary.get_balance() == Decimal("1124.23")
+
+
+@patch("move2gnucash.migrations.content_key", return_value="transactions")
 @patch("move2gnucash.migrations.fetch_csv_data")
-def test_transactions(mock_fetch, detailed_book, all_transactions) -> None:
+def test_transactions(mock_fetch, _mock_key, detailed_book, all_transactions) -> None:
     """
     GIVEN a file name referencing a CSV containing a list of transactions,
         a transaction type, and a PieCash Book instance with necessary
@@ -80,4 +168,301 @@ def test_transactions(mock_fetch, detailed_book, all_transactions) -> None:
 
     transactions("transactions.csv", book)
 
-    assert len(book.transactions) == 7
+    assert len(book.transactions) == 9  # Opening balance, seven imported and one investment
+    holding = book.accounts(fullname="Assets:Investments:Brokerage:XYZ")
+    assert holding.commodity.fullname == "XYZ, Inc."
+    assert holding.get_balance() == Decimal("200")
+    assert book.prices(commodity=holding.commodity).value == Decimal("1.5")
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_transactions_chunked(detailed_book, bulk) -> None:
+    """
+    GIVEN a file name referencing a CSV containing a list of transactions,
+        and a PieCash Book instance with necessary accounts in place,
+    WHEN executed by transactions with a chunk size smaller than a split group,
+        adding them as piecash objects or in bulk,
+    THEN the same double entry transactions are added as when read all at once.
+    """
+    book = detailed_book
+
+    transactions("tests/unit/fixtures/inc_exp_trans.fixture.csv", book, chunk_size=2, bulk=bulk)
+
+    assert len(book.transactions) == 9
+    target = [tr for tr in book.transactions if tr.description == "Target"]
+    assert len(target) == 1
+    assert len(target[0].splits) == 6
+
+
+def test_transactions_balance_date_once(detailed_book) -> None:
+    """
+    GIVEN a CSV of transactions, among them shares added long before the book's opening
+        balances, imported to the book two rows at a time
+    WHEN executed by transactions,
+    THEN the book's opening balance date is read once, and is still that of the opening
+        balances after the older transactions are added.
+    """
+    with (
+        patch("move2gnucash.migrations.CHECKPOINT_ROWS", 2),
+        patch(
+            "move2gnucash.migrations.opening_balance_date", side_effect=opening_balance_date
+        ) as balance_date,
+    ):
+        transactions("tests/unit/fixtures/inc_exp_trans.fixture.csv", detailed_book)
+
+    assert balance_date.call_count == 1
+    assert len(detailed_book.transactions) == 9
+    assert opening_balance_date(detailed_book) == date(2016, 12, 31)
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_transactions_resumed(detailed_book, failing_checkpoint, bulk) -> None:
+    """
+    GIVEN a chunked import of a CSV of transactions failing while writing its third chunk,
+    WHEN executed by transactions again with resume, twice,
+    THEN the import goes on after the last chunk committed, and then adds nothing: the
+        same double entry transactions are added as by an import that didn't fail.
+    """
+    book = detailed_book
+    data_filename = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+
+    with failing_checkpoint(3), pytest.raises(RuntimeError):
+        transactions(data_filename, book, chunk_size=2, bulk=bulk)
+    written = len(book.transactions)
+    transactions(data_filename, book, chunk_size=2, bulk=bulk, resume=True)
+    transactions(data_filename, book, bulk=bulk, resume=True)
+
+    assert 1 < written < 9
+    assert len(book.transactions) == 9
+    assert book.accounts(fullname="Income:Salary").get_balance() == Decimal("1124.23")
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_transactions_resumed_whole_file(detailed_book, failing_checkpoint, bulk) -> None:
+    """
+    GIVEN an import of a CSV of transactions read whole, committed two rows at a time,
+        failing while writing its third checkpoint
+    WHEN executed by transactions again with resume,
+    THEN the file is read again from the first row not committed, and the same double
+        entry transactions are added as by an import that didn't fail.
+    """
+    book = detailed_book
+    data_filename = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+
+    with patch("move2gnucash.migrations.CHECKPOINT_ROWS", 2):
+        with failing_checkpoint(3), pytest.raises(RuntimeError):
+            transactions(data_filename, book, bulk=bulk)
+        committed = progress_of(book, content_key(data_filename))
+        written = len(book.transactions)
+        with patch("move2gnucash.migrations.fetch_csv_data", side_effect=fetch_csv_data) as fetch:
+            transactions(data_filename, book, bulk=bulk, resume=True)
+
+    assert 1 < written < 9
+    assert 0 < committed.rows < 12 and not committed.complete
+    assert fetch.call_args.kwargs["first_row"] == committed.rows
+    assert progress_of(book, content_key(data_filename)).complete
+    assert len(book.transactions) == 9
+    assert book.accounts(fullname="Income:Salary").get_balance() == Decimal("1124.23")
+
+
+def test_transactions_from_files(detailed_book, csv_slices) -> None:
+    """
+    GIVEN a transactions export sliced into two CSV files, and a PieCash
+        Book instance with necessary accounts in place,
+    WHEN executed by transactions_from_files with two worker processes,
+    THEN the same double entry transactions are added as when importing
+        the whole export.
+    """
+    book = detailed_book
+
+    transactions_from_files(csv_slices((0, 5), (5, None)), book, workers=2)
+
+    assert len(book.transactions) == 9
+    assert [tr.description for tr in book.transactions][1] == "John"
+    assert book.accounts(fullname="Income:Salary").get_balance() == Decimal("1124.23")
+
+
+def test_transactions_from_files_staged_ahead(detailed_book, csv_slices) -> None:
+    """
+    GIVEN a transactions export sliced into four CSV files, and a PieCash
+        Book instance with necessary accounts in place,
+    WHEN executed by transactions_from_files with two workers,
+    THEN no more files than workers are staged ahead of the one being written, and the
+        same double entry transactions are added as when importing the whole export.
+    """
+    slices = csv_slices((0, 2), (2, 4), (4, 10), (10, 12))
+    add_book_data = migrations._add_book_data
+    written, staged_ahead = [], []
+
+    class RecordingExecutor(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            staged_ahead.append(len(staged_ahead) + 1 - len(written))
+            return super().submit(*args, **kwargs)
+
+    def recorded(*args):
+        add_book_data(*args)
+        written.append(1)
+
+    with patch("move2gnucash.migrations.ProcessPoolExecutor", RecordingExecutor):
+        with patch("move2gnucash.migrations._add_book_data", side_effect=recorded):
+            transactions_from_files(slices, detailed_book, 2)
+
+    assert len(staged_ahead) == 4 and max(staged_ahead) <= 3  # Two, and the one written
+    assert len(detailed_book.transactions) == 9
+    assert detailed_book.accounts(fullname="Income:Salary").get_balance() == Decimal("1124.23")
+
+
+def test_transactions_imported_again(detailed_book, csv_slices) -> None:
+    """
+    GIVEN a CSV of transactions imported to a book, and two overlapping slices of it
+    WHEN executed by transactions again, and by transactions_from_files with the slices,
+    THEN the transactions already in the book, by FITID, are skipped, the investment one,
+        exported without FITID, by the surrogate FITID it's given.
+    """
+    data_filename = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+    slices = csv_slices((0, 6), (3, None))
+    book = detailed_book
+    transactions(data_filename, book)
+
+    transactions(data_filename, book, chunk_size=2)
+    transactions_from_files(slices, book, workers=1)
+
+    fitids = [tr.num for tr in book.transactions if tr.num]
+    assert len(fitids) == len(set(fitids)) == 8
+    assert len(book.transactions) == 9
+    assert book.accounts(fullname="Income:Salary").get_balance() == Decimal("1124.23")
+
+
+def test_transactions_skipped_resumed(detailed_book, tmp_path) -> None:
+    """
+    GIVEN a CSV of transactions with a reinvested dividend and a cash dividend, imported
+        to a book
+    WHEN executed by transactions again with resume, and then again once more investment
+        actions are imported,
+    THEN the reinvested dividend is imported the first time, the cash dividend skipped and
+        recorded as such; the file is then skipped as imported, and only imported again
+        with the new actions, adding nothing twice.
+    """
+    data = Path("tests/unit/fixtures/inc_exp_trans.fixture.csv").read_text()
+    data += (
+        '\n,1/20/2017,,Reinvest Dividend,,XYZ,"XYZ, Inc.",Investments:Reinvest Dividend,,,,2,R,'
+        "3.10,0,,Brokerage,"
+        '\n,1/20/2017,,Dividend,,XYZ,"XYZ, Inc.",Investments:Dividend,,,,,R,4.00,0,,Brokerage,'
+    )
+    data_filename = tmp_path / "transactions.csv"
+    data_filename.write_text(data)
+    book = detailed_book
+    transactions(str(data_filename), book)
+    imported = progress_of(book, content_key(data_filename))
+
+    with patch("move2gnucash.migrations.fetch_csv_data", side_effect=fetch_csv_data) as fetch:
+        transactions(str(data_filename), book, resume=True)
+        skipped_calls = fetch.call_count
+        with patch("move2gnucash.migrations.IMPORTED_ACTIONS_KEY", "more actions"):
+            transactions(str(data_filename), book, resume=True)
+
+    assert imported.complete and imported.skipped == 1
+    assert imported.actions == migrations.IMPORTED_ACTIONS_KEY
+    assert skipped_calls == 0
+    assert fetch.call_args.kwargs["first_row"] == 0
+    assert len(book.transactions) == 10
+    assert book.accounts(fullname="Assets:Investments:Brokerage:XYZ").get_balance() == 202
+    assert book.accounts(fullname="Income:Dividends").get_balance() == Decimal("3.10")
+    assert progress_of(book, content_key(data_filename)) == Progress(
+        imported.rows, True, 1, "more actions"
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_transactions_identical_rows_chunked(
+    detailed_book, tmp_path, failing_checkpoint, chunk_size
+) -> None:
+    """
+    GIVEN a CSV of two identical transactions without a FITID, committed a row at a time,
+        the import failing after the first,
+    WHEN executed by transactions again with resume,
+    THEN the rows on either side of the chunk boundary get FITIDs of their own: both
+        transactions are added, once, the row committed read again by itself.
+    """
+    header = Path("tests/unit/fixtures/inc_exp_trans.fixture.csv").read_text().splitlines()[0]
+    row = ",1/5/2017,1/5/2017,Payment/Deposit,POS,,Coffee Shop,Food:Groceries,,,,,R,,-5.00,,Checking,"
+    data_filename = tmp_path / "transactions.csv"
+    data_filename.write_text("\n".join([header, row, row]))
+    book = detailed_book
+
+    with patch("move2gnucash.migrations.CHECKPOINT_ROWS", 1):
+        with failing_checkpoint(2), pytest.raises(RuntimeError):
+            transactions(str(data_filename), book, chunk_size=chunk_size)
+        written = len(book.transactions)
+        with patch("move2gnucash.migrations.fetch_csv_data", side_effect=fetch_csv_data) as fetch:
+            transactions(str(data_filename), book, chunk_size=chunk_size, resume=True)
+        transactions(str(data_filename), book, chunk_size=chunk_size)
+
+    groceries = book.accounts(fullname="Expenses:Food:Groceries")
+    assert fetch.call_args_list[0].kwargs["chunk_size"] == 1  # The committed row only
+    assert len(book.transactions) - written == 1
+    assert len({tr.num for tr in book.transactions if tr.description == "Coffee Shop"}) == 2
+    assert groceries.get_balance() == Decimal("10.00")
+
+
+def test_transactions_new_categories(detailed_book, tmp_path) -> None:
+    """
+    GIVEN a CSV of transactions with an expense and an income category missing from the book,
+        and an expense category named like an income account of the book
+    WHEN executed by transactions,
+    THEN the categories are created, with their parents, under Expenses and Income, and
+        the transactions are added to them, none to the account of the same name.
+    """
+    data = Path("tests/unit/fixtures/inc_exp_trans.fixture.csv").read_text()
+    data = data.replace("Other Expense:Membership & Dues", "Hobbies:Knitting")
+    data = data.replace(",Salary,", ",Side Jobs:Tutoring,")
+    data += (
+        "\n,1/4/2017,1/4/2017,Payment/Deposit,DEBIT,,Club,Hobbies:Salary,,,,,R,,-10.00,,"
+        "Checking,201701040625000000001"
+    )
+    data_filename = tmp_path / "transactions.csv"
+    data_filename.write_text(data)
+    book = detailed_book
+
+    transactions(str(data_filename), book)
+
+    knitting = book.accounts(fullname="Expenses:Hobbies:Knitting")
+    tutoring = book.accounts(fullname="Income:Side Jobs:Tutoring")
+    hobby_salary = book.accounts(fullname="Expenses:Hobbies:Salary")
+    assert len(book.transactions) == 10
+    assert (knitting.type, knitting.get_balance()) == ("EXPENSE", Decimal("24.95"))
+    assert (tutoring.type, tutoring.get_balance()) == ("INCOME", Decimal("1124.23"))
+    assert (hobby_salary.type, hobby_salary.get_balance()) == ("EXPENSE", Decimal("10.00"))
+    assert book.accounts(fullname="Income:Salary").get_balance() == 0
+    assert book.accounts(fullname="Expenses:Hobbies").placeholder
+
+
+@patch("move2gnucash.data_preparation._manual_choice")
+def test_transactions_with_resolutions(mock_input, detailed_book, tmp_path) -> None:
+    """
+    GIVEN a CSV of transactions with a category matching two accounts of the book,
+    WHEN its ambiguous names are collected by ambiguous_accounts, an account is chosen
+        in the rules file, and the file is imported by transactions with those rules,
+    THEN nothing is asked, and the transactions are added to the chosen account.
+    """
+    book = detailed_book
+    Account(
+        name="Salary",
+        type="EXPENSE",
+        parent=book.accounts(fullname="Expenses"),
+        commodity=book.default_currency,
+    )
+    book.flush()
+    data_filename = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+    rules_file = tmp_path / "resolutions.csv"
+
+    pending = ambiguous_accounts([data_filename], book, rules_file)
+    rules = pd.read_csv(rules_file, keep_default_na=False)
+    rules["account"] = "Income:Salary"
+    rules.to_csv(rules_file, index=False)
+    transactions(data_filename, book, resolutions=fetch_resolutions(rules_file))
+
+    assert pending == {"Salary": ["Income:Salary", "Expenses:Salary"]}
+    assert len(book.transactions) == 9
+    assert book.accounts(fullname="Income:Salary").get_balance() == Decimal("1124.23")
+    mock_input.assert_not_called()
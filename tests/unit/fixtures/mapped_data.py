@@ -6,12 +6,18 @@ Includes:
     - account objects
     """
 
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 
 import pytest
 
-from move2gnucash.data_maps import Account2Move, Transaction2Move, Split2Move
+from move2gnucash.data_maps import (
+    Account2Move,
+    Commodity2Move,
+    Price2Move,
+    Transaction2Move,
+    Split2Move,
+)
 
 
 @pytest.fixture()
@@ -47,11 +53,33 @@ def transaction_using_short_acct_name() -> list[Transaction2Move]:
 
 
 @pytest.fixture()
-def transaction_add_shares_xyz() -> list[Transaction2Move]:
+def transaction_add_shares_xyz() -> dict[str, list]:
     """
-    Fixture providing add shares transaction of security XYZ
+    Fixture providing add shares transaction of security XYZ, as mapped
+    by mapped_investments.
+
+    Used by test_add_investment_transaction in
+        test_file_operations.py
     """
-    return [Transaction2Move()]
+    return {
+        "commodities": [Commodity2Move("XYZ", "XYZ, Inc.", "Stocks", 10000)],
+        "accounts": [Account2Move("XYZ", "STOCK", "Assets:Brokerage", "XYZ", False, "XYZ, Inc.")],
+        "prices": [Price2Move("XYZ", "USD", date(1993, 1, 14), Decimal("1.5"))],
+        "transactions": [
+            Transaction2Move(
+                date(1993, 1, 14),
+                datetime(2023, 2, 1, 0, 0, 0),
+                "USD",
+                "XYZ, Inc.",
+                "",
+                "",
+                [
+                    Split2Move("Assets:Brokerage:XYZ", Decimal("300.00"), "", Decimal("200")),
+                    Split2Move("Equity:Opening Balances", Decimal("-300.00"), ""),
+                ],
+            )
+        ],
+    }
 
 
 @pytest.fixture()
@@ -71,7 +71,7 @@ def prepared_transactions():
                 "Smiths",
                 "Wal-mart",
             ],
-            "tran_amount": [-200.00, -550.00, -24.95, -8.14, -2.99, -96.94, -0.19, -30.97, -11.22],
+            "tran_amount": [-20000, -55000, -2495, -814, -299, -9694, -19, -3097, -1122],  # Cents
             "tran_acct_to": [
                 "Expenses:Education",
                 "Expenses:Education",
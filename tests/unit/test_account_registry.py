@@ -0,0 +1,84 @@
+"""test_account_registry.py"""
+import pytest
+from piecash import Account, Book, create_book
+from sqlalchemy import event
+
+from move2gnucash.account_registry import account_registry, forget_account_registry
+from move2gnucash.file_operations import create_accounts
+
+
+def _book_with_accounts(new_accounts_list) -> Book:
+    book: Book = create_book(currency="USD")
+    create_accounts(book, new_accounts_list)
+    forget_account_registry(book)  # Read the registry again, from the saved book
+    return book
+
+
+def test_account_registry_one_query(new_accounts_list):
+    """
+    GIVEN a book with a chart of accounts
+    WHEN its account registry is read,
+    THEN the whole account tree is read with a single query, each account by full name
+        and by name, and the registry is shared by the later uses of the book.
+    """
+    book = _book_with_accounts(new_accounts_list)
+    statements = []
+    event.listen(book.session.bind, "before_cursor_execute", lambda *args: statements.append(1))
+
+    registry = account_registry(book)
+
+    assert len(statements) == 1
+    assert account_registry(book) is registry
+    assert registry.fullnames() == [
+        "Assets",
+        "Assets:Current Assets",
+        "Assets:Current Assets:Checking",
+    ]
+    assert registry.fullnames(placeholders=False) == ["Assets:Current Assets:Checking"]
+    checking = book.accounts(fullname="Assets:Current Assets:Checking")
+    assert registry.account("Assets:Current Assets:Checking") is checking
+    assert registry.account_named("Checking") is checking
+    assert registry.account_named("Other:Checking") is checking
+    with pytest.raises(ValueError):
+        registry.account_named("Savings")
+
+
+def test_account_registry_current(new_accounts_list):
+    """
+    GIVEN the account registry of a book
+    WHEN accounts are created by create_accounts, or as piecash Accounts then flushed,
+    THEN they're in the registry.
+    """
+    book = _book_with_accounts(new_accounts_list[:1])
+    registry = account_registry(book)
+
+    create_accounts(book, new_accounts_list[1:])
+    Account(
+        "Savings",
+        "BANK",
+        book.commodities(mnemonic="USD"),
+        parent=registry.account("Assets:Current Assets"),
+    )
+    book.flush()
+
+    assert len(registry) == 4
+    assert "Assets:Current Assets:Checking" in registry
+    assert registry.account_named("Savings").fullname == "Assets:Current Assets:Savings"
+
+
+def test_forget_account_registry(new_accounts_list):
+    """
+    GIVEN the account registry of a book
+    WHEN it's forgotten, and accounts are created and flushed,
+    THEN a new registry is read on next use, and only it is kept current with the book.
+    """
+    book = _book_with_accounts(new_accounts_list[:2])
+    registry = account_registry(book)
+
+    forget_account_registry(book)
+    create_accounts(book, new_accounts_list[2:])
+
+    assert not event.contains(book.session, "after_flush", registry._flushed)
+    assert "Assets:Current Assets:Checking" not in registry
+    assert account_registry(book) is not registry
+    assert "Assets:Current Assets:Checking" in account_registry(book)
@@ -0,0 +1,50 @@
+"""test_checkpoints.py"""
+from unittest.mock import patch
+
+import pytest
+from piecash import Book, create_book
+
+from move2gnucash.account_registry import account_registry
+from move2gnucash.checkpoints import Progress, checkpoint, progress_of
+from move2gnucash.file_operations import add_transactions, create_accounts
+
+
+def test_checkpoint_committed(new_accounts_list_new_book, transaction_simple):
+    """
+    GIVEN a book, and accounts and transactions committed a batch of one at a time
+    WHEN written inside a checkpoint of a file,
+    THEN they're all committed at once, with the progress of the file, its skipped rows
+        and imported actions included.
+    """
+    book: Book = create_book(currency="USD")
+    progress = Progress(rows=5, skipped=2, actions="abc123")
+
+    with patch.object(Book, "save", autospec=True, side_effect=Book.save) as save:
+        with checkpoint(book, "abc", "transactions.csv", progress):
+            create_accounts(book, new_accounts_list_new_book)
+            add_transactions(book, transaction_simple, batch_size=1)
+
+    assert save.call_count == 1
+    assert len(book.transactions) == 1
+    assert progress_of(book, "abc") == progress
+    assert progress_of(book, "def") == Progress()
+
+
+def test_checkpoint_failed(new_accounts_list_new_book, transaction_simple):
+    """
+    GIVEN a book with the accounts and transactions of a first checkpoint of a file
+    WHEN writing the accounts of a second one fails,
+    THEN the book and its account registry are as after the first checkpoint.
+    """
+    book: Book = create_book(currency="USD")
+    with checkpoint(book, "abc", "transactions.csv", Progress(rows=5)):
+        create_accounts(book, new_accounts_list_new_book[:3])
+
+    with pytest.raises(RuntimeError):
+        with checkpoint(book, "abc", "transactions.csv", Progress(rows=10, complete=True)):
+            create_accounts(book, new_accounts_list_new_book[3:])
+            raise RuntimeError("Killed")
+
+    assert len(book.accounts) == 3
+    assert "Equity" not in account_registry(book)
+    assert progress_of(book, "abc") == Progress(rows=5)
@@ -1,8 +1,22 @@
 """test_data_maps.py"""
 
+from datetime import date, datetime
 from decimal import Decimal
 
-from move2gnucash.data_maps import mapped_accounts, mapped_transactions
+import pandas as pd
+
+from move2gnucash.data_maps import (
+    Account2Move,
+    Commodity2Move,
+    fields_of,
+    iter_mapped_transactions,
+    mapped_accounts,
+    mapped_investments,
+    mapped_transactions,
+    Price2Move,
+    Split2Move,
+    TransactionBatch,
+)
 
 
 def test_mapped_accounts(prepared_account_data, new_accounts_list):
@@ -81,3 +95,103 @@ def test_map_bulk_transactions(prepared_transactions):
     THEN a list of Transaction2Move object is returned
     """
     assert len(mapped_transactions(prepared_transactions)) == 6
+
+
+def test_mapped_transactions_order_and_enter_date(prepared_transactions):
+    """
+    GIVEN a Pandas DataFrame fetched from a transactions csv, and a date of entry,
+    WHEN executed by mapped_transactions
+    THEN the multi-split transactions come first, then the single splits in order, all
+        entered at that date, and each split moves its amount between two accounts.
+    """
+    entered = datetime(2023, 1, 1, 12)
+
+    result = list(mapped_transactions(prepared_transactions, entered))
+
+    single_splits = prepared_transactions.loc[prepared_transactions["tran_split"] != "S"]
+    assert [tran.num for tran in result[2:]] == single_splits.tran_num.to_list()
+    assert {tran.enter_date for tran in result} == {entered}
+    assert all(sum(split.value for split in tran.splits) == 0 for tran in result)
+
+
+def test_transaction_batch(prepared_transactions):
+    """
+    GIVEN a TransactionBatch mapped from prepared transactions,
+    WHEN its transactions are indexed, from the start and from the end, and iterated,
+    THEN the same Transaction2Move objects are provided, with the splits of each.
+    """
+    batch = mapped_transactions(prepared_transactions, datetime(2023, 1, 1))
+
+    transactions = list(batch)
+
+    assert len(batch) == len(transactions) == 6
+    assert batch[0] == transactions[0]
+    assert batch[-1] == transactions[5]
+    assert [len(tran.splits) for tran in transactions] == [6, 4, 2, 2, 2, 2]
+    assert fields_of(transactions[5].splits[1]) == {
+        "account": transactions[5].splits[1].account,
+        "value": transactions[5].splits[1].value,
+        "memo": transactions[5].splits[1].memo,
+        "quantity": None,
+    }
+
+
+def test_iter_mapped_transactions(prepared_transactions):
+    """
+    GIVEN a Pandas DataFrame fetched from a transactions csv
+    WHEN executed by iter_mapped_transactions, four transactions at a time,
+    THEN the same transactions as those of mapped_transactions are generated, with the
+        multi-split ones kept whole.
+    """
+    entered = datetime(2023, 1, 1)
+
+    result = iter_mapped_transactions(prepared_transactions, entered, batch_size=4)
+
+    assert next(result) == mapped_transactions(prepared_transactions, entered)[0]
+    assert list(result) == list(mapped_transactions(prepared_transactions, entered))[1:]
+
+
+def test_mapped_investments():
+    """
+    GIVEN prepared investment transactions buying and selling shares of a security
+        on the same day, with a commission,
+    WHEN executed by mapped_investments,
+    THEN the security, its holding account, the fees account and one price (the last
+        of the day) are returned once, along with a batch of balanced transactions, their
+        share quantities rounded from their decimal form.
+    """
+    prepared_invest = pd.DataFrame(
+        {
+            "tran_date": [date(2017, 1, 3), date(2017, 1, 3)],
+            "tran_description": ["ABC Corp.", "ABC Corp."],
+            "tran_memo": ["", "Rebalance"],
+            "tran_num": ["1", "2"],
+            "symbol": ["ABC", "ABC"],
+            "invest_acct": ["Assets:Brokerage", "Assets:Brokerage"],
+            "share_acct": ["Assets:Brokerage:ABC", "Assets:Brokerage:ABC"],
+            "share_quantity": [10.00015, -4.0],
+            "share_value": [100000, -50000],  # In cents
+            "fee_value": [495, 0],
+            "cash_acct": ["Assets:Brokerage", "Assets:Brokerage"],
+        }
+    )
+
+    result = mapped_investments(prepared_invest)
+
+    assert result["commodities"] == [Commodity2Move("ABC", "ABC Corp.", "Stocks", 10000)]
+    assert result["accounts"] == [
+        Account2Move("ABC", "STOCK", "Assets:Brokerage", "ABC", False, "ABC Corp."),
+        Account2Move("Commissions", "EXPENSE", "Expenses", "USD", False, ""),
+    ]
+    assert result["prices"] == [Price2Move("ABC", "USD", date(2017, 1, 3), Decimal("125"))]
+    assert isinstance(result["transactions"], TransactionBatch)
+    buy, sell = result["transactions"]
+    assert buy.splits == [
+        Split2Move("Assets:Brokerage:ABC", Decimal("1000.00"), "", Decimal("10.0002")),
+        Split2Move("Assets:Brokerage", Decimal("-1004.95"), ""),
+        Split2Move("Expenses:Commissions", Decimal("4.95"), ""),
+    ]
+    assert sell.splits == [
+        Split2Move("Assets:Brokerage:ABC", Decimal("-500.00"), "Rebalance", Decimal("-4")),
+        Split2Move("Assets:Brokerage", Decimal("500.00"), "Rebalance"),
+    ]
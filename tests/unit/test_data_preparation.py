@@ -1,14 +1,22 @@
 """test_data_preparation.py"""
 from datetime import datetime
 from unittest.mock import patch
+import warnings
 
 import pandas as pd
-from piecash import Split, Transaction
+import pytest
+from piecash import Account, Book, create_book, Split, Transaction
 
+from move2gnucash.file_operations import fetch_csv_data
 from move2gnucash.data_preparation import (
+    _account_from,
+    Resolutions,
+    _sub_paths_from_raw_refs,
     prepared_balances,
     prepared_category_accounts,
+    prepared_missing_accounts,
     prepared_transactions,
+    whole_split_groups,
 )
 
 
@@ -47,7 +55,7 @@ def test_prepared_balances(balances: pd.DataFrame):
 
     assert res.loc[5].at["tran_acct_to"] == "Assets:Savings:Savings Account"
 
-    assert isinstance(res.loc[20].at["tran_amount"], float)
+    assert res.tran_amount.dtype == "int64"  # In cents
     assert res.tran_date[0] == datetime(2017, 12, 31).date()
 
     assert all(
@@ -93,10 +101,34 @@ def test_prepared_balances_correct_balances(balances: pd.DataFrame):
     test_data = {"as_of_date": test_date, "data": balances}
     res = prepared_balances(test_data)
 
-    assert res.loc[20].at["tran_amount"] == -10600.00
+    assert res.loc[20].at["tran_amount"] == -1060000
     assert all(acct.tran_amount == 0 for acct in res.itertuples() if acct.selected_type == "STOCK")
 
 
+def test_sub_paths_from_raw_refs():
+    """
+    GIVEN a Pandas Series of indented account names from a Quicken report,
+    WHEN executed by _sub_paths_from_raw_refs,
+    THEN each row's path below the root is returned, with its parents' names
+        filled in from earlier rows.
+    """
+    raw_refs = pd.Series(
+        [None, "Cash", " - Checking", " - Savings", " -  - Joint", "Property", " - Truck"]
+    )
+
+    res = _sub_paths_from_raw_refs(raw_refs)
+
+    assert res.to_list() == [
+        "",
+        ":Cash",
+        ":Cash:Checking",
+        ":Cash:Savings",
+        ":Cash:Savings:Joint",
+        ":Property",
+        ":Property:Truck",
+    ]
+
+
 def test_prepared_category_accounts(categories):
     """
     GIVEN a Pandas DataFrame from a csv import of Quicken categories,
@@ -111,6 +143,22 @@ def test_prepared_category_accounts(categories):
     assert all(w in ["INCOME", "EXPENSE"] for w in res.selected_type.to_list())
 
 
+def test_prepared_missing_accounts():
+    """
+    GIVEN full account names missing from a book, top level or not, with or without a type
+        keyword,
+    WHEN executed by prepared_missing_accounts,
+    THEN their parents (root for top level ones) and names are split, and their types are
+        guessed from their names, missing without any keyword.
+    """
+    res = prepared_missing_accounts(["Hobbies", "Expenses:Hobbies:Knitting"], [True, False])
+
+    assert res.parent.tolist() == ["root", "Expenses:Hobbies"]
+    assert res.name.tolist() == ["Hobbies", "Knitting"]
+    assert res.placeholder.tolist() == [True, False]
+    assert pd.isna(res.selected_type[0]) and res.selected_type[1] == "EXPENSE"
+
+
 def test_prepared_transactions_input_check(all_transactions, detailed_book):
     """
     GIVEN a Pandas DataFrame from a csv import of Quicken transactions,
@@ -144,7 +192,33 @@ def test_prepared_transactions_investment(all_transactions, detailed_book):
     res: pd.DataFrame = prepared_transactions(detailed_book, all_transactions)["invest"]
 
     assert len(res) == 1
-    print(res.invest_acct, res.account)
+    assert res.invest_acct[0] == "Assets:Investments:Brokerage"
+    assert res.share_acct[0] == "Assets:Investments:Brokerage:XYZ"
+    assert (res.share_quantity[0], res.share_value[0], res.fee_value[0]) == (200, 30000, 0)
+    assert res.cash_acct[0] == "Equity:Opening Balances"  # Shares added without cash
+
+
+def test_prepared_transactions_reinvest(all_transactions, detailed_book):
+    """
+    GIVEN Quicken transactions with a reinvested dividend and a cash dividend,
+    WHEN executed by prepared_transactions also passed a book,
+    THEN the reinvested dividend is prepared as shares bought with the dividend income,
+        and the cash dividend, not imported yet, is provided apart as skipped.
+    """
+    dividends = all_transactions.iloc[[0, 0]].assign(
+        Category=["Investments:Reinvest Dividend", "Investments:Dividend"],
+        Shares=[2.0, None],
+    )
+    dividends["Invest Amount"] = [3.1, 4.0]
+    raw_data = pd.concat([all_transactions, dividends], ignore_index=True)
+
+    res = prepared_transactions(detailed_book, raw_data)
+
+    reinvested = res["invest"].iloc[1]
+    assert (reinvested.share_quantity, reinvested.share_value) == (2, 310)
+    assert reinvested.share_acct == "Assets:Investments:Brokerage:XYZ"
+    assert reinvested.cash_acct == "Income:Dividends"
+    assert res["skipped"].account.tolist() == ["Investments:Dividend"]
 
 
 def test_prepared_transactions_filtered(all_transactions, detailed_book):
@@ -207,3 +281,160 @@ def test_prepared_transactions_amounts(all_transactions, detailed_book):
 
     assert res.tran_amount[0] > 0
     assert res.tran_amount[9] < 0
+
+
+def test_whole_split_groups(all_transactions):
+    """
+    GIVEN chunks of raw Quicken transactions cut across multi-split transactions,
+    WHEN executed by whole_split_groups,
+    THEN the rows are regrouped, unchanged and in order, with every split group
+        contained in a single chunk.
+    """
+    chunks = [all_transactions.iloc[i : i + 3] for i in range(0, len(all_transactions), 3)]
+
+    res = list(whole_split_groups(chunks))
+
+    pd.testing.assert_frame_equal(pd.concat(res), all_transactions)
+    for fitid in ["201701030107000000002", "201701030107000000003"]:
+        holding = [chunk for chunk in res if (chunk.FITID.astype(str) == fitid).any()]
+        assert len(holding) == 1
+
+
+def test_whole_split_groups_typed():
+    """
+    GIVEN chunks of Quicken transactions read with explicit column types, a split group
+        held back from a chunk whose categorical columns have other categories, or none
+    WHEN executed by whole_split_groups,
+    THEN the chunks are regrouped without any warning, their categorical columns kept
+        categorical, with the categories of both.
+    """
+    chunks = fetch_csv_data("tests/unit/fixtures/inc_exp_trans.fixture.csv", chunk_size=2)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        res = list(whole_split_groups(chunks))
+
+    regrouped = next(chunk for chunk in res if len(chunk) == 3)
+    assert isinstance(regrouped.Tags.dtype, pd.CategoricalDtype)
+    assert regrouped.Tags.isna().tolist() == [True, False, True]
+    assert regrouped.Tags.iloc[1] == "computers & electronics"
+
+
+def test_prepared_transactions_typed_input(all_transactions, detailed_book):
+    """
+    GIVEN a Pandas DataFrame read by fetch_csv_data with explicit column types,
+    WHEN executed by prepared_transactions also passed a book,
+    THEN the prepared transactions match those prepared from untyped input.
+    """
+    typed = fetch_csv_data("tests/unit/fixtures/inc_exp_trans.fixture.csv")
+    columns = [
+        "tran_split",
+        "tran_date",
+        "tran_description",
+        "tran_amount",
+        "tran_memo",
+        "tran_num",
+        "tran_acct_to",
+        "tran_acct_from",
+    ]
+
+    res = prepared_transactions(detailed_book, typed)["non_invest"]
+
+    expected = prepared_transactions(detailed_book, all_transactions)["non_invest"]
+    pd.testing.assert_frame_equal(res[columns], expected[columns])
+
+
+def test_prepared_transactions_copy_on_write(all_transactions, balances, detailed_book):
+    """
+    GIVEN Pandas DataFrames from csv imports of Quicken transactions and balances,
+    WHEN executed by prepared_transactions and prepared_balances under pandas copy-on-write,
+    THEN neither warns about chained assignment or copies, the inputs are left unchanged,
+        and the prepared transactions match those prepared without copy-on-write.
+    """
+    raw_transactions, raw_balances = all_transactions.copy(), balances.copy()
+    expected = prepared_transactions(detailed_book, all_transactions)
+
+    with pd.option_context("mode.copy_on_write", True), warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.ChainedAssignmentError)
+        warnings.simplefilter("error", pd.errors.SettingWithCopyWarning)
+        res = prepared_transactions(detailed_book, all_transactions)
+        prepared_balances({"as_of_date": datetime(2017, 12, 31).date(), "data": balances})
+
+    pd.testing.assert_frame_equal(all_transactions, raw_transactions)
+    pd.testing.assert_frame_equal(balances, raw_balances)
+    pd.testing.assert_frame_equal(res["non_invest"], expected["non_invest"])
+    pd.testing.assert_frame_equal(res["invest"], expected["invest"])
+
+
+def _book_of(account_names: list[str]) -> Book:
+    """Creates a book with the accounts of full names account_names, their parents being
+    placeholders.
+    """
+    book: Book = create_book(currency="USD")
+    usd = book.commodities(mnemonic="USD")
+    accounts = {"": book.root_account}
+    for fullname in account_names:
+        parent = ""
+        for name in fullname.split(":"):
+            path = f"{parent}:{name}" if parent else name
+            if path not in accounts:
+                accounts[path] = Account(
+                    name, "EXPENSE", usd, parent=accounts[parent], placeholder=path != fullname
+                )
+            parent = path
+    book.save()
+    return book
+
+
+@patch("move2gnucash.data_preparation._manual_choice")
+def test_account_from_resolves_each_name_once(mock_input):
+    """
+    GIVEN repeated account names, one of them matching two accounts of the book,
+    WHEN executed by _account_from, twice with the same resolutions,
+    THEN every row is resolved, the user is asked about the ambiguous name only once,
+        and the answer is remembered in resolutions.
+    """
+    book = _book_of(["Expenses:Food:Dining", "Expenses:Travel:Dining", "Income:Salary"])
+    mock_input.return_value = "Expenses:Travel:Dining"
+    names = pd.Series(["Dining", "Salary", "Dining", "Dining"], index=[3, 5, 7, 9])
+    resolutions = Resolutions()
+
+    res = _account_from(book, names, resolutions)
+    _account_from(book, names.astype("category"), resolutions)
+
+    mock_input.assert_called_once_with(["Expenses:Food:Dining", "Expenses:Travel:Dining"])
+    assert res.to_dict() == {
+        3: "Expenses:Travel:Dining",
+        5: "Income:Salary",
+        7: "Expenses:Travel:Dining",
+        9: "Expenses:Travel:Dining",
+    }
+    assert resolutions == {"Dining": "Expenses:Travel:Dining", "Salary": "Income:Salary"}
+
+
+@patch("move2gnucash.data_preparation._manual_choice")
+def test_account_from_unattended(mock_input):
+    """
+    GIVEN an account name matching two accounts of the book and no account chosen for it,
+        and a name matching none
+    WHEN executed by _account_from with resolutions collecting or raising on ambiguity,
+    THEN the user isn't asked: the names are collected as pending, unresolved (the missing
+        one without candidates), or an error is raised, unless the account was chosen in
+        the resolutions.
+    """
+    book = _book_of(["Expenses:Food:Dining", "Expenses:Travel:Dining", "Income:Salary"])
+    names = pd.Series(["Dining", "Salary", "Dining"])
+    collecting = Resolutions(on_ambiguous="collect")
+
+    res = _account_from(book, pd.concat([names, pd.Series(["Knitting"])]), collecting)
+
+    assert res.tolist() == [None, "Income:Salary", None, None]
+    assert collecting.pending == {
+        "Dining": ["Expenses:Food:Dining", "Expenses:Travel:Dining"],
+        "Knitting": [],
+    }
+    with pytest.raises(ValueError, match="Dining"):
+        _account_from(book, names, Resolutions(on_ambiguous="raise"))
+    chosen = Resolutions({"Dining": "Expenses:Food:Dining"}, on_ambiguous="raise")
+    assert _account_from(book, names, chosen)[2] == "Expenses:Food:Dining"
+    mock_input.assert_not_called()
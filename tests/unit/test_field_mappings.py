@@ -0,0 +1,46 @@
+"""test_field_mappings.py"""
+from pathlib import Path
+
+from move2gnucash.field_mappings import field_mappings, use_field_mappings_file
+
+
+def test_field_mappings():
+    """
+    GIVEN the field_mappings.ini packaged with move2gnucash,
+    WHEN a section is asked for by field_mappings, twice,
+    THEN the same compiled mappings are returned, with the columns read (and their
+        dtypes) leaving out those of unused fields.
+    """
+    res = field_mappings("transactions")
+
+    assert field_mappings("transactions") is res
+    assert res.columns["tran_description"] == "Payee"
+    assert "Clr" not in res.usecols
+    assert res.usecols.count("Account") == 1
+    assert res.kinds["date"] == ["Date"]
+    assert res.dtypes["Category"] == "category"
+    assert res.kinds["money"] == ["Comm/Fee", "Invest Amount", "Amount"]
+    assert res.dtypes["Amount"] is str  # Parsed into integer cents after reading
+    assert res.dtypes["Shares"] == "float64"
+    assert res.dtypes["FITID"] is str
+
+
+def test_field_mappings_user_file(tmp_path):
+    """
+    GIVEN a user's field mappings file naming the payee column differently,
+    WHEN set with use_field_mappings_file, and later unset,
+    THEN field_mappings provides the user's column names, and later the packaged ones.
+    """
+    packaged = Path("src/move2gnucash/field_mappings.ini").read_text()
+    user_file = tmp_path / "my_mappings.ini"
+    user_file.write_text(packaged.replace("tran_description = Payee", "tran_description = Who"))
+
+    use_field_mappings_file(user_file)
+    try:
+        res = field_mappings("transactions")
+    finally:
+        use_field_mappings_file(None)
+
+    assert res.columns["tran_description"] == "Who"
+    assert "Who" in res.usecols
+    assert field_mappings("transactions").columns["tran_description"] == "Payee"
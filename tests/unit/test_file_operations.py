@@ -5,24 +5,44 @@ Includes tests to read and write data. Read includes input files of Quicken expo
 accounts (net worth), categories and transactions. Write includes objects
 for the GnuCash data file being created. 
 """
-from datetime import datetime
+import bz2
+import copy
+from datetime import date, datetime
 from decimal import Decimal
-from unittest.mock import patch, Mock
+import gzip
+import lzma
+from unittest.mock import patch, Mock, PropertyMock
 
-from piecash import Account, create_book, Book, factories, Commodity
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from piecash import Account, create_book, Book, GncValidationError, open_book, Price
 
 from move2gnucash.file_operations import (
+    BatchCommits,
+    COMMIT_SECONDS,
+    FIRST_BATCH_SIZE,
     fetch_categories,
+    fetch_csv_data,
+    expanded_input_files,
     create_gnucash_book,
     create_accounts,
+    add_commodities,
+    add_prices,
     add_transactions,
+    bulk_add_transactions,
     fetch_accounts,
+    fetch_resolutions,
+    write_resolutions,
 )
+from move2gnucash.data_maps import mapped_transactions, Price2Move
+from move2gnucash.data_preparation import Resolutions
 
 
-def setup_basic_book() -> Book:
-    """Creates basic book to support tests below."""
-    book: Book = create_book(currency="USD")
+def setup_basic_book(file_name: str | None = None) -> Book:
+    """Creates basic book to support tests below, in memory unless given a file name."""
+    book: Book = create_book(file_name, currency="USD")
     usd = book.commodities(mnemonic="USD")
     book.root_account.children = [
         Account(
@@ -78,15 +98,23 @@ def test_fetch_accounts(mock_read: Mock):
     WHEN executed with fetch_accounts,
     THEN Pandas.read_csv is called with header=None, column headers will be added;
         and an object will be returned with the as_of_date from the file name and a data
-        key reflecting the accounts and their balances data.
+        key reflecting the accounts and their balances data, in integer cents.
     """
+    mock_read.return_value = pd.DataFrame(
+        {"root": ["Assets", None], "account": [None, "Savings"], "balance": [None, "3,000.32"]}
+    )
+
     res = fetch_accounts("2016_12_31_file.csv")
 
     mock_read.assert_called_once_with(
-        "2016_12_31_file.csv", header=None, names=["root", "account", "balance"], thousands=","
+        "2016_12_31_file.csv",
+        header=None,
+        names=["root", "account", "balance"],
+        dtype={"root": str, "account": str, "balance": str},
     )
     assert isinstance(res, dict)
     assert res["as_of_date"] == datetime.strptime("2016_12_31", "%Y_%m_%d").date()
+    assert res["data"].balance.tolist() == [pd.NA, 300032]
 
 
 @patch("pandas.read_csv")
@@ -97,11 +125,182 @@ def test_fetch_categories(mock_read: Mock):
     THEN Pandas.read_csv is called with header=None and column headers set;
         and an object will be returned with the raw category data.
     """
+    mock_read.return_value = pd.DataFrame(
+        {"root": ["Income"], "account": [None], "balance": [None]}
+    )
+
     fetch_categories("categories.csv")
 
     mock_read.assert_called_once_with(
-        "categories.csv", header=None, names=["root", "account", "balance"]
+        "categories.csv",
+        header=None,
+        names=["root", "account", "balance"],
+        dtype={"root": str, "account": str, "balance": str},
+    )
+
+
+def test_fetch_csv_data():
+    """
+    GIVEN the file name of an existing transactions csv file,
+    WHEN executed with fetch_csv_data,
+    THEN only the used columns of field_mappings.ini are returned, with dates parsed,
+        categorical account columns, money in integer cents and FITIDs kept as text.
+    """
+    res = fetch_csv_data("tests/unit/fixtures/inc_exp_trans.fixture.csv")
+
+    assert not {"Type", "Action", "Clr"} & set(res.columns)
+    assert pd.api.types.is_datetime64_any_dtype(res["Date"])
+    assert all(
+        isinstance(res[col].dtype, pd.CategoricalDtype)
+        for col in ["Category", "Account", "Transfer", "Tags"]
     )
+    assert res["Amount"].dtype == "Int64"
+    assert res["Amount"].iat[-1] == 112423
+    assert res["Comm/Fee"].isna().all()  # Blanks
+    assert res["FITID"].iat[2] == "201612300900000000002"
+
+
+def test_fetch_csv_data_first_row():
+    """
+    GIVEN the file name of an existing transactions csv file, and a first row
+    WHEN executed with fetch_csv_data, whole or in chunks,
+    THEN the rows before it are skipped, the others labeled by their number in the file.
+    """
+    file_name = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+
+    res = fetch_csv_data(file_name, first_row=4)
+    chunked = pd.concat(fetch_csv_data(file_name, chunk_size=3, first_row=4))
+
+    expected = fetch_csv_data(file_name).iloc[4:].astype(object)
+    pd.testing.assert_frame_equal(res.astype(object), expected)
+    pd.testing.assert_frame_equal(chunked.astype(object), expected)
+
+
+def test_fetch_csv_data_pyarrow():
+    """
+    GIVEN the file name of an existing transactions csv file,
+    WHEN executed with fetch_csv_data using the pyarrow engine,
+    THEN the same data is returned as with the default engine.
+    """
+    pytest.importorskip("pyarrow")
+    file_name = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+
+    res = fetch_csv_data(file_name, engine="pyarrow")
+
+    expected = fetch_csv_data(file_name)
+    assert list(res.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(
+        res.astype(object).fillna(""), expected.astype(object).fillna(""), check_dtype=False
+    )
+
+
+COMPRESSORS = {".gz": gzip.compress, ".bz2": bz2.compress, ".xz": lzma.compress}
+
+
+def _compressed_copy(source: str, target) -> None:
+    data = Path(source).read_bytes()
+    if target.suffix == ".zst":
+        zstandard = pytest.importorskip("zstandard")
+        target.write_bytes(zstandard.ZstdCompressor().compress(data))
+    else:
+        target.write_bytes(COMPRESSORS[target.suffix](data))
+
+
+@pytest.mark.parametrize("suffix", [".gz", ".bz2", ".xz", ".zst"])
+def test_fetch_csv_data_compressed(suffix, tmp_path):
+    """
+    GIVEN a compressed transactions csv file,
+    WHEN executed with fetch_csv_data, whole or in chunks,
+    THEN the same data is returned as from the uncompressed file.
+    """
+    source = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+    compressed = tmp_path / f"transactions.csv{suffix}"
+    _compressed_copy(source, compressed)
+
+    res = fetch_csv_data(str(compressed))
+    chunked = pd.concat(fetch_csv_data(str(compressed), chunk_size=5))
+
+    expected = fetch_csv_data(source)
+    pd.testing.assert_frame_equal(res, expected)
+    pd.testing.assert_frame_equal(chunked.astype(object), expected.astype(object))
+
+
+@pytest.mark.parametrize("suffix", [".gz", ".xz"])
+def test_fetch_csv_data_pyarrow_compressed(suffix, tmp_path):
+    """
+    GIVEN a compressed transactions csv file,
+    WHEN executed with fetch_csv_data using the pyarrow engine,
+    THEN the same data is returned as from the uncompressed file.
+    """
+    pytest.importorskip("pyarrow")
+    source = "tests/unit/fixtures/inc_exp_trans.fixture.csv"
+    compressed = tmp_path / f"transactions.csv{suffix}"
+    _compressed_copy(source, compressed)
+
+    res = fetch_csv_data(str(compressed), engine="pyarrow")
+
+    pd.testing.assert_frame_equal(res, fetch_csv_data(source, engine="pyarrow"))
+
+
+def test_fetch_accounts_compressed(tmp_path):
+    """
+    GIVEN a compressed accounts csv file named only by its date, in a directory,
+    WHEN executed with fetch_accounts,
+    THEN the as_of_date is taken from the file name without its suffixes
+        and the balances are read.
+    """
+    compressed = tmp_path / "2016_12_31.csv.gz"
+    _compressed_copy("tests/unit/fixtures/2016_12_31_net_worth.fixture.csv", compressed)
+
+    res = fetch_accounts(str(compressed))
+
+    assert res["as_of_date"] == datetime(2016, 12, 31).date()
+    assert res["data"].balance.iat[2] == 7712  # In cents
+
+
+def test_expanded_input_files(tmp_path):
+    """
+    GIVEN a directory, a glob pattern, a manifest or a single csv file name,
+    WHEN executed with expanded_input_files,
+    THEN the csv files they name are listed in import order.
+    """
+    for name in ["2018.csv.gz", "2017.csv", "notes.md"]:
+        (tmp_path / name).write_text("")
+    manifest = tmp_path / "exports.txt"
+    manifest.write_text("# Oldest first\n2017.csv\n\n2018.csv.gz\n")
+    in_order = [str(tmp_path / "2017.csv"), str(tmp_path / "2018.csv.gz")]
+
+    assert expanded_input_files(str(tmp_path)) == in_order
+    assert expanded_input_files(str(tmp_path / "20*.csv*")) == in_order
+    assert expanded_input_files(str(manifest)) == in_order
+    assert expanded_input_files(in_order[1]) == in_order[1:]
+
+
+def test_resolutions_file(tmp_path):
+    """
+    GIVEN resolutions with a chosen and a pending ambiguous account name, and a pending
+        missing one
+    WHEN written with write_resolutions and read back with fetch_resolutions,
+    THEN the chosen account and the names' candidates (none for the missing one) are
+        kept, the pending names staying pending, and a missing file is read as having no
+        rules.
+    """
+    rules_file = tmp_path / "resolutions.csv"
+    resolutions = Resolutions({"Dining": "Expenses:Food:Dining", "Salary": "Income:Salary"})
+    resolutions.candidates = {
+        "Dining": ["Expenses:Food:Dining", "Expenses:Travel:Dining"],
+        "Other": ["Income:Other", "Expenses:Other"],
+        "Knitting": [],
+    }
+
+    write_resolutions(rules_file, resolutions)
+    res = fetch_resolutions(rules_file)
+
+    assert res == {"Dining": "Expenses:Food:Dining"}
+    assert res.candidates == resolutions.candidates
+    assert res.pending == {"Other": ["Income:Other", "Expenses:Other"], "Knitting": []}
+    assert res.on_ambiguous == "raise"
+    assert fetch_resolutions(tmp_path / "missing.csv") == {}
 
 
 #############################
@@ -153,6 +352,68 @@ def test_add_accounts_correct_tree(new_accounts_list):
     assert "Assets:Current Assets:Checking" in added_accounts
 
 
+def test_add_accounts_any_order(new_accounts_list):
+    """
+    GIVEN accounts and sub accounts listed children first, and a viable book instance
+    WHEN executed with create_accounts,
+    THEN the parents are created first, each account under its parent.
+    """
+    book: Book = create_book(currency="USD")
+
+    create_accounts(book, list(reversed(new_accounts_list)))
+
+    assert book.accounts(fullname="Assets:Current Assets:Checking").parent.name == "Current Assets"
+    assert len(book.accounts) == 3
+
+
+def test_create_accounts_missing_parents(new_accounts_list):
+    """
+    GIVEN an account whose parent and grandparent aren't in the book or the accounts list
+    WHEN executed with create_accounts,
+    THEN the parents are created first, as placeholders with the types their names suggest.
+    """
+    book: Book = create_book(currency="USD")
+
+    create_accounts(book, new_accounts_list[2:])
+
+    assert [
+        (acct.fullname, acct.type, acct.placeholder)
+        for acct in sorted(book.accounts, key=lambda acct: acct.fullname)
+    ] == [
+        ("Assets", "ASSET", 1),
+        ("Assets:Current Assets", "ASSET", 1),
+        ("Assets:Current Assets:Checking", "BANK", 0),
+    ]
+
+
+def test_create_accounts_of_splits(transaction_simple):
+    """
+    GIVEN a book with a chart of accounts, and transactions with splits to accounts it lacks
+    WHEN executed with create_accounts given the names of the split accounts, then
+        add_transactions,
+    THEN the missing accounts are created, their missing parents as placeholders of the
+        nearest parent's type, and the transactions are added.
+    """
+    book: Book = setup_basic_book()
+    transaction_simple[0].splits[1].account = "Income:Side Jobs:Tutoring"
+
+    create_accounts(
+        book, [], [split.account for tran in transaction_simple for split in tran.splits]
+    )
+    add_transactions(book, transaction_simple)
+
+    assert [
+        (acct.type, acct.placeholder)
+        for acct in (
+            book.accounts(fullname="Income"),
+            book.accounts(fullname="Income:Side Jobs"),
+            book.accounts(fullname="Income:Side Jobs:Tutoring"),
+        )
+    ] == [("INCOME", 1), ("INCOME", 1), ("INCOME", 0)]
+    assert book.accounts(fullname="Income:Side Jobs:Tutoring").get_balance() == Decimal("1000")
+    assert len(book.accounts) == 8
+
+
 # Transactions and Splits
 def test_add_transactions(transaction_simple):
     """
@@ -174,6 +435,118 @@ def test_add_transactions(transaction_simple):
     )
 
 
+def test_add_transactions_batched(transaction_simple):
+    """
+    GIVEN a book with a chart of accounts, and five mapped transactions
+    WHEN executed with add_transactions in batches of two,
+    THEN the book is committed after each batch and once for the last one, with all of the
+        transactions.
+    """
+    book: Book = setup_basic_book()
+    transactions = [copy.deepcopy(transaction_simple[0]) for _ in range(5)]
+
+    with patch.object(Book, "save", autospec=True, side_effect=Book.save) as save:
+        add_transactions(book, transactions, batch_size=2)
+
+    assert save.call_count == 3
+    assert len(book.transactions) == 5
+
+
+@pytest.mark.parametrize(
+    "seconds, batch_size",
+    [(0, FIRST_BATCH_SIZE * 2), (COMMIT_SECONDS, FIRST_BATCH_SIZE), (1e3, FIRST_BATCH_SIZE // 2)],
+)
+def test_batch_commits_adapt(seconds, batch_size):
+    """
+    GIVEN commits without a batch size, taking no time, about COMMIT_SECONDS or much longer
+    WHEN a whole batch is committed,
+    THEN the batch size doubles, stays the same or halves.
+    """
+    commits = BatchCommits(Mock(**{"session.info": {}}), batch_size=None)  # Not in a checkpoint
+
+    with patch("move2gnucash.file_operations.perf_counter", side_effect=[0, seconds]):
+        for _ in range(FIRST_BATCH_SIZE):
+            commits.added()
+
+    assert commits.book.save.call_count == 1
+    assert commits.batch_size == batch_size
+
+
+def _book_contents(file_name: str) -> tuple:
+    with open_book(file_name, readonly=True, open_if_lock=True) as book:
+        return (
+            {acct.fullname: acct.get_balance() for acct in book.accounts},
+            sorted(
+                (tr.post_date, tr.enter_date, tr.num, tr.description, tr.notes, len(tr.splits))
+                for tr in book.transactions
+            ),
+        )
+
+
+def test_bulk_add_transactions(tmp_path):
+    """
+    GIVEN two book files with a chart of accounts, and mapped transactions, one of them
+        in several splits and one naming an account by its name only
+    WHEN added to one book by add_transactions and to the other by bulk_add_transactions,
+        in batches of two,
+    THEN both books, opened again, have the same transactions and balances.
+    """
+    equity = "Equity:Opening Balances"
+    prepared = pd.DataFrame(
+        {
+            "tran_split": ["S", "S", "", ""],
+            "tran_date": [datetime(2017, 1, 3).date()] * 2 + [datetime(2017, 1, 4).date()] * 2,
+            "tran_description": ["Target", "Target", "John", "Employer"],
+            "tran_memo": ["Shoes", "Shoes", "", "Pay"],
+            "tran_num": ["", "", "101", ""],
+            "tran_amount": [2495, 1050, -30000, 112423],
+            "tran_acct_from": ["Assets:Current Assets:Checking"] + ["Checking"] * 2 + [equity],
+            "tran_acct_to": [equity] * 3 + ["Checking"],
+        }
+    )
+    files = {"objects": str(tmp_path / "objects.gnucash"), "bulk": str(tmp_path / "bulk.gnucash")}
+    for writer, add in [("objects", add_transactions), ("bulk", bulk_add_transactions)]:
+        book = setup_basic_book(files[writer])
+        add(book, mapped_transactions(prepared, datetime(2023, 2, 1)), batch_size=2)
+        book.close()
+
+    balances, transactions = _book_contents(files["bulk"])
+
+    assert (balances, transactions) == _book_contents(files["objects"])
+    assert balances["Assets:Current Assets:Checking"] == Decimal("1388.78")
+    assert [tr[2:] for tr in transactions] == [
+        ("", "Target", "Shoes", 4),
+        ("", "Employer", "Pay", 2),
+        ("101", "John", "", 2),
+    ]
+
+
+def test_bulk_add_transactions_placeholder():
+    """
+    GIVEN a book with a chart of accounts, and a mapped transaction from a placeholder account
+    WHEN executed with bulk_add_transactions,
+    THEN it's refused, as by add_transactions, and nothing is added.
+    """
+    book: Book = setup_basic_book()
+    prepared = pd.DataFrame(
+        {
+            "tran_split": [""],
+            "tran_date": [datetime(2017, 1, 3).date()],
+            "tran_description": ["Target"],
+            "tran_memo": [""],
+            "tran_num": [""],
+            "tran_amount": [2495],
+            "tran_acct_from": ["Assets"],
+            "tran_acct_to": ["Equity:Opening Balances"],
+        }
+    )
+
+    with pytest.raises(GncValidationError):
+        bulk_add_transactions(book, mapped_transactions(prepared))
+
+    assert len(book.transactions) == 0
+
+
 def test_add_transaction_shorter_name_only(transaction_using_short_acct_name):
     """
     GIVEN the user imports transaction data with shorter names for accounts
@@ -187,42 +560,55 @@ def test_add_transaction_shorter_name_only(transaction_using_short_acct_name):
     assert book.accounts(name="Checking").get_balance() == Decimal(1000)
 
 
-def test_add_investment_transaction() -> None:
+def test_add_investment_transaction(transaction_add_shares_xyz) -> None:
     """
     GIVEN the user's import includes an investments:add shares of XYZ that are processed
         by the preparer and mappers
-    WHEN executed by add_transactions with a book,
-    THEN the stock sub-account for XYZ is created.
+    WHEN executed by add_commodities, create_accounts, add_prices and add_transactions
+        with a book,
+    THEN the stock sub-account for XYZ is created, holding the added shares.
     """
     book: Book = setup_basic_book()
     usd = book.commodities(mnemonic="USD")
-    # book["base_currency"] = usd
     asset_acct = book.accounts(fullname="Assets")
-    brokerage = Account(
-        name="Brokerage", type="ASSET", parent=asset_acct, commodity=usd, placeholder=False
-    )
-    income = Account(
-        name="Investment Income",
-        type="INCOME",
-        parent=book.root_account,
-        commodity=usd,
-        placeholder=False,
-    )
-
-    xyz = Commodity(
-        namespace="Stocks",
-        mnemonic="XYZ",
-        fullname="XYZ, Inc.",
-        fraction=10000,
-        book=book,
-    )
-    xyz["base_currency"] = usd
-    # xyz.quoted_currency = {"XYZ": usd}
-    # print(xyz.__dict__.keys())
-    # print(xyz.__dict__.values())
-    # xyz.base_currency = usd
-
-    book.save()
-
-    print(factories.create_stock_accounts(xyz, brokerage, income))
-    # add_transactions(book, )
+    Account(name="Brokerage", type="ASSET", parent=asset_acct, commodity=usd, placeholder=False)
+    book.flush()
+    investments = transaction_add_shares_xyz
+
+    add_commodities(book, investments["commodities"])
+    add_commodities(book, investments["commodities"])  # Already there, so unchanged
+    create_accounts(book, investments["accounts"])
+    add_prices(book, investments["prices"])
+    add_transactions(book, investments["transactions"])
+
+    xyz = book.commodities(mnemonic="XYZ")
+    holding = book.accounts(fullname="Assets:Brokerage:XYZ")
+    assert len(book.commodities) == 2
+    assert (xyz.namespace, xyz.fullname, xyz.fraction) == ("Stocks", "XYZ, Inc.", 10000)
+    assert holding.commodity == xyz
+    assert holding.get_balance() == Decimal("200")
+    assert len(book.prices) == 1
+    assert book.prices[0].value == Decimal("1.5")
+
+
+def test_add_prices_existing(transaction_add_shares_xyz):
+    """
+    GIVEN a book with a price of XYZ already in it
+    WHEN executed by add_prices with that price again, and one for another day,
+    THEN only the new day's price is added, the prices in the book read without loading
+        them as Price objects.
+    """
+    book: Book = setup_basic_book()
+    investments = transaction_add_shares_xyz
+    add_commodities(book, investments["commodities"])
+    add_prices(book, investments["prices"])
+    price = investments["prices"][0]
+    next_day = Price2Move(price.commodity, price.currency, date(2017, 1, 2), Decimal("1.6"))
+
+    with patch("piecash.Price.__init__", side_effect=Price.__init__, autospec=True) as created:
+        with patch.object(Book, "prices", new_callable=PropertyMock) as prices:
+            add_prices(book, investments["prices"] + [next_day])
+
+    assert not prices.called
+    assert created.call_count == 1
+    assert sorted(p.value for p in book.prices) == [Decimal("1.5"), Decimal("1.6")]
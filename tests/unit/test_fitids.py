@@ -0,0 +1,120 @@
+"""test_fitids.py"""
+import copy
+from collections import Counter
+
+import pandas as pd
+from piecash import Book, create_book
+from sqlalchemy import event
+
+from move2gnucash.file_operations import add_transactions, create_accounts
+from move2gnucash.fitids import (
+    SURROGATE_FIELDS,
+    imported_fitids,
+    new_transactions,
+    surrogate_fitids,
+)
+
+
+def _book_with_fitid(accounts_list, transactions_list, fitid: str) -> Book:
+    book: Book = create_book(currency="USD")
+    create_accounts(book, accounts_list)
+    transactions_list[0].num = fitid
+    add_transactions(book, transactions_list)
+    return book
+
+
+def test_imported_fitids(new_accounts_list_new_book, transaction_simple):
+    """
+    GIVEN a book with a transaction with a FITID (in its num) and one without
+    WHEN its FITIDs are read,
+    THEN they're read with a single query, without the blank num, and then shared.
+    """
+    book = _book_with_fitid(
+        new_accounts_list_new_book, transaction_simple + copy.deepcopy(transaction_simple), "F1"
+    )
+    statements = []
+    event.listen(book.session.bind, "before_cursor_execute", lambda *args: statements.append(1))
+
+    fitids = imported_fitids(book)
+
+    assert len(statements) == 1
+    assert fitids == {"F1"}
+    assert imported_fitids(book) is fitids
+
+
+def test_new_transactions(new_accounts_list_new_book, transaction_simple):
+    """
+    GIVEN a book with a transaction of FITID F1, and prepared transactions: a split group
+        of F1, a transaction of F2 and two without FITID
+    WHEN new_transactions is executed on them, twice,
+    THEN the rows of F1 are dropped the first time, then all but those without FITID.
+    """
+    book = _book_with_fitid(new_accounts_list_new_book, transaction_simple, "F1")
+    prepared_data = {
+        "non_invest": pd.DataFrame(
+            {"tran_num": ["F1", "F1", "F2", ""], "tran_amount": [1, 2, 3, 4]}
+        ),
+        "invest": pd.DataFrame({"tran_num": [""], "tran_amount": [5]}),
+    }
+
+    first = new_transactions(book, prepared_data)
+    second = new_transactions(book, prepared_data)
+
+    assert first["non_invest"].tran_amount.tolist() == [3, 4]
+    assert first["invest"].tran_amount.tolist() == [5]
+    assert second["non_invest"].tran_amount.tolist() == [4]
+    assert second["invest"].tran_amount.tolist() == [5]
+    assert imported_fitids(book) == {"F1", "F2"}
+
+
+def test_surrogate_fitids():
+    """
+    GIVEN staged rows: one with a FITID, two identical ones without, and a split group
+        without
+    WHEN surrogate_fitids is executed on them, and on the rows again in another order,
+    THEN the FITID is kept, the others get FITIDs of their own, but for the rows of the
+        split group sharing one, and each row gets the same FITID both times.
+    """
+    staged_data = pd.DataFrame(
+        {
+            **{field: ["x"] * 5 for field in SURROGATE_FIELDS},
+            "tran_split": ["", "", "", "S", "S"],
+            "fitid": ["F1", "", "", "", ""],
+        }
+    )
+    staged_data.loc[3:, "tran_amount"] = ["1", "2"]
+
+    res = surrogate_fitids(staged_data)
+    reversed_res = surrogate_fitids(staged_data.iloc[[0, 3, 4, 1, 2]])
+
+    assert res[0] == "F1"
+    assert len(set(res[1:])) == 3 and res[3] == res[4]
+    assert all(fitid.startswith("m2g-") for fitid in res[1:])
+    assert reversed_res.sort_index().equals(res)
+
+
+def test_surrogate_fitids_chunked():
+    """
+    GIVEN staged rows, among them identical ones without a FITID
+    WHEN surrogate_fitids is executed on them a few rows at a time, passing the same
+        occurrences, and at once,
+    THEN identical rows on either side of a chunk boundary get FITIDs of their own, the
+        same as at once.
+    """
+    staged_data = pd.DataFrame(
+        {
+            **{field: ["x"] * 4 for field in SURROGATE_FIELDS},
+            "tran_split": [""] * 4,
+            "fitid": [""] * 4,
+        }
+    )
+    staged_data.loc[1, "tran_amount"] = "1"
+    occurrences = Counter()
+
+    res = pd.concat(
+        [surrogate_fitids(staged_data.iloc[start : start + 3], occurrences) for start in [0, 3]]
+    )
+
+    assert res.equals(surrogate_fitids(staged_data))
+    assert len(set(res)) == 4
+    assert sum(occurrences.values()) == 4
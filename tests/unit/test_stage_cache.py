@@ -0,0 +1,51 @@
+"""test_stage_cache.py"""
+from unittest.mock import Mock
+
+from move2gnucash.stage_cache import StageCache, source_key, stage_key
+
+
+def test_stage_cache_fetched(tmp_path):
+    """
+    GIVEN a stage cache and a stage key,
+    WHEN executed by fetched twice,
+    THEN the stage is only computed the first time and the cached output
+        is returned the second time.
+    """
+    cache = StageCache(tmp_path)
+    compute = Mock(return_value={"rows": [1, 2, 3]})
+
+    first = cache.fetched("prepare", stage_key("abc"), compute)
+    second = cache.fetched("prepare", stage_key("abc"), compute)
+
+    compute.assert_called_once()
+    assert first == second == {"rows": [1, 2, 3]}
+
+
+def test_stage_cache_evicted(tmp_path):
+    """
+    GIVEN a stage cache limited to two entries,
+    WHEN a third stage output is cached,
+    THEN only two entries are kept.
+    """
+    cache = StageCache(tmp_path, max_entries=2)
+
+    for part in ["a", "b", "c"]:
+        cache.fetched("map", stage_key(part), lambda: part)
+
+    assert len(list(tmp_path.glob("*.pickle"))) == 2
+
+
+def test_source_key(tmp_path):
+    """
+    GIVEN a csv file,
+    WHEN its content changes,
+    THEN its source_key changes too.
+    """
+    csv_file = tmp_path / "transactions.csv"
+    csv_file.write_text("Split,Date\n,1/3/2017\n")
+    before = source_key(csv_file)
+
+    csv_file.write_text("Split,Date\n,1/4/2017\n")
+
+    assert source_key(csv_file) != before
+    assert source_key(csv_file) == source_key(csv_file)
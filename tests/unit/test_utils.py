@@ -1,13 +1,20 @@
 """test_utils.py"""
 from decimal import Decimal
+import numpy as np
 import pandas as pd
+import pytest
 
 from move2gnucash.utils import (
+    cents_parsed,
     combined_strings_by,
     custom_join,
+    dates_parsed,
     decimal_to,
+    decimals_from_cents,
+    decimals_of,
     full_string_right_match,
     hierarchy_from,
+    RightMatchIndex,
     string_trimmed_after,
     string_trimmed_before,
 )
@@ -27,6 +34,24 @@ def test_decimal_to():
     assert decimal_to(-10.03, 2) == Decimal("-10.03")
 
 
+def test_decimals_of():
+    """
+    GIVEN an array of float amounts, some repeated, and a number of places
+    WHEN executed with decimals_of
+    THEN each is converted into a Decimal of those places from its shortest decimal form,
+        rounding half up.
+    """
+    res = decimals_of(np.array([0.00015, 200.0, -4.12345, 0.00015]), 4)
+
+    assert res.tolist() == [
+        Decimal("0.0002"),
+        Decimal("200.0000"),
+        Decimal("-4.1235"),
+        Decimal("0.0002"),
+    ]
+    assert decimal_to(0.00015, 4) == Decimal("0.0001")  # From the float's binary value
+
+
 def test_combined_strings_with_separator():
     """
     GIVEN up to two defined string, and a separator
@@ -86,6 +111,64 @@ def test_hierarchy_from():
     assert hierarchy_from("Foo:Bar:Boo") == [("Foo", 2), ("Foo:Bar", 1), ("Foo:Bar:Boo", 0)]
 
 
+def test_dates_parsed():
+    """
+    GIVEN a Series of repeated date strings, without zero padding and with a missing one,
+    WHEN passed to dates_parsed,
+    THEN the dates are parsed in place, the missing one as NaT, and parsing
+        already parsed dates changes nothing.
+    """
+    dates = pd.Series(["1/3/2017", "12/30/2016", None, "1/3/2017"], index=[4, 2, 7, 9])
+
+    res = dates_parsed(dates)
+
+    assert res.index.tolist() == [4, 2, 7, 9]
+    assert res[4] == res[9] == pd.Timestamp(2017, 1, 3)
+    assert res[2] == pd.Timestamp(2016, 12, 30)
+    assert res.isna().tolist() == [False, False, True, False]
+    pd.testing.assert_series_equal(dates_parsed(res), res)
+
+
+def test_cents_parsed():
+    """
+    GIVEN a Series of amounts of money as Quicken writes them, with a currency sign,
+        thousands separators, negatives in parentheses or signed, and a blank one,
+    WHEN passed to cents_parsed,
+    THEN each is parsed exactly into integer cents, the blank one as missing, and parsing
+        amounts already in cents changes nothing.
+    """
+    amounts = pd.Series(["($1,234.50)", "-$5", "24.95", None, "1,000,000.01", "+0.1"])
+
+    res = cents_parsed(amounts)
+
+    assert res.dtype == "Int64"
+    assert res.tolist() == [-123450, -500, 2495, pd.NA, 100000001, 10]
+    pd.testing.assert_series_equal(cents_parsed(res), res)
+    assert cents_parsed(pd.Series([24.95, -0.1])).tolist() == [2495, -10]
+
+
+def test_cents_parsed_not_money():
+    """
+    GIVEN a Series of amounts with one that isn't an amount of money
+    WHEN passed to cents_parsed,
+    THEN a ValueError names it.
+    """
+    with pytest.raises(ValueError, match="12 dollars"):
+        cents_parsed(pd.Series(["1.00", "12 dollars"]))
+
+
+def test_decimals_from_cents():
+    """
+    GIVEN an array of integer cents
+    WHEN passed to decimals_from_cents,
+    THEN they're provided as Decimals with two places.
+    """
+    res = decimals_from_cents(pd.Series([-123450, 5, 0, 5]).to_numpy())
+
+    assert list(res) == [Decimal("-1234.50"), Decimal("0.05"), Decimal("0.00"), Decimal("0.05")]
+    assert [str(value) for value in res] == ["-1234.50", "0.05", "0.00", "0.05"]
+
+
 def test_full_string_right_match():
     """
     GIVEN a substring and a list of strings,
@@ -106,6 +189,34 @@ def test_full_string_right_match():
     assert len(full_string_right_match(test_list, "Other")) == 2
 
 
+def test_right_match_index():
+    """
+    GIVEN a list of account names indexed once,
+    WHEN several substrings are looked up,
+    THEN each returns the same matches a linear scan of the list would, in list order.
+    """
+    test_list = [
+        "Income:Other",
+        "Expenses:Food:Dining",
+        "Expenses:Other",
+        "Expenses:Dining:Other",
+        "Assets:Other",
+    ]
+    index = RightMatchIndex(test_list)
+
+    assert index.matches("Food:Dining") == ["Expenses:Food:Dining"]
+    assert index.matches("ood:Dining") == ["Expenses:Food:Dining"]
+    assert index.matches("Dining:Other") == ["Expenses:Dining:Other"]
+    assert index.matches("Other") == [
+        "Income:Other",
+        "Expenses:Other",
+        "Expenses:Dining:Other",
+        "Assets:Other",
+    ]
+    assert index.matches("Food") == []
+    assert index.matches("Missing:Other") == []
+
+
 # def my_finder(sub):
 
 